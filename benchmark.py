@@ -0,0 +1,233 @@
+"""Offline benchmark of the tool, run against a synthetic account instead of AWS."""
+
+import argparse, os, sys, resource, tempfile, datetime
+from json import dumps
+from time import monotonic
+
+'''
+The results of the benchmarked run are written in a temporary folder, unless one is given.
+The folder and the credentials have to be set before the tool is imported, as its clients are created on import.
+'''
+if "INVICTUS_AWS_RESULTS" not in os.environ:
+    os.environ["INVICTUS_AWS_RESULTS"] = tempfile.mkdtemp(prefix="invictus-aws-benchmark-") + "/"
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from source.main.ir import IR
+from source.utils.utils import add_client_hook, set_workers, set_engine, set_store, set_local_athena, ROOT_FOLDER
+from source.utils.synthetic import SyntheticAccount
+from source.utils.instrument import build_report, set_memory, CALLS, LOCK
+from source.utils.engine import engine_available, close_engine
+
+STEPS = {"1": "enumeration", "2": "configuration", "3": "logs", "4": "analysis"}
+
+# Bucket of the synthetic trail read by the analysis
+TRAIL_BUCKET = "synthetic-trail"
+
+def set_args():
+    """Define the arguments used when calling the benchmark."""
+    parser = argparse.ArgumentParser(description="Offline benchmark of invictus-aws, run against a synthetic account.")
+
+    parser.add_argument("--buckets", type=int, default=100, help="[+] Number of S3 buckets of the synthetic account. Default : 100")
+    parser.add_argument("--functions", type=int, default=100, help="[+] Number of Lambda functions of the synthetic account. Default : 100")
+    parser.add_argument("--snapshots", type=int, default=100, help="[+] Number of EC2 snapshots of the synthetic account. Default : 100")
+    parser.add_argument("--events", type=int, default=1000, help="[+] Number of CloudTrail events of the synthetic account. Default : 1000")
+    parser.add_argument("--users", type=int, default=100, help="[+] Number of IAM users of the synthetic account. Default : 100")
+    parser.add_argument("--latency", type=float, default=0, help="[+] Latency added to each call, in milliseconds. Default : 0")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="[+] Probability of a call to be throttled, between 0 and 1. Default : 0")
+    parser.add_argument("--page-size", type=int, default=50, help="[+] Number of elements of each page of the paginated operations. Default : 50")
+    parser.add_argument("--seed", type=int, default=0, help="[+] Seed of the injected throttling. Default : 0")
+    parser.add_argument("--steps", type=str, default="1,2,3", help="[+] Comma separated list of the steps benchmarked (1 for enumeration, 2 for configuration, 3 for logs, 4 for the analysis of the synthetic trail on the local Athena, alone). Default : 1,2,3")
+    parser.add_argument("--region", type=str, default="us-east-1", help="[+] Region of the synthetic account. Default : us-east-1")
+    parser.add_argument("--workers", type=int, default=16, help="[+] Number of calls run at the same time. Default : 16")
+    parser.add_argument("--engine", type=str, default="thread", choices=["thread", "async"], help="[+] Engine making the concurrent calls, as with the tool. Default : thread")
+    parser.add_argument("--schedule", type=str, default="steps", choices=["steps", "graph"], help="[+] Order of the services of the steps, as with the tool. Default : steps")
+    parser.add_argument("--start", type=str, default="2023-05-31", help="[+] Start date of the logs collected by step 3. Default : 2023-05-31, the day before the most recent synthetic events")
+    parser.add_argument("--end", type=str, default="2023-06-01", help="[+] End date of the logs collected by step 3. Default : 2023-06-01")
+    parser.add_argument("--queryfile", type=str, default="source/files/queries.yaml", help="[+] Queries run by step 4. Default : source/files/queries.yaml")
+    parser.add_argument("--athena-dir", type=str, default=None, metavar="DIR", help="[+] Folder of the local Athena of step 4, where the synthetic trail is written. A temporary folder if not given")
+    parser.add_argument("--query-latency", type=float, default=0, help="[+] Minimum duration of each query of step 4 on the local Athena, in milliseconds. Default : 0")
+    parser.add_argument("--memory-profile", action="store_true", help="[+] Trace the memory allocated by each service with tracemalloc")
+    parser.add_argument("--replay", type=str, default=None, metavar="DIR", help="[+] Replay the responses recorded by the tool with --record in this folder instead of using a synthetic account")
+    parser.add_argument("--output", type=str, default=None, help="[+] File where the JSON results are written. Printed if not given")
+
+    return parser.parse_args()
+
+def verify_args(args):
+    """Verify the arguments of the benchmark.
+
+    Parameters
+    ----------
+    args : Namespace
+        Arguments of the benchmark
+    """
+    for name in ["buckets", "functions", "snapshots", "events", "users", "latency", "seed", "query_latency"]:
+        if getattr(args, name) < 0:
+            print(f"benchmark.py: error: --{name.replace('_', '-')} can not be negative.")
+            sys.exit(-1)
+
+    if not 0 <= args.throttle_rate < 1:
+        print("benchmark.py: error: --throttle-rate has to be between 0 and 1, 1 excluded.")
+        sys.exit(-1)
+
+    if args.page_size < 1 or args.workers < 1:
+        print("benchmark.py: error: --page-size and --workers have to be at least 1.")
+        sys.exit(-1)
+
+    if args.engine == "async" and not engine_available():
+        print("benchmark.py: error: --engine async needs aiobotocore.")
+        sys.exit(-1)
+
+    if args.replay != None and not os.path.isfile(os.path.join(args.replay, "index.jsonl")):
+        print(f"benchmark.py: error: No recorded responses were found in {args.replay}.")
+        sys.exit(-1)
+
+    for step in args.steps.split(","):
+        if step not in STEPS:
+            print(f"benchmark.py: error: Step {step} can not be benchmarked (1, 2, 3 or 4).")
+            sys.exit(-1)
+
+    if "4" in args.steps.split(",") and (args.steps != "4" or args.replay != None):
+        print("benchmark.py: error: Step 4 can only be benchmarked alone, without --replay.")
+        sys.exit(-1)
+
+    if args.steps == "4" and not os.path.isfile(args.queryfile):
+        print(f"benchmark.py: error: The query file {args.queryfile} doesn't exist.")
+        sys.exit(-1)
+
+def count_calls():
+    """Return the number of calls made since the start of the benchmark.
+
+    Returns
+    -------
+    calls : int
+        Number of calls
+    """
+    with LOCK:
+        return sum(entry["calls"] for entry in CALLS.values())
+
+def peak_rss():
+    """Return the peak resident memory of the process since its start, in kilobytes.
+
+    Returns
+    -------
+    rss : int
+        Peak resident memory
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    if sys.platform == "darwin":
+        rss //= 1024
+    return rss
+
+def run_benchmark(args):
+    """Run the steps against the synthetic account and return the measures.
+
+    Parameters
+    ----------
+    args : Namespace
+        Arguments of the benchmark
+
+    Returns
+    -------
+    results : dict
+        Scale of the account and measures of each step, service and operation
+    """
+    account = SyntheticAccount(args.buckets, args.functions, args.snapshots, args.events, args.users, args.latency / 1000, args.throttle_rate, args.page_size, args.seed)
+    steps = args.steps.split(",")
+    athena = None
+
+    '''
+    The hooks answering the calls run in the order they were added.
+    The local Athena is added before the synthetic account and the replay, so it answers the calls to Athena and S3 of the analysis.
+    '''
+    if steps == ["4"]:
+        athena = set_local_athena(args.athena_dir or tempfile.mkdtemp(prefix="invictus-aws-athena-"), latency=args.query_latency / 1000)
+
+    if args.replay:
+        set_store(replay=args.replay)
+        scale = {"replay": args.replay}
+    else:
+        add_client_hook(account.register)
+        scale = account.scale()
+    set_workers(args.workers)
+    set_engine(args.engine)
+    set_memory(profile=args.memory_profile)
+
+    if athena:
+        # the synthetic trail is written in a bucket of the local Athena, the analysis creates its table on it
+        scale["trail_files"] = account.write_trail(athena.storage.bucket_folder(TRAIL_BUCKET, True), args.region)
+        ir = IR(args.region, True, steps, source=f"s3://{TRAIL_BUCKET}/AWSLogs/")
+    else:
+        ir = IR(args.region, True, steps)
+
+    measures = []
+    start_rss = peak_rss()
+
+    # with the graph schedule the steps overlap, they are measured together
+    runs = [steps] if args.schedule == "graph" else [[step] for step in steps]
+
+    for run in runs:
+        calls = count_calls()
+        begin = monotonic()
+
+        if len(run) > 1:
+            ir.execute_graph(args.region, args.start, args.end)
+        elif run[0] == "1":
+            ir.execute_enumeration(args.region)
+        elif run[0] == "2":
+            ir.execute_configuration(args.region)
+        elif run[0] == "3":
+            ir.execute_logs(args.region, args.start, args.end)
+        else:
+            ir.execute_analysis(args.queryfile, (False, False), None)
+
+        measures.append({
+            "step": "+".join(STEPS[step] for step in run),
+            "time": monotonic() - begin,
+            "calls": count_calls() - calls,
+            "peak_rss_kb": peak_rss(),
+        })
+
+    close_engine()
+    report = build_report()
+
+    results = {
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "scale": scale,
+        "workers": args.workers,
+        "engine": args.engine,
+        "schedule": args.schedule,
+        "results_folder": ROOT_FOLDER,
+        "start_rss_kb": start_rss,
+        "steps": measures,
+        "services": report["services"],
+        "totals": report["totals"],
+        "operations": report["operations"],
+    }
+
+    if athena:
+        athena.close()
+        results["athena"] = athena.statistics()
+
+    return results
+
+def main():
+    """Run the benchmark and write its results."""
+    args = set_args()
+    verify_args(args)
+
+    results = run_benchmark(args)
+    output = dumps(results, indent=4)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+        print(f"\n[+] Benchmark results written in {args.output}")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
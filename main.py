@@ -7,6 +7,12 @@ from re import match
 
 from source.main.ir import IR
 from source.utils.utils import *
+from source.utils.throttle import display_stats
+from source.utils.instrument import write_report, set_report_top, set_memory, build_report
+from source.utils.metrics import set_metrics, close_metrics
+from source.utils.engine import engine_available, close_engine
+from source.utils.enum import region_census
+from source.utils.organization import run_organization
 
 def set_args():
     """Define the arguments used when calling the tool."""
@@ -60,13 +66,13 @@ def set_args():
     parser.add_argument(
         "-start",
         "--start-time",
-        help="[+] Start time of the Cloudtrail logs to be collected. Must only be used with step 3. Format is YYYY-MM-DD."
+        help="[+] Start time of the Cloudtrail logs and RDS log files to be collected. Must only be used with step 3. Format is YYYY-MM-DD."
     )
 
     parser.add_argument(
         "-end",
         "--end-time",
-        help="[+] End time of the Cloudtrail logs to be collected. Mudt only be used with step 3. Format is YYYY-MM-DD."
+        help="[+] End time of the Cloudtrail logs and RDS log files to be collected. Mudt only be used with step 3. Format is YYYY-MM-DD."
     )
 
     parser.add_argument(
@@ -121,9 +127,170 @@ def set_args():
         help="[+] Used by the queries to filter their results. The timeframe sequence will automatically be added at the end of your queries if you specify a timeframe. You don't have to add it yourself to your queries."
     )
 
+    parser.add_argument(
+        "--ec2-tag",
+        action="append",
+        metavar="KEY=VALUE",
+        help="[+] Only collect the configuration of the EC2 volumes, snapshots, subnets, security groups and route tables with this tag. Can be used multiple times. Must only be used with step 2."
+    )
+
+    parser.add_argument(
+        "--ec2-since",
+        type=str,
+        help="[+] Only collect the configuration of the EC2 volumes and snapshots created after this date. Must only be used with step 2. Format is YYYY-MM-DD."
+    )
+
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="[+] Only transfer the logs objects that are new or changed since the last run (compared by key, size and ETag with the manifest of the previous runs, with -w cloud the logs bucket of the run only receives these objects) and only collect the Cloudtrail events more recent than the last collected one, written in the logs bucket of the run with -w cloud. -start and -end can then be omitted to collect the events from the last collected one up to now, -start being needed by the first collection of the account and region. Must only be used with step 3."
+    )
+
+    parser.add_argument(
+        "--since",
+        type=str,
+        help="[+] Only transfer the logs objects modified after this date and only collect the GuardDuty and Macie findings updated after it. Must only be used with step 3. Format is YYYY-MM-DD."
+    )
+
+    parser.add_argument(
+        "--min-severity",
+        type=str,
+        choices=["low", "medium", "high"],
+        help="[+] Only collect the GuardDuty and Macie findings with at least this severity. Must only be used with step 3."
+    )
+
+    parser.add_argument(
+        "--resume",
+        type=str,
+        metavar="RUN_ID",
+        help="[+] Resume an interrupted run. Completed services are skipped and unfinished logs transfers are continued. Use the same arguments as the interrupted run. The id of a run is printed when it begins."
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=16,
+        help="[+] Number of concurrent calls made when the details of every resource of a service are collected (bucket policies, function configurations, table descriptions, ...). Default is 16."
+    )
+
+    parser.add_argument(
+        "--engine",
+        type=str,
+        default="thread",
+        choices=["thread", "async"],
+        help="[+] Engine making the concurrent calls and the paginations of the collectors. 'thread' uses a pool of --workers threads. 'async' runs them as coroutines on aiobotocore (pip install aiobotocore), up to --workers calls in flight across services and regions, so --workers can be much higher. Default is thread."
+    )
+
+    parser.add_argument(
+        "--schedule",
+        type=str,
+        default="steps",
+        choices=["steps", "graph"],
+        help="[+] Order of the services of steps 1, 2 and 3. 'steps' runs each step after the previous one. 'graph' starts the configuration and the logs of a service as soon as its enumeration is done, without waiting for the other services, so the steps overlap. The results are the same. Default is steps."
+    )
+
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        metavar="SECONDS",
+        help="[+] Keep the results of the global lookups (buckets, IAM users, hosted zones, trails, dashboards) on the disk and reuse them in the next runs for this number of seconds. They are only cached for the current run otherwise."
+    )
+
+    parser.add_argument(
+        "--org",
+        type=str,
+        metavar="ROLE_NAME",
+        help="[+] Acquire every active account of the AWS Organization, from its management account. The role ROLE_NAME (for example OrganizationAccountAccessRole) is assumed in each member account and the results of each account are written in results/ACCOUNT_ID/. Every other argument is applied to each account. Can't be used with --resume."
+    )
+
+    parser.add_argument(
+        "--max-accounts",
+        type=int,
+        default=4,
+        help="[+] With --org, maximum number of accounts acquired at the same time, each one by its own process. Default is 4."
+    )
+
+    parser.add_argument(
+        "--skip-empty-regions",
+        action="store_true",
+        help="[+] With -A, count the resources of every region first (tagging api and a few cheap list calls, all regions at once), run the regions with the most resources first and skip the empty ones. The first region is always run, for the global services. Must not be used with step 4."
+    )
+
+    parser.add_argument(
+        "--enumeration-max-age",
+        type=int,
+        default=60,
+        metavar="MINUTES",
+        help="[+] When step 1 is not run, reuse the enumeration saved by a previous run of step 1 if it is younger than this number of minutes. 0 always enumerates the services again. Default is 60."
+    )
+
+    parser.add_argument(
+        "--report-top",
+        type=int,
+        default=10,
+        metavar="N",
+        help="[+] Number of operations listed in the text report of the run (results/reports/RUN_ID.txt), the slowest first. Default is 10."
+    )
+
+    parser.add_argument(
+        "--record",
+        type=str,
+        metavar="DIR",
+        help="[+] Record every response of AWS in this folder, compressed and addressed by their content, so the run can be replayed with --replay."
+    )
+
+    parser.add_argument(
+        "--replay",
+        type=str,
+        metavar="DIR",
+        help="[+] Answer every AWS call with the responses recorded in this folder by --record, without any network access. Use the same arguments as the recorded run."
+    )
+
+    parser.add_argument(
+        "--local-athena",
+        type=str,
+        metavar="DIR",
+        help="[+] Answer the Athena and S3 calls of step 4 with a local stand-in, without any network access : the buckets are the folders of DIR/s3 (DIR/s3/BUCKET/KEY) and the queries run on sqlite. Used to test and benchmark the analysis offline."
+    )
+
+    parser.add_argument(
+        "--max-memory",
+        type=int,
+        metavar="MB",
+        help="[+] Memory budget of the run, in megabytes. When the resident memory exceeds it, the configurations and logs collected so far are written and released after each service instead of being kept until the end of the step."
+    )
+
+    parser.add_argument(
+        "--memory-profile",
+        action="store_true",
+        help="[+] Trace the memory allocated by each service with tracemalloc and add it to the report of the run, with the lines allocating the most. Slows the run down."
+    )
+
+    parser.add_argument(
+        "--events",
+        type=str,
+        metavar="FILE",
+        help="[+] Append the events of the run to this file, one JSON object per line : start and end of each step and service, number of elements found, S3 objects and bytes transferred, AWS errors."
+    )
+
+    parser.add_argument(
+        "--metrics-dir",
+        type=str,
+        metavar="DIR",
+        help="[+] Write the metrics of the run (steps, services, AWS calls, errors, throttles, objects and bytes transferred, memory) in DIR/invictus_aws_RUN_ID.prom, in the text format read by the textfile collector of node_exporter."
+    )
+
+    parser.add_argument(
+        "--metrics-interval",
+        type=int,
+        default=15,
+        metavar="SECONDS",
+        help="[+] Number of seconds between two writes of the metrics file of --metrics-dir. Default is 15."
+    )
+
     return parser.parse_args()
 
-def run_steps(dl, region, regionless, steps, start, end, source, output, catalog, database, table, queryfile, exists, timeframe):
+def run_steps(dl, region, regionless, steps, start, end, source, output, catalog, database, table, queryfile, exists, timeframe, schedule="steps"):
     """Run the steps of the tool (enum, config, logs extraction, logs analysis).
 
     Parameters
@@ -156,6 +323,8 @@ def run_steps(dl, region, regionless, steps, start, end, source, output, catalog
         If the input db and table already exists
     timeframe : str
         Time filter for default queries
+    schedule : str, optional
+        "steps" to run the steps one after the other, "graph" to run the services of steps 1, 2 and 3 as a graph
     """
     if dl:
         create_folder(ROOT_FOLDER + "/" + region)
@@ -172,6 +341,11 @@ def run_steps(dl, region, regionless, steps, start, end, source, output, catalog
             ir.execute_analysis(queryfile, exists, timeframe)
         except Exception as e:     
             print(str(e))
+    elif schedule == "graph":
+        try:
+            ir.execute_graph(regionless, start, end)
+        except Exception as e:
+            print(str(e))
     else:
         if "1" in steps:
             try:
@@ -225,6 +399,36 @@ def verify_all_regions(input_region):
         )
         sys.exit(-1)
 
+def prefilter_regions(region_names, regionless):
+    """Rank the regions by number of resources and remove the empty ones. The first region is kept first, as it handles the global services.
+
+    Parameters
+    ----------
+    region_names : list of str
+        Enabled regions, beginning by the first region
+    regionless : str
+        First region to run the tool on
+
+    Returns
+    -------
+    region_names : list of str
+        Regions to run the tool on
+    """
+    print("[+] Counting the resources of every region")
+
+    census = region_census(region_names)
+    counts = {name: count if isinstance(count, int) else -1 for name, count in census.items()}
+
+    empty = [name for name in region_names if counts[name] == 0 and name != regionless]
+    ranked = sorted((name for name in region_names if name != regionless and name not in empty), key=lambda name: counts[name], reverse=True)
+
+    for name in [regionless] + ranked:
+        print(f"\t\u2022 {name} : {counts[name] if counts[name] >= 0 else 'unknown'} resources found")
+    if empty:
+        print(f"[+] Skipping {len(empty)} empty regions : {', '.join(empty)}")
+
+    return [regionless] + ranked
+
 def verify_one_region(region):
     """Verify the region inputs and run the steps of the tool for one region.
     
@@ -320,7 +524,7 @@ def verify_steps(steps, source, output, catalog, database, table, region, dl):
 
     if "4" in steps:
 
-        athena = boto3.client("athena", region_name=region)
+        athena = create_client("athena", region)
 
         if catalog is None and database is None and table is None:
             
@@ -454,7 +658,7 @@ def verify_bucket(bucket, type):
     
     return bucket
 
-def verify_dates(start, end, steps):
+def verify_dates(start, end, steps, incremental):
     """Verify if the date inputs are correct.
     
     Parameters
@@ -465,6 +669,8 @@ def verify_dates(start, end, steps):
         End time
     steps : list of str
         Steps to run
+    incremental : bool
+        If the logs are collected incrementally. The dates can then be omitted, the events being collected from the high-water mark up to now
     """
     if "3" not in steps and (start != None or end != None):
         print("invictus-aws.py: error: Only input dates with step 3.")
@@ -500,6 +706,31 @@ def verify_dates(start, end, steps):
                 print("invictus-aws.py: error: Start date can not be equal to or more recent than End date.")
                 sys.exit(-1)
 
+        elif start != None and end == None and incremental:
+
+            try:
+                start_date = datetime.datetime.strptime(start, "%Y-%m-%d")
+            except ValueError:
+                print("invictus-aws.py: error: Start date in not in a valid format.")
+                sys.exit(-1)
+
+            if start_date > datetime.datetime.now():
+                print("invictus-aws.py: error: Start date can not be in the future.")
+                sys.exit(-1)
+
+        elif start == None and incremental:
+
+            if end != None:
+                try:
+                    end_date = datetime.datetime.strptime(end, "%Y-%m-%d")
+                except ValueError:
+                    print("invictus-aws.py: error: End date in not in a valid format.")
+                    sys.exit(-1)
+
+                if end_date > datetime.datetime.now():
+                    print("invictus-aws.py: error: End date can not be in the future.")
+                    sys.exit(-1)
+
         elif start == None and end != None:
             print("invictus-aws.py: error: Start date in not defined.")
             sys.exit(-1)
@@ -551,6 +782,254 @@ def verify_timeframe(timeframe, steps):
             print("invictus-aws.py: error: Only input valid number > 0")
             sys.exit(-1)
 
+def verify_ec2_filters(tags, since, steps):
+    """Verify the inputs of the EC2 filters.
+
+    Parameters
+    ----------
+    tags : list of str
+        Tags of the EC2 resources, as KEY=VALUE
+    since : str
+        Creation date of the EC2 resources
+    steps : list of str
+        Steps to run
+    """
+    if (tags or since != None) and "2" not in steps:
+        print("invictus-aws.py: error: Only use --ec2-tag and --ec2-since with step 2.")
+        sys.exit(-1)
+
+    for tag in tags or []:
+        if "=" not in tag or tag.startswith("="):
+            print(f"invictus-aws.py: error: The tag {tag} is not in a valid format. Format is KEY=VALUE.")
+            sys.exit(-1)
+
+    if since != None:
+        try:
+            datetime.datetime.strptime(since, "%Y-%m-%d")
+        except ValueError:
+            print("invictus-aws.py: error: EC2 since date in not in a valid format.")
+            sys.exit(-1)
+
+def verify_incremental(incremental, since, steps):
+    """Verify the inputs of the incremental logs collection.
+
+    Parameters
+    ----------
+    incremental : bool
+        If only the new or changed logs objects are transferred
+    since : str
+        Cut-off date of the logs objects transferred
+    steps : list of str
+        Steps to run
+    """
+    if (incremental or since != None) and "3" not in steps:
+        print("invictus-aws.py: error: Only use --incremental and --since with step 3.")
+        sys.exit(-1)
+
+    if since != None:
+        try:
+            since_date = datetime.datetime.strptime(since, "%Y-%m-%d")
+        except ValueError:
+            print("invictus-aws.py: error: Since date in not in a valid format.")
+            sys.exit(-1)
+
+        if since_date > datetime.datetime.now():
+            print("invictus-aws.py: error: Since date can not be in the future.")
+            sys.exit(-1)
+
+def verify_min_severity(severity, steps):
+    """Verify the input severity of the findings.
+
+    Parameters
+    ----------
+    severity : str
+        Lowest severity of the findings
+    steps : list of str
+        Steps to run
+    """
+    if severity != None and "3" not in steps:
+        print("invictus-aws.py: error: Only use --min-severity with step 3.")
+        sys.exit(-1)
+
+def verify_resume(run_id, steps):
+    """Verify that the run to resume exists.
+
+    Parameters
+    ----------
+    run_id : str
+        Id of the run to resume
+    steps : list of str
+        Steps to run
+    """
+    if run_id != None:
+
+        if "4" in steps:
+            print("invictus-aws.py: error: Step 4 can not be resumed.")
+            sys.exit(-1)
+
+        if not path.isfile(f"{RUNS_FOLDER}{run_id}/journal.jsonl"):
+            print(f"invictus-aws.py: error: No journal was found for the run {run_id}.")
+            sys.exit(-1)
+
+def verify_workers(workers):
+    """Verify the number of workers of the shared pool.
+
+    Parameters
+    ----------
+    workers : int
+        Number of threads of the pool
+    """
+    if workers <= 0:
+        print("invictus-aws.py: error: Only input valid number of workers > 0")
+        sys.exit(-1)
+
+def verify_engine(engine):
+    """Verify that the engine can be used.
+
+    Parameters
+    ----------
+    engine : str
+        Engine of the run (thread or async)
+    """
+    if engine == "async" and not engine_available():
+        print("invictus-aws.py: error: --engine async needs aiobotocore. Install it with `pip install aiobotocore`.")
+        sys.exit(-1)
+
+def verify_cache_ttl(ttl):
+    """Verify the ttl of the cache of the global lookups.
+
+    Parameters
+    ----------
+    ttl : int
+        Number of seconds the results are kept on the disk
+    """
+    if ttl != None and ttl <= 0:
+        print("invictus-aws.py: error: Only input valid cache ttl > 0")
+        sys.exit(-1)
+
+def verify_enumeration_max_age(max_age):
+    """Verify the maximum age of the enumeration snapshots.
+
+    Parameters
+    ----------
+    max_age : int
+        Maximum age in minutes
+    """
+    if max_age < 0:
+        print("invictus-aws.py: error: Only input valid enumeration max age >= 0")
+        sys.exit(-1)
+
+def verify_org(role, max_accounts, run_id):
+    """Verify the inputs of the organization mode.
+
+    Parameters
+    ----------
+    role : str
+        Name of the role assumed in each member account
+    max_accounts : int
+        Maximum number of accounts acquired at the same time
+    run_id : str
+        Id of the run to resume
+    """
+    if role != None and run_id != None:
+        print("invictus-aws.py: error: --org can't be used with --resume.")
+        sys.exit(-1)
+
+    if max_accounts <= 0:
+        print("invictus-aws.py: error: Only input valid number of accounts > 0")
+        sys.exit(-1)
+
+def verify_max_memory(max_memory):
+    """Verify the memory budget of the run.
+
+    Parameters
+    ----------
+    max_memory : int
+        Budget of resident memory, in megabytes
+    """
+    if max_memory != None and max_memory <= 0:
+        print("invictus-aws.py: error: Only input valid memory budget > 0")
+        sys.exit(-1)
+
+def verify_metrics(events, metrics_dir, interval):
+    """Verify the outputs of the events and metrics of the run.
+
+    Parameters
+    ----------
+    events : str
+        File where the events are appended
+    metrics_dir : str
+        Folder where the metrics file is written
+    interval : int
+        Seconds between two writes of the metrics file
+    """
+    if interval <= 0:
+        print("invictus-aws.py: error: Only input valid metrics interval > 0")
+        sys.exit(-1)
+
+    if events != None and path.isdir(events):
+        print(f"invictus-aws.py: error: {events} is a folder, --events has to be a file.")
+        sys.exit(-1)
+
+    if metrics_dir != None and path.exists(metrics_dir) and not path.isdir(metrics_dir):
+        print(f"invictus-aws.py: error: {metrics_dir} is not a folder, --metrics-dir has to be a folder.")
+        sys.exit(-1)
+
+def verify_record_replay(record, replay, role):
+    """Verify the folders of the record and replay modes.
+
+    Parameters
+    ----------
+    record : str
+        Folder where the responses are recorded
+    replay : str
+        Folder of the responses replayed
+    role : str
+        Name of the role assumed in each member account of the organization
+    """
+    if record != None and replay != None:
+        print("invictus-aws.py: error: --record and --replay can't be used together.")
+        sys.exit(-1)
+
+    if (record != None or replay != None) and role != None:
+        print("invictus-aws.py: error: --record and --replay can't be used with --org.")
+        sys.exit(-1)
+
+    if replay != None and not path.isfile(path.join(replay, "index.jsonl")):
+        print(f"invictus-aws.py: error: No recorded responses were found in {replay}.")
+        sys.exit(-1)
+
+def verify_local_athena(folder, steps, record, replay, role):
+    """Verify the folder of the local Athena stand-in.
+
+    Parameters
+    ----------
+    folder : str
+        Folder of the stand-in
+    steps : list of str
+        Steps to run (1 for enum, 2 for config, 3 for logs extraction, 4 for analysis)
+    record : str
+        Folder where the responses are recorded
+    replay : str
+        Folder of the responses replayed
+    role : str
+        Name of the role assumed in each member account of the organization
+    """
+    if folder == None:
+        return
+
+    if "4" not in steps:
+        print("invictus-aws.py: error: Only use --local-athena with step 4.")
+        sys.exit(-1)
+
+    if record != None or replay != None or role != None:
+        print("invictus-aws.py: error: --local-athena can't be used with --record, --replay or --org.")
+        sys.exit(-1)
+
+    if path.exists(folder) and not path.isdir(folder):
+        print(f"invictus-aws.py: error: {folder} is not a folder, --local-athena has to be a folder.")
+        sys.exit(-1)
+
 def main():
     """Get the arguments and run the appropriate functions."""
     print(
@@ -580,6 +1059,7 @@ def main():
 
     start = args.start_time
     end = args.end_time
+    verify_dates(start, end, steps, args.incremental)
 
     catalog = args.catalog
     database = args.database
@@ -591,20 +1071,88 @@ def main():
     timeframe = args.timeframe
     verify_timeframe(timeframe, steps)
 
+    verify_ec2_filters(args.ec2_tag, args.ec2_since, steps)
+    set_ec2_filters(args.ec2_tag, args.ec2_since)
+
+    verify_incremental(args.incremental, args.since, steps)
+    set_incremental(args.incremental, args.since)
+
+    verify_min_severity(args.min_severity, steps)
+    set_min_severity(args.min_severity)
+
+    verify_resume(args.resume, steps)
+
+    verify_workers(args.workers)
+    set_workers(args.workers)
+
+    verify_engine(args.engine)
+    set_engine(args.engine)
+
+    verify_cache_ttl(args.cache_ttl)
+    set_cache(args.cache_ttl)
+
+    if args.skip_empty_regions and ("4" in steps or args.aws_region):
+        print("invictus-aws.py: error: Only use --skip-empty-regions with -A and steps 1, 2 or 3.")
+        sys.exit(-1)
+
+    if args.report_top <= 0:
+        print("invictus-aws.py: error: Only input valid report top > 0")
+        sys.exit(-1)
+    set_report_top(args.report_top)
+
+    verify_max_memory(args.max_memory)
+    set_memory(args.max_memory, args.memory_profile)
+
+    verify_metrics(args.events, args.metrics_dir, args.metrics_interval)
+
+    verify_enumeration_max_age(args.enumeration_max_age)
+    set_snapshot_max_age(args.enumeration_max_age)
+
+    verify_record_replay(args.record, args.replay, args.org)
+    set_store(args.record, args.replay)
+
+    verify_local_athena(args.local_athena, steps, args.record, args.replay, args.org)
+    set_local_athena(args.local_athena)
+
+    verify_org(args.org, args.max_accounts, args.resume)
+    if args.org:
+        run_organization(args.org, args.max_accounts, sys.argv[1:])
+        return
+
+    run_id = RUN_ID
+    if "4" not in steps:
+        run_id = set_journal(args.resume)
+        print(f"[+] Run id : {run_id}. Use `--resume {run_id}` if the run is interrupted.")
+
+    set_metrics(run_id, args.events, args.metrics_dir, args.metrics_interval)
+
     if region:
 
         if verify_one_region(region):
             steps, source, output, database, table, exists = verify_steps(steps, source, output, catalog, database, table, region, dl)  
-            run_steps(dl, region, all_regions, steps, start, end, source, output, catalog, database, table, queryfile, exists, timeframe)
+            run_steps(dl, region, all_regions, steps, start, end, source, output, catalog, database, table, queryfile, exists, timeframe, args.schedule)
 
     
     else:
         
         region_names, regionless = verify_all_regions(all_regions)
 
+        if args.skip_empty_regions:
+            region_names = prefilter_regions(region_names, regionless)
+
         for name in region_names:
             steps, source, output, database, table, exists = verify_steps(steps, source, output, catalog, database, table, name, dl)  
-            run_steps(dl, name, regionless, steps, start, end, source, output, catalog, database, table, queryfile, exists, timeframe)
+            run_steps(dl, name, regionless, steps, start, end, source, output, catalog, database, table, queryfile, exists, timeframe, args.schedule)
+
+    close_engine()
+    display_stats()
+
+    totals = build_report()["totals"]
+    close_metrics(calls=totals["calls"], errors=totals["errors"], throttles=totals["throttles"])
+
+    report = write_report(REPORTS_FOLDER, run_id)
+    if report:
+        print(f"[+] Timing report of the run written in {report}.json and {report}.txt")
 
 if __name__ == "__main__":
 
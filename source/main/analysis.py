@@ -4,9 +4,19 @@ import yaml, datetime
 from source.utils.utils import athena_query, S3_CLIENT, rename_file_s3, get_table, set_clients, date, get_bucket_and_prefix, ENDC, OKGREEN, ROOT_FOLDER, create_folder, create_tmp_bucket, get_random_chars
 import source.utils.utils
 from source.utils.enum import paginate
+from source.utils.compiler import compile_queries, merged_query, split_results
 import pandas as pd
+import xlsxwriter
 from os import remove, replace
 from time import sleep
+from botocore.exceptions import ClientError
+
+# Maximum number of rows of a sheet of the merged results, the header included
+EXCEL_MAX_ROWS = 1048576
+# Number of rows of a results file read at once when they are merged
+MERGE_CHUNK_ROWS = 10000
+# Number of attempts to download the results of a query, the object being written shortly after the query succeeded
+DOWNLOAD_ATTEMPTS = 20
 
 
 class Analysis:
@@ -15,6 +25,7 @@ class Analysis:
     output_bucket = None
     region = None
     results = None
+    split = None
     dl = None
     path = None
     time = None
@@ -31,6 +42,7 @@ class Analysis:
         """
         self.region = region
         self.results = []
+        self.split = set()
         self.dl = dl
 
         #new folder for each run
@@ -114,6 +126,11 @@ class Analysis:
         elif table.endswith(".ddl"):
             table = get_table(table, False)[0]      
 
+        #The queries only filtering the rows are run in a single scan, the others alone
+        merged, queries = compile_queries(queries)
+        if merged:
+            self.run_merged(merged, db, table, timeframe)
+
         #Running all the queries
         
         for key, value in queries.items():
@@ -157,7 +174,59 @@ class Analysis:
 
         self.merge_results()
         self.clear_folder(self.dl)
-    
+
+    def run_merged(self, detections, db, table, timeframe):
+        """Run the detections merged by the query compiler in a single query, then split its results in one file per detection, as if each one had been run alone.
+
+        Parameters
+        ----------
+        detections : dict
+            Condition of each detection, by name
+        db : str
+            Database containing the table for logs analytics
+        table : str
+            Table queried
+        timeframe : str
+            Time filter for default queries
+        """
+        print(f"[+] Running {len(detections)} queries in a single scan : {', '.join(detections)}")
+        query = merged_query(list(detections.values()), timeframe)
+        query = query.replace("DATABASE", db)
+        query = query.replace("TABLE", table)
+
+        result = athena_query(self.region, query, self.output_bucket)
+        id = result["QueryExecution"]["QueryExecutionId"]
+
+        bucket, folder = get_bucket_and_prefix(self.output_bucket)
+        merged_file = f"{id}.csv"
+
+        # only a missing object is waited for, any other error stops the analysis
+        attempts = 0
+        while True:
+            try:
+                S3_CLIENT.download_file(bucket, f"{folder}{merged_file}", merged_file)
+                break
+            except ClientError as e:
+                attempts += 1
+                if e.response["Error"]["Code"] not in ("404", "NoSuchKey") or attempts == DOWNLOAD_ATTEMPTS:
+                    raise
+                sleep(500/1000)
+
+        hits = split_results(merged_file, list(detections))
+        remove(merged_file)
+
+        # the results of the merged query are replaced by the ones of each detection
+        S3_CLIENT.delete_object(Bucket=bucket, Key=f"{folder}{merged_file}")
+        S3_CLIENT.delete_object(Bucket=bucket, Key=f"{folder}{merged_file}.metadata")
+
+        for key in detections:
+            print(f"[+] Query : {key}")
+            self.print_hits(key, hits[key])
+            if hits[key]:
+                self.split.add(f"{key}-output.csv")
+                if not self.dl:
+                    S3_CLIENT.upload_file(f"{key}-output.csv", bucket, f"{folder}{key}-output.csv")
+
     def init_athena(self, db, table, source_bucket, output_bucket, exists, isTrail):
         """Initiate athena database and table for further analysis.
 
@@ -348,44 +417,62 @@ class Analysis:
         Query run
         """
         number   = len(source.utils.utils.ATHENA_CLIENT.get_query_results(QueryExecutionId=id)["ResultSet"]["Rows"])
-        if number == 2:
-            print(f"[+] {OKGREEN}{number-1} hit !{ENDC}")
+        # only the first page of the results is read
+        self.print_hits(query, number-1, number > 999)
+
+    def print_hits(self, query, hits, more=False):
+        """Print the number of hits of a query and keep its results file if it has some.
+
+        Parameters
+        ----------
+        query : str
+            Query run
+        hits : int
+            Number of rows of the results
+        more : bool, optional
+            True if the results have more rows than counted
+        """
+        if hits == 1:
+            print(f"[+] {OKGREEN}{hits} hit !{ENDC}")
             self.results.append(f"{query}-output.csv")
-        elif number > 999:
-            print(f"[+] {OKGREEN}{number-1}+ hits !{ENDC}")
+        elif more:
+            print(f"[+] {OKGREEN}{hits}+ hits !{ENDC}")
             self.results.append(f"{query}-output.csv")
-        elif number > 2:
-            print(f"[+] {OKGREEN}{number-1} hits !{ENDC}")
+        elif hits > 1:
+            print(f"[+] {OKGREEN}{hits} hits !{ENDC}")
             self.results.append(f"{query}-output.csv")
         else:
-            print(f"[+] {number-1} hit. You may have better luck next time my young padawan !")
+            print(f"[+] {hits} hit. You may have better luck next time my young padawan !")
 
     def merge_results(self):
-        """Merge the results csv files in one single xlsx file."""
+        """Merge the results csv files in one single xlsx file.
+        The files are read by chunks and the rows written one by one, each row leaving the memory once the next one is written, so the memory used doesn't depend on the size of the results.
+        """
         if self.results:
 
             bucket_name, prefix = get_bucket_and_prefix(self.output_bucket)
 
             name_writer = f"merged_file.xlsx"
-            writer = pd.ExcelWriter(name_writer, engine='xlsxwriter')
+            workbook = xlsxwriter.Workbook(name_writer, {"constant_memory": True})
 
+            # the results split from a single scan are already there
             for local_file_name in self.results:
-                s3_file_name = prefix + local_file_name
-                S3_CLIENT.download_file(bucket_name, s3_file_name, local_file_name)
+                if local_file_name not in self.split:
+                    s3_file_name = prefix + local_file_name
+                    S3_CLIENT.download_file(bucket_name, s3_file_name, local_file_name)
 
 
             for i, file in enumerate(self.results):
                 sheet = str(file)[:-4]
                 if len(sheet) > 31:
                     sheet = sheet[:24] + sheet[-7:]
-                df = pd.read_csv(file, sep=",", dtype="string")
-                df.to_excel(writer, sheet_name=sheet)
+                self.write_sheets(workbook, sheet, file)
 
-            writer.close()
+            workbook.close()
 
             if not self.dl:
 
-                S3_CLIENT.upload_file(writer, bucket_name, f'{prefix}{name_writer}')    
+                S3_CLIENT.upload_file(name_writer, bucket_name, f'{prefix}{name_writer}')    
                 remove(name_writer)
                 for local_file_name in self.results:
                     remove(local_file_name)
@@ -403,6 +490,66 @@ class Analysis:
                 print(f"[+] Merged results stored into {self.path}{name_writer}")
         else:
             print(f"[+] No results at all were found")
+
+    def write_sheets(self, workbook, sheet, file):
+        """Write a results csv file in the merged file, the index of each row in the first column.
+        The values are written as text, as they are in the csv file. If the file has more rows than a sheet can hold, the next ones are written in new sheets, named after the first one.
+
+        Parameters
+        ----------
+        workbook : Workbook
+            Merged file, in constant memory mode
+        sheet : str
+            Name of the first sheet
+        file : str
+            Results csv file
+        """
+        worksheet = None
+        sheets = 1
+        row = 1
+
+        with pd.read_csv(file, sep=",", dtype="string", chunksize=MERGE_CHUNK_ROWS) as chunks:
+            for chunk in chunks:
+                columns = list(chunk.columns)
+                if worksheet is None:
+                    worksheet = self.add_sheet(workbook, sheet, columns)
+
+                for values in chunk.itertuples(name=None):
+                    if row == EXCEL_MAX_ROWS:
+                        sheets += 1
+                        worksheet = self.add_sheet(workbook, f"{sheet[:30 - len(str(sheets))]}-{sheets}", columns)
+                        row = 1
+
+                    worksheet.write_number(row, 0, values[0])
+                    for column, value in enumerate(values[1:], 1):
+                        if value is not pd.NA:
+                            worksheet.write_string(row, column, value)
+                    row += 1
+
+        if sheets > 1:
+            print(f"[+] {file} has more rows than a sheet can hold, it was split in {sheets} sheets")
+
+    def add_sheet(self, workbook, sheet, columns):
+        """Add a sheet to the merged file and write its header.
+
+        Parameters
+        ----------
+        workbook : Workbook
+            Merged file
+        sheet : str
+            Name of the sheet, 31 characters at most
+        columns : list of str
+            Names of the columns
+
+        Returns
+        -------
+        worksheet : Worksheet
+            Sheet added
+        """
+        worksheet = workbook.add_worksheet(sheet)
+        for column, name in enumerate(columns, 1):
+            worksheet.write_string(0, column, name)
+        return worksheet
     
     def clear_folder(self, dl):
         """If results written locally, delete the tmp bucket created for the analysis. If results written in a bucket, clear the bucket so the .metadata and .txt are deleted.
@@ -1,10 +1,17 @@
 """File used for the configuration collection."""
 
-from source.utils.utils import create_s3_if_not_exists, PREPARATION_BUCKET, ROOT_FOLDER, create_command, create_folder, write_file, write_s3, set_clients
+from source.utils.utils import create_s3_if_not_exists, ROOT_FOLDER, create_command, create_folder, write_file, write_s3, writefile_s3, set_clients, ec2_parameters, ec2_keep
 import source.utils.utils
 from source.utils.enum import *
-import json, boto3
-from time import sleep
+from source.utils.iam import AuthorizationIndex
+from source.utils.metrics import count_items
+from source.utils.instrument import timed_service, over_memory_budget
+from source.utils.registry import collectors, enumerated, configure_service, REGISTRY
+import json, gc, threading
+from os import remove
+
+# the services can be collected at the same time (--schedule graph), their results are stored and taken out to be written under this lock
+FLUSH_LOCK = threading.Lock()
 
 
 class Configuration:
@@ -28,7 +35,7 @@ class Configuration:
         self.region = region
         self.dl = dl
         if not self.dl:
-            self.bucket = create_s3_if_not_exists(self.region, PREPARATION_BUCKET)
+            self.bucket = create_s3_if_not_exists(self.region, source.utils.utils.PREPARATION_BUCKET)
 
     def self_test(self):
         """Test function."""
@@ -44,80 +51,165 @@ class Configuration:
         regionless : str
             "not-all" if the tool is used on only one region. First region to run the tool on otherwise
         """
+        self.begin(services)
+
+        for collector in collectors("configuration", self.region, regionless):
+            self.run_service(collector)
+
+        self.finish()
+
+    def begin(self, services):
+        """Start the configuration collection in the region.
+
+        Parameters
+        ---------
+        services : list
+            Results of the enumeration, used to know the elements of each service
+        """
         print(f"[+] Beginning Configuration Extraction")
 
         set_clients(self.region)
 
         self.services = services
 
-        if (regionless != "" and regionless == self.region) or regionless == "not-all":
-            self.get_configuration_s3()
-            self.get_configuration_iam()
-            self.get_configuration_cloudtrail()
-            self.get_configuration_route53()
-        
-        self.get_configuration_wafv2()
-        self.get_configuration_lambda()
-        self.get_configuration_vpc()
-        self.get_configuration_elasticbeanstalk()
+    def run_service(self, collector):
+        """Retrieve the configuration of a service, unless it was already done by the interrupted run being resumed.
 
-        self.get_configuration_ec2()
-        self.get_configuration_dynamodb()
-        self.get_configuration_rds()
+        Parameters
+        ----------
+        collector : Collector
+            Description of the service
+        """
+        if collector.configuration:
+            self.run_unit(collector.name, self.get_configuration, collector)
+        else:
+            self.run_unit(collector.name, getattr(self, f"get_configuration_{collector.name}"))
 
-        self.get_configuration_cloudwatch()
-        self.get_configuration_guardduty()
-        self.get_configuration_detective()
-        self.get_configuration_inspector2()
-        self.get_configuration_maciev2()
+    def finish(self):
+        """Write the configurations collected where asked."""
+        with tqdm(desc="[+] Writing results", leave=False, total = len(self.results)) as pbar:
+            for el in self.results:
+                self.write_result(el, self.results[el])
+                pbar.update() 
 
+        if self.dl:
+            print(f"[+] Configuration results stored in the folder {ROOT_FOLDER}{self.region}/configurations/")
+        else:
+            print(f"[+] Configurations results stored in the bucket {self.bucket}")
+
+    def write_result(self, el, value):
+        """Write the configuration of a service where asked.
+
+        Parameters
+        ----------
+        el : str
+            Name of the service
+        value : list
+            Configuration of the service
+
+        Returns
+        -------
+        output : dict
+            Where the configuration was written
+        """
         if self.dl:
             confs = ROOT_FOLDER + self.region + "/configurations/"
             create_folder(confs)
-            with tqdm(desc="[+] Writing results", leave=False, total = len(self.results)) as pbar:
-                for el in self.results:
-                    write_file(
-                        confs + f"{el}.json",
-                        "w",
-                        json.dumps(self.results[el], indent=4, default=str),
-                    )
-                    pbar.update() 
-                    sleep(0.1)
-            print(f"[+] Configuration results stored in the folder {confs}")
+            write_file(
+                confs + f"{el}.json",
+                "w",
+                json.dumps(value, indent=4, default=str),
+            )
+            return {"file": confs + f"{el}.json"}
         else:
-            with tqdm(desc="[+] Writing results", leave=False, total = len(self.results)) as pbar:
-                for el in self.results:
-                    write_s3(
-                        self.bucket,
-                        f"{self.region}/configuration/{el}.json",
-                        json.dumps(self.results, indent=4, default=str),
-                    )
-                    pbar.update() 
-                    sleep(0.1)
-            print(f"[+] Configurations results stored in the bucket {self.bucket}")
+            write_s3(
+                self.bucket,
+                f"{self.region}/configuration/{el}.json",
+                json.dumps(value, indent=4, default=str),
+            )
+            return {"bucket": self.bucket, "key": f"{self.region}/configuration/{el}.json"}
+
+    def write_unit(self, key):
+        """Write the configuration of a completed service where asked and forget it, so a resumed run can skip the service.
+
+        Parameters
+        ----------
+        key : str
+            Key of the results of the service
+
+        Returns
+        -------
+        output : dict
+            Where the configuration was written and how many elements it contains
+        """
+        # the configuration is taken out under the lock, so a flush of another service can't write it too
+        with FLUSH_LOCK:
+            value = self.results.pop(key, None)
+
+        if value is None:
+            return {"count": 0}
+
+        output = self.write_result(key, value)
+        output["count"] = len(value)
+        return output
+
+    def set_result(self, key, value):
+        """Store the configuration of a service, under the lock of the writes as the services can be collected at the same time.
+
+        Parameters
+        ----------
+        key : str
+            Key of the results of the service
+        value : list
+            Configuration of the service
+        """
+        with FLUSH_LOCK:
+            self.results[key] = value
+
+    def flush_results(self):
+        """Write the configurations collected so far and forget them, when the memory budget is exceeded."""
+        with FLUSH_LOCK:
+            names = list(self.results)
+            if not names:
+                return
+
+            for el in names:
+                self.write_result(el, self.results[el])
+                del self.results[el]
+            gc.collect()
+
+        print(f"[+] Memory budget exceeded, the configuration of {len(names)} services was written and released")
+
+    def get_configuration(self, collector):
+        """Retrieve the configuration of a service described by the registry.
+
+        Parameters
+        ----------
+        collector : Collector
+            Description of the service
+        """
+        elements, identifiers = enumerated(self.services, collector.name)
+        if elements is None:
+            self.display_progress(0, collector.name)
+            return
+
+        results = configure_service(collector, elements, identifiers)
+
+        self.set_result(collector.name, results)
+        self.display_progress(len(results), collector.name)
 
     def get_configuration_s3(self):
         """Retrieve multiple elements of the configuration of the existing s3 buckets.""" 
-        s3_list = self.services["s3"]
-
         '''
         In the first part, we verify that the enumeration of the service is already done. 
         If it doesn't, we redo it.
         If it is, we verify if the service is available or not.
         '''
 
-        if s3_list["count"] == -1:
-            elements = s3_lookup()
-            
-            if len(elements) == 0:
-                self.display_progress(0, "s3")
-                return
-
-        elif s3_list["count"] == 0:
+        elements, _ = enumerated(self.services, "s3")
+        if elements is None:
             self.display_progress(0, "s3")
             return
-        else:
-            elements = s3_list["elements"]
 
         '''
         In this part, we get some parts of the configuration of each element of the service (s3 in this case)
@@ -125,48 +217,32 @@ class Configuration:
         This way of working is used in every function of this class.
         '''
 
-        objects = {}
-        buckets_logging = {}
-        buckets_policy = {}
-        buckets_acl = {}
-        buckets_location = {}
+        names = [bucket["Name"] for bucket in elements]
 
-        with tqdm(desc="[+] Getting S3 Configuration", leave=False, total = len(elements)) as pbar:
-            for bucket in elements:
-                bucket_name = bucket["Name"]
-                objects[bucket_name] = []
+        # list_objects_v2
 
-                # list_objects_v2
+        objects = run_parallel("S3", lambda name: simple_paginate(S3_CLIENT, "list_objects_v2", Bucket=name), names)
 
-                objects[bucket_name] = simple_paginate(S3_CLIENT, "list_objects_v2", Bucket=bucket_name)
+        # get_bucket_logging
 
-                # get_bucket_logging
+        buckets_logging = fetch_details("S3", S3_CLIENT.get_bucket_logging, names, "Bucket")
+        for bucket_name, response in buckets_logging.items():
+            if "LoggingEnabled" not in response:
+                buckets_logging[bucket_name] = {"LoggingEnabled": False}
 
-                response = try_except(S3_CLIENT.get_bucket_logging, Bucket=bucket_name)
-                if "LoggingEnabled" in response:
-                    buckets_logging[bucket_name] = response
-                else:
-                    buckets_logging[bucket_name] = {"LoggingEnabled": False}
+        # get_bucket_policy
 
-                # get_bucket_policy
+        buckets_policy = fetch_details("S3", S3_CLIENT.get_bucket_policy, names, "Bucket")
+        for bucket_name, response in buckets_policy.items():
+            buckets_policy[bucket_name] = json.loads(response.get("Policy", "{}"))
 
-                response = try_except(S3_CLIENT.get_bucket_policy, Bucket=bucket_name)
-                buckets_policy[bucket_name] = json.loads(response.get("Policy", "{}"))
+        # get_bucket_acl
 
-                # get_bucket_acl
+        buckets_acl = fetch_details("S3", S3_CLIENT.get_bucket_acl, names, "Bucket")
 
-                response = try_except(S3_CLIENT.get_bucket_acl, Bucket=bucket_name)
-                response.pop("ResponseMetadata", None)
-                response = fix_json(response)
-                buckets_acl[bucket_name] = response
-
-                # get_bucket_location
+        # get_bucket_location
 
-                response = try_except(S3_CLIENT.get_bucket_location, Bucket=bucket_name)
-                response.pop("ResponseMetadata", None)
-                response = fix_json(response)
-                buckets_location[bucket_name] = response
-                pbar.update()
+        buckets_location = fetch_details("S3", S3_CLIENT.get_bucket_location, names, "Bucket")
           
         # Presenting the results properly
         results = []
@@ -191,69 +267,38 @@ class Configuration:
                 "aws s3api get-bucket-location --bucket <name>", buckets_location
             )
         )
-        self.results["s3"] = results
+        self.set_result("s3", results)
         self.display_progress(len(results), "s3")
 
     def get_configuration_wafv2(self):
         """Retrieve multiple elements of the configuration of the existing web acls.""" 
-        waf_list = self.services["wafv2"]
-
-        if waf_list["count"] == -1:
-            wafs = misc_lookup("WAF", source.utils.utils.WAF_CLIENT.list_web_acls, "NextMarker", "WebACLs", Scope="REGIONAL", Limit=100)
-        
-            identifiers = []
-            for el in wafs:
-                identifiers.append(el["ARN"])
-
-            if len(identifiers) == 0:
-                self.display_progress(0, "wafv2")
-                return
-
-        elif waf_list["count"] == 0:
+        elements, identifiers = enumerated(self.services, "wafv2")
+        if elements is None:
             self.display_progress(0, "wafv2")
             return
-        else:
-            identifiers = waf_list["ids"]
-
-        logging_config = {}
-        rule_groups = {}
-        managed_rule_sets = {}
-        ip_sets = {}
-        resources = {}
-
-        with tqdm(desc="[+] Getting WAF configuration", leave=False, total = len(identifiers)) as pbar:
-            for arn in identifiers:
-
-                # get_logging_configuration
-
-                response = try_except(source.utils.utils.WAF_CLIENT.get_logging_configuration, ResourceArn=arn)
-                response.pop("ResponseMetadata", None)
-                response = fix_json(response)
-                if "WAFNonexistentItemException" in response["error"]:
-                    response["error"] = "[!] Error: The Logging feature is not enabled for the selected Amazon WAF Web Access Control List (Web ACL)."
-                logging_config[arn] = response
-
-                # list_rules_groups
-                # Use of misc_lookup as not every results are listed at the first call if there are a lot
 
-                rule_groups[arn] = simple_misc_lookup("WAF", source.utils.utils.WAF_CLIENT.list_rule_groups, "NextMarker", Scope="REGIONAL", Limit=100)
+        # get_logging_configuration
 
+        logging_config = fetch_details("WAF", source.utils.utils.WAF_CLIENT.get_logging_configuration, identifiers, "ResourceArn")
+        for response in logging_config.values():
+            if "WAFNonexistentItemException" in response.get("error", ""):
+                response["error"] = "[!] Error: The Logging feature is not enabled for the selected Amazon WAF Web Access Control List (Web ACL)."
 
-                # list_managed_rule_sets
+        # list_rules_groups, list_managed_rule_sets, list_ip_sets
+        # Use of misc_lookup as not every results are listed at the first call if there are a lot
+        # These commands don't depend on the web acl, they are only run once
 
-                managed_rule_sets[arn] = simple_misc_lookup("WAF", source.utils.utils.WAF_CLIENT.list_managed_rule_sets, "NextMarker", Scope="REGIONAL", Limit=100)
+        all_rule_groups = simple_misc_lookup("WAF", source.utils.utils.WAF_CLIENT.list_rule_groups, "NextMarker", Scope="REGIONAL", Limit=100)
+        all_managed_rule_sets = simple_misc_lookup("WAF", source.utils.utils.WAF_CLIENT.list_managed_rule_sets, "NextMarker", Scope="REGIONAL", Limit=100)
+        all_ip_sets = simple_misc_lookup("WAF", source.utils.utils.WAF_CLIENT.list_ip_sets, "NextMarker", Scope="REGIONAL", Limit=100)
 
-                # list_ip_sets
+        rule_groups = {arn: all_rule_groups for arn in logging_config}
+        managed_rule_sets = {arn: all_managed_rule_sets for arn in logging_config}
+        ip_sets = {arn: all_ip_sets for arn in logging_config}
 
-                ip_sets[arn] = simple_misc_lookup("WAF", source.utils.utils.WAF_CLIENT.list_ip_sets, "NextMarker", Scope="REGIONAL", Limit=100)
+        #list_resources_for_web_acl
 
-                #list_resources_for_web_acl
-
-                response = try_except("WAF", source.utils.utils.WAF_CLIENT.list_resources_for_web_acl, WebACLArn=arn)
-                response.pop("ResponseMetadata", None)
-                response = fix_json(response)
-                resources[arn] = response
-                pbar.update()
+        resources = fetch_details("WAF", source.utils.utils.WAF_CLIENT.list_resources_for_web_acl, identifiers, "WebACLArn")
 
         results = []
         results.append(
@@ -279,270 +324,41 @@ class Configuration:
             )
         )
 
-        self.results["wafv2"] = results
+        self.set_result("wafv2", results)
         self.display_progress(len(results), "wafv2")
 
-    def get_configuration_lambda(self):
-        """Retrieve multiple elements of the configuration of the existing lambdas.""" 
-        lambda_list = self.services["lambda"]
-
-        if lambda_list["count"] == -1:
-            functions = paginate(source.utils.utils.LAMBDA_CLIENT, "list_functions", "Functions")
-
-            if len(functions) == 0:
-                self.display_progress(0, "lambda")
-                return
-            
-            identifiers = []
-            for function in functions:
-                identifiers.append(function["FunctionName"])
-
-        elif lambda_list["count"] == 0:
-            self.display_progress(0, "lambda")
+    def get_configuration_elasticbeanstalk(self):
+        """Retrieve multiple elements of the configuration of the existing elasticbeanstalk environments."""
+        environments, _ = enumerated(self.services, "elasticbeanstalk")
+        if environments is None:
+            self.display_progress(0, "elasticbeanstalk")
             return
-        else:
-            identifiers = lambda_list["ids"]
 
-        function_config = {}
+        identifiers = [environment["EnvironmentId"] for environment in environments if environment.get("EnvironmentId", "") != ""]
 
-        with tqdm(desc="[+] Getting LAMBDA configuration", leave=False, total = len(identifiers)) as pbar:
-            for name in identifiers:
-                if name == "":
-                    continue
+        # describe_environment_resources
 
-                # get_function_configuration
+        resources = fetch_details("ELASTICBEANSTALK", source.utils.utils.EB_CLIENT.describe_environment_resources, identifiers, "EnvironmentId")
 
-                response = try_except(
-                    source.utils.utils.LAMBDA_CLIENT.get_function_configuration, FunctionName=name
-                )
-                response.pop("ResponseMetadata", None)
-                response = fix_json(response)
-                function_config[name] = response
-                pbar.update()
-
-        # get_account_settings
+        #  describe_environment_managed_actions
 
-        response = try_except(source.utils.utils.LAMBDA_CLIENT.get_account_settings)
-        response.pop("ResponseMetadata", None)
-        response = fix_json(response)
-        account_settings = response
+        managed_actions = fetch_details("ELASTICBEANSTALK", source.utils.utils.EB_CLIENT.describe_environment_managed_actions, identifiers, "EnvironmentId")
 
-        # list_event_source_mappings
+        # describe_environment_managed_action_history
 
-        event_source_mappings = simple_paginate(source.utils.utils.LAMBDA_CLIENT, "list_event_source_mappings")
-
-        results = []
-        results.append(
-            create_command(
-                "aws lambda get-function-configuration --function-name <name>",
-                function_config,
-            )
-        )
-        results.append(
-            create_command("aws lambda get-account-settings", account_settings)
+        managed_action_history = run_parallel(
+            "ELASTICBEANSTALK",
+            lambda id: simple_paginate(source.utils.utils.EB_CLIENT, "describe_environment_managed_action_history", EnvironmentId=id),
+            identifiers
         )
-        results.append(
-            create_command(
-                "aws lambda list-event-source-mappings", event_source_mappings
-            )
-        )
-
-        self.results["lambda"] = results
-        self.display_progress(len(results), "lambda")
-   
-    def get_configuration_vpc(self):
-        """Retrieve multiple elements of the configuration of the existing vpcs.""" 
-        vpc_list = self.services["vpc"]
-
-        if vpc_list["count"] == -1:
-
-            vpcs = paginate(source.utils.utils.EC2_CLIENT, "describe_vpcs", "Vpcs")
-
-            if len(vpcs) == 0:
-                self.display_progress(0, "vpc")
-                return
-            
-            identifiers = []
-            for vpc in vpcs:
-                identifiers.append(vpc["VpcId"])
-
-        elif vpc_list["count"] == 0:
-            self.display_progress(0, "vpc")
-            return
-        else:
-            identifiers = vpc_list["ids"]
-
-        dns_support = {}
-        dns_hostnames = {}
-
-        with tqdm(desc="[+] Getting VPC configuration", leave=False, total = len(identifiers)) as pbar:
-            for id in identifiers:
-                if id == "":
-                    continue
-
-                # describe_vpc_attribute
-
-                response = try_except(
-                    source.utils.utils.EC2_CLIENT.describe_vpc_attribute,
-                    VpcId=id,
-                    Attribute="enableDnsSupport",
-                )
-                response.pop("ResponseMetadata", None)
-                response = fix_json(response)
-                dns_support[id] = response
-
-                # describe_vpc_attribute
-
-                response = try_except(
-                    source.utils.utils.EC2_CLIENT.describe_vpc_attribute,
-                    VpcId=id,
-                    Attribute="enableDnsHostnames",
-                )
-                response.pop("ResponseMetadata", None)
-                response = fix_json(response)
-                dns_hostnames[id] = response
-                pbar.update()
-
-        # describe_flow_logs
 
-        flow_logs = simple_paginate(source.utils.utils.EC2_CLIENT, "describe_flow_logs")
+        # describe_instances_health
 
-        # describe_vpc_peering_connections
-
-        peering_connections = simple_paginate(source.utils.utils.EC2_CLIENT, "describe_vpc_peering_connections")
-
-        # describe_vpc_endpoint_connections
-
-        endpoint_connections = simple_paginate(source.utils.utils.EC2_CLIENT, "describe_vpc_endpoint_connections")
-
-        # describe_vpc_endpoint_service_configurations
-
-        endpoint_service_config = simple_paginate(source.utils.utils.EC2_CLIENT, "describe_vpc_endpoint_service_configurations")
-
-        # describe_vpc_classic_link
-
-        response = try_except(source.utils.utils.EC2_CLIENT.describe_vpc_classic_link)
-        response.pop("ResponseMetadata", None)
-        response = fix_json(response)
-        classic_links = response
-
-        # describe_vpc_endpoints
-
-        endpoints = simple_paginate(source.utils.utils.EC2_CLIENT, "describe_vpc_endpoints")
-
-        # describe_local_gateway_route_table_vpc_associations
-
-        response = simple_paginate(source.utils.utils.EC2_CLIENT, "describe_local_gateway_route_table_vpc_associations")
-        local_gateway_route_table = response
-
-        results = []
-        results.append(
-            create_command(
-                "aws ec2 describe-vpc-attribute --vpc-id <id> --attribute enableDnsSupport",
-                dns_support,
-            )
-        )
-        results.append(
-            create_command(
-                "aws ec2 describe-vpc-attribute --vpc-id <id> --attribute enableDnsHostnames",
-                dns_hostnames,
-            )
+        instances_health = run_parallel(
+            "ELASTICBEANSTALK",
+            lambda id: simple_misc_lookup("ELASTICBEANSTALK", source.utils.utils.EB_CLIENT.describe_instances_health, "NextToken", EnvironmentId=id),
+            identifiers
         )
-        results.append(create_command("aws ec2 describe-flow-logs", flow_logs))
-        results.append(
-            create_command(
-                "aws ec2 describe-vpc-peering-connections", peering_connections
-            )
-        )
-        results.append(
-            create_command(
-                "aws ec2 describe-vpc-endpoint-connections", endpoint_connections
-            )
-        )
-        results.append(
-            create_command(
-                "aws ec2 describe-vpc-endpoint-service-configurations",
-                endpoint_service_config,
-            )
-        )
-        results.append(
-            create_command("aws ec2 describe-vpc-classic-link", classic_links)
-        )
-        results.append(create_command("aws ec2 describe-vpc-endpoints", endpoints))
-        results.append(
-            create_command(
-                "aws ec2 describe-local-gateway-route-table-vpc-associations",
-                local_gateway_route_table,
-            )
-        )
-
-        self.results["vpc"] = results
-        self.display_progress(len(results), "vpc")
-    
-    def get_configuration_elasticbeanstalk(self):
-        """Retrieve multiple elements of the configuration of the existing elasticbeanstalk environments."""
-        eb_list = self.services["elasticbeanstalk"]
-
-        if eb_list["count"] == -1:
-            environments = paginate(source.utils.utils.EB_CLIENT, "describe_environments", "Environments")
-
-            if len(environments) == 0:
-                self.display_progress(0, "elasticbeanstalk")
-                return
-            
-            identifiers = []
-            for env in environments:
-                identifiers.append(env["EnvironmentId"])
-
-        elif eb_list["count"] == 0:
-            self.display_progress(0, "elasticbeanstalk")
-            return
-        else:
-            identifiers = []
-            environments = eb_list["elements"]
-            for el in environments:
-                identifiers.append(el["EnvironmentId"])
-
-        resources = {}
-        managed_actions = {}
-        managed_action_history = {}
-        instances_health = {}
-
-        with tqdm(desc="[+] Getting ELASTICBEANSTALK configuration", leave=False, total = len(identifiers)) as pbar:
-            for id in identifiers:
-                if id == "":
-                    continue
-                resources[id] = []
-
-                # describe_environment_resources
-
-                response = try_except(
-                    source.utils.utils.EB_CLIENT.describe_environment_resources, EnvironmentId=id
-                )
-                response.pop("ResponseMetadata", None)
-                response = fix_json(response)
-                resources[id] = response
-
-               #  describe_environment_managed_actions
-
-                managed_actions[id] = []
-                response = try_except(
-                    source.utils.utils.EB_CLIENT.describe_environment_managed_actions, EnvironmentId=id
-                )
-                response.pop("ResponseMetadata", None)
-                response = fix_json(response)
-                managed_actions[id] = response
-
-                # describe_environment_managed_action_history
-
-                managed_action_history[id] = []
-                managed_action_history[id] = simple_paginate(source.utils.utils.EB_CLIENT, "describe_environment_managed_action_history", EnvironmentId=id)
-
-                # describe_instances_health
-
-                instances_health[id] = []
-                instances_health[id] = simple_misc_lookup("ELASTICBEANSTALK", source.utils.utils.EB_CLIENT.describe_instances_health, "NextToken", EnvironmentId=id)
-                pbar.update()
 
         # describe_applications
 
@@ -595,29 +411,15 @@ class Configuration:
             )
         )
 
-        self.results["eb"] = results
+        self.set_result("eb", results)
         self.display_progress(len(results), "elasticbeanstalk")
     
     def get_configuration_route53(self):
         """Retrieve multiple elements of the configuration of the existing routes53 hosted zones.""" 
-        route53_list = self.services["route53"]
-
-        if route53_list["count"] == -1:
-            hosted_zones = paginate(source.utils.utils.ROUTE53_CLIENT, "list_hosted_zones", "HostedZones")
-
-            if len(hosted_zones) == 0:
-                self.display_progress(0, "route53")
-                return
-            
-            identifiers = []
-            for zone in hosted_zones:
-                identifiers.append(zone["Id"])
-
-        elif route53_list["count"] == 0:
+        elements, identifiers = enumerated(self.services, "route53")
+        if elements is None:
             self.display_progress(0, "route53")
             return
-        else:
-            identifiers = route53_list["ids"]
 
         # list_traffic_policies
 
@@ -635,18 +437,11 @@ class Configuration:
 
         resolver_log_configs = simple_paginate(source.utils.utils.ROUTE53_RESOLVER_CLIENT, "list_resolver_query_log_configs")
 
-        get_zones = []
         results = []
 
         # get_hosted_zone
 
-        with tqdm(desc="[+] Getting ROUTE53 configuration", leave=False, total = len(identifiers)) as pbar:
-            for id in identifiers:
-                response = try_except(source.utils.utils.ROUTE53_CLIENT.get_hosted_zone, Id=id)
-                response.pop("ResponseMetadata", None)
-                response = fix_json(response)
-                get_zones.append(response)
-                pbar.update()
+        get_zones = list(fetch_details("ROUTE53", source.utils.utils.ROUTE53_CLIENT.get_hosted_zone, identifiers, "Id").values())
 
         results.append(
             create_command("aws route53 list-traffic-policies", get_traffic_policies)
@@ -671,26 +466,14 @@ class Configuration:
             )
         )
 
-        self.results["route53"] = results
+        self.set_result("route53", results)
         self.display_progress(len(results), "route53")
         return
     
     def get_configuration_ec2(self):
         """Retrieve multiple elements of the configuration of the existing ec2 instances.""" 
-        ec2_list = self.services["ec2"]
-
-        if ec2_list["count"] == -1:
-            elements = ec2_lookup()
-
-            if len(elements) == 0:
-                self.display_progress(0, "ec2")
-                return
-
-            else:
-                self.display_progress(0, "ec2")
-                return
-
-        elif ec2_list["count"] == 0:
+        elements, _ = enumerated(self.services, "ec2")
+        if elements is None:
             self.display_progress(0, "ec2")
             return
 
@@ -715,24 +498,26 @@ class Configuration:
         key_pairs = fix_json(response)
 
         # describe_volumes
+        # volumes and snapshots can be numerous, they are written to the disk page by page
 
-        volumes = simple_paginate(source.utils.utils.EC2_CLIENT, "describe_volumes")
+        volumes = self.stream_results("ec2-volumes", source.utils.utils.EC2_CLIENT, "describe_volumes", "Volumes", ec2_keep("describe_volumes"), **ec2_parameters("describe_volumes"))
 
         # describe_subnets
 
-        subnets = simple_paginate(source.utils.utils.EC2_CLIENT, "describe_subnets")
+        subnets = simple_paginate(source.utils.utils.EC2_CLIENT, "describe_subnets", **ec2_parameters("describe_subnets"))
 
         # describe_security_groups
 
-        sec_groups = simple_paginate(source.utils.utils.EC2_CLIENT, "describe_security_groups")
+        sec_groups = simple_paginate(source.utils.utils.EC2_CLIENT, "describe_security_groups", **ec2_parameters("describe_security_groups"))
 
         # describe_route_tables
 
-        route_tables = simple_paginate(source.utils.utils.EC2_CLIENT, "describe_route_tables")
+        route_tables = simple_paginate(source.utils.utils.EC2_CLIENT, "describe_route_tables", **ec2_parameters("describe_route_tables"))
 
         # describe_snapshots
+        # only the snapshots owned by the account, not the public ones
 
-        snapshots = simple_paginate(source.utils.utils.EC2_CLIENT, "describe_snapshots")
+        snapshots = self.stream_results("ec2-snapshots", source.utils.utils.EC2_CLIENT, "describe_snapshots", "Snapshots", ec2_keep("describe_snapshots"), **ec2_parameters("describe_snapshots"))
 
         results = []
         results.append(create_command("aws ec2 describe-export-tasks", export))
@@ -743,23 +528,15 @@ class Configuration:
         results.append(create_command("aws ec2 describe-subnets", subnets))
         results.append(create_command("aws ec2 describe-security-groups", sec_groups))
         results.append(create_command("aws ec2 describe-route-tables", route_tables))
-        results.append(create_command("aws ec2 describe-snapshots", snapshots))
+        results.append(create_command("aws ec2 describe-snapshots --owner-ids self", snapshots))
 
-        self.results["ec2"] = results
+        self.set_result("ec2", results)
         self.display_progress(len(results), "ec2")
    
     def get_configuration_iam(self):
         """Retrieve multiple elements of the configuration of the existing iam users.""" 
-        iam_list = self.services["iam"]
-
-        if iam_list["count"] == -1:
-            elements = paginate(source.utils.utils.IAM_CLIENT, "list_users", "Users")
-
-            if len(elements) == 0:
-                self.display_progress(0, "ec2")
-                return
-
-        elif iam_list["count"] == 0:
+        elements, _ = enumerated(self.services, "iam")
+        if elements is None:
             self.display_progress(0, "iam")
             return
         
@@ -770,8 +547,16 @@ class Configuration:
         get_summary = fix_json(response)
 
         # get_account_authorization_details
+        # the pages are written to their own file and indexed on the fly (principals, policies, statements by action)
+
+        index = AuthorizationIndex()
+        file = f"{ROOT_FOLDER}{self.region}/configurations/iam-authorization-details.json"
+        count = pages_to_file(source.utils.utils.IAM_CLIENT, "get_account_authorization_details", file, index.add_page)
+        get_auth_details = self.store_file("iam-authorization-details", file, count)
 
-        get_auth_details = simple_paginate(source.utils.utils.IAM_CLIENT, "get_account_authorization_details")
+        file = f"{ROOT_FOLDER}{self.region}/configurations/iam-index.json"
+        index.save(file)
+        iam_index = self.store_file("iam-index", file, len(index.principals))
 
         # list_ssh_public_keys
 
@@ -788,34 +573,22 @@ class Configuration:
                 "aws iam get-account-authorization-details", get_auth_details
             )
         )
+        results.append(create_command("iam authorization index", iam_index))
         results.append(
             create_command("aws iam list-ssh-public-keys  ", list_ssh_pub_keys)
         )
         results.append(create_command("aws iam list-mfa-devices ", list_mfa_devices))
 
-        self.results["iam"] = results
+        self.set_result("iam", results)
         self.display_progress(len(results), "iam")
         return
     
     def get_configuration_dynamodb(self):
         """Retrieve multiple elements of the configuration of the existing dynamodb tables.""" 
-        dynamodb_list = self.services["s3"]
-
-        if dynamodb_list["count"] == -1:
-            tables = paginate(source.utils.utils.DYNAMODB_CLIENT, "list_tables", "TableNames")
-
-            if len(tables) == 0:
-                self.display_progress(0, "dynamodb")
-                return
-
-        elif dynamodb_list["count"] == 0:
+        tables, _ = enumerated(self.services, "dynamodb")
+        if tables is None:
             self.display_progress(0, "dynamodb")
             return
-        else:
-            tables = dynamodb_list["elements"]
-
-        tables_info = []
-        export_info = []
 
         # list_backups
 
@@ -827,23 +600,12 @@ class Configuration:
 
         # describe_table
 
-        with tqdm(desc="[+] Getting DYNAMODB configuration", leave=False, total = len(tables)) as pbar:
-            for table in tables:
-                response = try_except(source.utils.utils.DYNAMODB_CLIENT.describe_table, TableName=table)
-                response.pop("ResponseMetadata", None)
-                get_table = fix_json(response)
-                tables_info.append(get_table)
-                pbar.update()
+        tables_info = list(fetch_details("DYNAMODB", source.utils.utils.DYNAMODB_CLIENT.describe_table, tables, "TableName").values())
 
         # describe_export
 
-        for export in list_exports:
-            response = try_except(
-                source.utils.utils.DYNAMODB_CLIENT.describe_export, ExportArn=export.get("ExportArn", "")
-            )
-            response.pop("ResponseMetadata", None)
-            get_export = fix_json(response)
-            export_info.append(get_export)
+        export_arns = [export.get("ExportArn", "") for export in list_exports]
+        export_info = list(fetch_details("DYNAMODB", source.utils.utils.DYNAMODB_CLIENT.describe_export, export_arns, "ExportArn").values())
 
         results = []
         results.append(create_command("aws dynamodb list-backups", backups))
@@ -859,62 +621,16 @@ class Configuration:
             )
         )
 
-        self.results["dynamodb"] = results
+        self.set_result("dynamodb", results)
         self.display_progress(len(results), "dynamodb")
         return
     
-    def get_configuration_rds(self):
-        """Retrieve multiple elements of the configuration of the existing rds instances.""" 
-        rds_list = self.services["rds"]
-
-        if rds_list["count"] == -1:
-            elements = paginate(source.utils.utils.RDS_CLIENT, "describe_db_instances", "DBInstances")
-
-            if len(elements) == 0:
-                self.display_progress(0, "rds")
-                return
-
-        elif rds_list["count"] == 0:
-            self.display_progress(0, "rds")
-            return
-
-        # describe_db_clusters
-
-        clusters = simple_paginate(source.utils.utils.RDS_CLIENT, "describe_db_clusters")
-
-        # describe_db_snapshots
-
-        snapshots = simple_paginate(source.utils.utils.RDS_CLIENT, "describe_db_snapshots")
-
-        # describe_db_proxies
-
-        proxies = simple_paginate(source.utils.utils.RDS_CLIENT, "describe_db_proxies")
-
-        results = []
-        results.append(create_command("aws rds describe-db-clusters", clusters))
-        results.append(create_command("aws rds describe-db-snapshots", snapshots))
-        results.append(create_command("aws rds describe-db-proxies ", proxies))
-
-        self.results["rds"] = results
-        self.display_progress(len(results), "rds")
-        return
-    
     def get_configuration_guardduty(self):
         """Retrieve multiple elements of the configuration of the existing guardduty detectors.""" 
-        guardduty_list = self.services["guardduty"]
-
-        if guardduty_list["count"] == -1:
-            detectors = paginate(source.utils.utils.GUARDDUTY_CLIENT, "list_detectors", "DetectorIds")
-
-            if len(detectors) == 0:
-                self.display_progress(0, "guardduty")
-                return
-
-        elif guardduty_list["count"] == 0:
+        elements, detector_ids = enumerated(self.services, "guardduty")
+        if elements is None:
             self.display_progress(0, "guardduty")
             return
-        else:
-            detectors = guardduty_list["ids"]
 
         detectors = {}
         filters = {}
@@ -923,8 +639,8 @@ class Configuration:
         threat_intel = {}
         ip_sets = {}
 
-        with tqdm(desc="[+] Getting GUARDDUTY configuration", leave=False, total = len(detectors)) as pbar:
-            for detector in detectors:
+        with tqdm(desc="[+] Getting GUARDDUTY configuration", leave=False, total = len(detector_ids)) as pbar:
+            for detector in detector_ids:
 
                 # get_detector
 
@@ -1001,200 +717,118 @@ class Configuration:
             create_command("guardduty list-ip-sets --detector-id <id>", ip_sets)
         )
 
-        self.results["guardduty"] = results
+        self.set_result("guardduty", results)
         self.display_progress(len(results), "guardduty")
         return
     
-    def get_configuration_cloudwatch(self):
-        """Retrieve multiple elements of the configuration of the existing cloudwatch dashboards.""" 
-        cloudwatch_list = self.services["cloudwatch"]
-
-        if cloudwatch_list["count"] == -1:
-            dashboards = paginate(source.utils.utils.CLOUDWATCH_CLIENT, "list_dashboards", "DashboardEntries")
-
-            if len(dashboards) == 0:
-                self.display_progress(0, "cloudwatch")
-                return
-
-        elif cloudwatch_list["count"] == 0:
-            self.display_progress(0, "cloudwatch")
-            return
-        else:
-            dashboards = cloudwatch_list["elements"]
-
-        dashboards_data = {}
-        with tqdm(desc="[+] Getting CLOUDWATCH configuration", leave=False, total = len(dashboards)) as pbar:
-            for dashboard in dashboards:
-                dashboard_name = dashboard["DashboardName"]
-                if dashboard_name == "":
-                    continue
-
-                # get_dashboard
-
-                response = try_except(
-                    source.utils.utils.CLOUDWATCH_CLIENT.get_dashboard, DashboardName=dashboard_name
-                )
-                response.pop("ResponseMetadata", None)
-                dashboards_data[dashboard_name] = fix_json(response)
-                pbar.update()
-
-        # list_metrics
-
-        metrics = simple_paginate(source.utils.utils.CLOUDWATCH_CLIENT, "list_metrics")
-
-        results = []
-        results.append(
-            create_command(
-                "aws cloudwatch get-dashboard --name <name>", dashboards_data
-            )
-        )
-        results.append(
-            create_command("aws cloudwatch list-metrics --name <name>", metrics)
-        )
-
-        self.results["cloudwatch"] = results
-        self.display_progress(len(results), "cloudwatch")
-        return
-
-    def get_configuration_maciev2(self):
-        """Retrieve multiple elements of the configuration of the existing macie buckets.""" 
-        macie_list = self.services["macie"]
-
-        if macie_list["count"] == -1:
-            elements = paginate(source.utils.utils.MACIE_CLIENT, "describe_buckets", "buckets")
-
-            if len(elements) == 0:
-                self.display_progress(0, "macie")
-                return
-        elif macie_list["count"] == 0:
-            self.display_progress(0, "macie")
+    def get_configuration_cloudtrail(self):
+        """Retrieve multiple elements of the configuration of the existing cloudtrail trails.""" 
+        trails, _ = enumerated(self.services, "cloudtrail")
+        if trails is None:
+            self.display_progress(0, "cloudtrail")
             return
 
-        # get_finding_statistics
-
-        response = try_except(source.utils.utils.MACIE_CLIENT.get_finding_statistics, groupBy="type")
-        response.pop("ResponseMetadata", None)
-        statistics_severity = fix_json(response)
+        # get_trail
+        # a trail has to be requested in its home region, so the trails are grouped by home region
 
-        # get_finding_statistics
+        home_regions = {}
+        for trail in trails:
+            home_regions.setdefault(trail.get("HomeRegion"), []).append(trail.get("Name", ""))
 
-        response = try_except(
-            source.utils.utils.MACIE_CLIENT.get_finding_statistics, groupBy="severity.description"
-        )
-        response.pop("ResponseMetadata", None)
-        statistics_type = fix_json(response)
+        trails_data = {}
+        for home_region, trail_names in home_regions.items():
+            client = source.utils.utils.create_client("cloudtrail", home_region)
+            trails_data.update(fetch_details("CLOUDTRAIL", client.get_trail, trail_names, "Name"))
 
         results = []
+        results.append(create_command("aws cloudtrail list-trails", trails))
         results.append(
-            create_command(
-                "aws macie2 get-finding-statistics --group-by severity.description",
-                statistics_severity,
-            )
-        )
-        results.append(
-            create_command(
-                "aws macie2 get-finding-statistics --group-by type", statistics_type
-            )
+            create_command("aws cloudtrail get-trail --name <name>", trails_data)
         )
 
-        self.results["macie"] = results
-        self.display_progress(len(results), "macie")
-        return
-    
-    def get_configuration_inspector2(self):
-        """Retrieve multiple elements of the configuration of the existing inspector coverages.""" 
-        inspector_list = self.services["inspector"]
-
-        if inspector_list["count"] == 0:
-            self.display_progress(0, "inspector")
-            return
-        
-        coverage = paginate(source.utils.utils.INSPECTOR_CLIENT, "list_coverage", "coveredResources")
-
-        if len(coverage) == 0:
-            self.display_progress(0, "inspector")
-            return
-
-        # list_usage_totals
-
-        usage = simple_paginate(source.utils.utils.INSPECTOR_CLIENT, "list_usage_totals")
-
-        # list_account_permissions
-
-        permission = simple_paginate(source.utils.utils.INSPECTOR_CLIENT, "list_account_permissions")
+        self.set_result("cloudtrail", results)
+        self.display_progress(len(results), "cloudtrail")
 
-        results = []
-        results.append(create_command("aws inspector2 list-coverage", coverage))
-        results.append(create_command("aws inspector2 list-usage-totals", usage))
-        results.append(
-            create_command("aws inspector2 list-account-permissions", permission)
-        )
+    def stream_results(self, name, client, command, array, keep=None, **kwargs):
+        """Write the results of a command to their own file page by page, so they are never all held in memory.
 
-        self.results["inspector"] = results
-        self.display_progress(len(results), "inspector")
-    
-    def get_configuration_detective(self):
-        """Retrieve multiple elements of the configuration of the existing detective graphs.""" 
-        detective_list = self.services["detective"]
+        Parameters
+        ----------
+        name : str
+            Name of the file
+        client : object
+            Client used to call the request
+        command : str
+            Command executed
+        array : str
+            Part of the results written
+        keep : function, optional
+            Return True if an element has to be written
+        **kwargs : list, optional
+            List of parameters to add to the command
+
+        Returns
+        -------
+        location : dict
+            Where the results were written and how many elements they contain
+        """
+        file = f"{ROOT_FOLDER}{self.region}/configurations/{name}.json"
+        count = paginate_to_file(client, command, array, file, keep, **kwargs)
 
-        if detective_list["count"] == -1:
-            graphs = misc_lookup("DETECTIVE", source.utils.utils.DETECTIVE_CLIENT.list_graphs, "NextToken", "GraphList", MaxResults=100)
+        return self.store_file(name, file, count)
 
-            if len(graphs) == 0:
-                self.display_progress(0, "detective")
-                return
+    def store_file(self, name, file, count):
+        """Leave a results file on the disk or move it to the bucket, depending on where the results are written.
 
-        elif detective_list["count"] == 0:
-            self.display_progress(0, "detective")
-            return
+        Parameters
+        ----------
+        name : str
+            Name of the file
+        file : str
+            Local file
+        count : int
+            Number of elements of the file
 
-        results = []
-        results.append(create_command("aws detective list-graphs ", graphs))
+        Returns
+        -------
+        location : dict
+            Where the results were written and how many elements they contain
+        """
+        if self.dl:
+            return {"file": file, "count": count}
 
-        self.results["detective"] = results
-        self.display_progress(len(results), "detective")
-        print("finito detectivo")
-    
-    def get_configuration_cloudtrail(self):
-        """Retrieve multiple elements of the configuration of the existing cloudtrail trails.""" 
-        cloudtrail_list = self.services["cloudtrail"]
+        key = f"{self.region}/configuration/{name}.json"
+        writefile_s3(self.bucket, key, file)
+        remove(file)
+        return {"bucket": self.bucket, "key": key, "count": count}
 
-        if cloudtrail_list["count"] == -1:
-            trails = paginate(source.utils.utils.CLOUDTRAIL_CLIENT, "list_trails", "Trails")
+    def run_unit(self, name, func, *args):
+        """Run the configuration function of a service, unless it was already completed by the interrupted run being resumed.
 
-            if len(trails) == 0:
-                self.display_progress(0, "cloudtrail")
-                return
+        Parameters
+        ----------
+        name : str
+            Name of the service
+        func : function
+            Configuration function of the service
+        *args : list
+            List of args of the function, optional
+        """
+        journal = source.utils.utils.JOURNAL
 
-        elif cloudtrail_list["count"] == 0:
-            self.display_progress(0, "cloudtrail")
+        if journal and journal.is_done(self.region, "configuration", name):
+            output = journal.output(self.region, "configuration", name)
+            self.display_progress(output["count"], name)
             return
-        else:
-            trails = cloudtrail_list["elements"]
-
-        trails_data = {}
-        with tqdm(desc="[+] Getting CLOUDTRAIL configuration", leave=False, total = len(trails)) as pbar:
-            for trail in trails:
-                trail_name = trail.get("Name", "")
-                if trail_name == "":
-                    continue
 
-                home_region = trail.get("HomeRegion")
-                source.utils.utils.CLOUDTRAIL_CLIENT = boto3.client("cloudtrail", region_name=home_region)
+        with timed_service("configuration", self.region, name):
+            func(*args)
 
-                response = try_except(source.utils.utils.CLOUDTRAIL_CLIENT.get_trail, Name=trail_name)
-                response.pop("ResponseMetadata", None)
-                trails_data[trail_name] = fix_json(response)
-                pbar.update()
-
-        results = []
-        results.append(create_command("aws cloudtrail list-trails", trails))
-        results.append(
-            create_command("aws cloudtrail get-trail --name <name>", trails_data)
-        )
+        if journal:
+            journal.mark_done(self.region, "configuration", name, self.write_unit(REGISTRY[name].results or name))
 
-        self.results["cloudtrail"] = results
-        self.display_progress(len(results), "cloudtrail")
+        if over_memory_budget():
+            self.flush_results()
 
     def display_progress(self, count, name):
         """Display if the configuration of the given service worked.
@@ -1206,6 +840,8 @@ class Configuration:
         name : str
             Name of the service
         """
+        count_items("configuration", self.region, name, count)
+
         if count != 0:
             print(
                 "\t\u2705 "
@@ -1,10 +1,12 @@
 """File used for the enumeration."""
 
 from source.utils.enum import *
-from source.utils.utils import create_s3_if_not_exists, PREPARATION_BUCKET, ROOT_FOLDER, create_folder, set_clients, write_file, write_s3
+from source.utils.utils import create_s3_if_not_exists, ROOT_FOLDER, create_folder, set_clients, write_file, write_s3, read_s3, save_snapshot
 import source.utils.utils
+from source.utils.metrics import count_items
+from source.utils.instrument import timed_service
+from source.utils.registry import collectors, list_service, REGISTRY
 import json
-from time import sleep
 
 
 class Enumeration:
@@ -13,6 +15,7 @@ class Enumeration:
     bucket = ""
     region = None
     dl = None
+    written = None
 
     def __init__(self, region, dl):
         """Handle the constructor of the Enumeration class.
@@ -28,7 +31,7 @@ class Enumeration:
         self.region = region
 
         if not self.dl:
-            self.bucket = create_s3_if_not_exists(self.region, PREPARATION_BUCKET)
+            self.bucket = create_s3_if_not_exists(self.region, source.utils.utils.PREPARATION_BUCKET)
 
     def self_test(self):
         """Test function."""
@@ -49,365 +52,160 @@ class Enumeration:
         self.services : object
             Object where the results of the functions are written
         """
-        print(f"[+] Beginning Enumeration of Services")
+        self.begin(services)
 
-        set_clients(self.region)
+        for collector in collectors("enumeration", self.region, regionless):
+            self.run_service(collector)
 
-        self.services = services
+        return self.finish()
 
-        if (regionless != "" and regionless == self.region) or regionless == "not-all":
-            self.enumerate_s3()
-            self.enumerate_iam()   
-            self.enumerate_cloudtrail_trails()
-            self.enumerate_route53()
-
-        self.enumerate_wafv2()
-        self.enumerate_lambda()
-        self.enumerate_vpc()
-        self.enumerate_elasticbeanstalk()
-
-        self.enumerate_ec2()
-        self.enumerate_dynamodb()
-        self.enumerate_rds()
-        self.enumerate_eks()
-        self.enumerate_elasticsearch()
-        self.enumerate_secrets()
-        self.enumerate_kinesis()
-
-        self.enumerate_cloudwatch()
-        self.enumerate_guardduty()
-        self.enumerate_detective()
-        self.enumerate_inspector2()
-        self.enumerate_maciev2()
+    def begin(self, services):
+        """Start the enumeration in the region.
 
-        
-        if self.dl:
-            confs = ROOT_FOLDER + self.region + "/enumeration/"
-            create_folder(confs)
-            with tqdm(desc="[+] Writing results", leave=False, total = len(self.services)) as pbar:
-                for el in self.services:
-                    if self.services[el]["count"] > 0:
-                        write_file(
-                            confs + f"{el}.json",
-                            "w",
-                            json.dumps(self.services[el]["elements"], indent=4, default=str),
-                        )
-                    pbar.update() 
-                    sleep(0.1)
-            print(f"[+] Enumeration results stored in the folder {ROOT_FOLDER}{self.region}/enumeration/")
-        else:
-            with tqdm(desc="[+] Writing results", leave=False, total = len(self.services)) as pbar:
-                for key, value in self.services.items():
-                    if value["count"] > 0:
-                        write_s3(
-                            self.bucket,
-                            f"{self.region}/enumeration/{key}.json",
-                            json.dumps(value["elements"], indent=4, default=str)
-                        )
-                    pbar.update() 
-                    sleep(0.1)
-            print(f"[+] Enumeration results stored in the bucket {self.bucket}")
+        Parameters
+        ---------
+        services : list
+            Array used to write the results of the different enumerations functions
+        """
+        print(f"[+] Beginning Enumeration of Services")
 
-        return self.services
+        set_clients(self.region)
 
-    def enumerate_s3(self):
-        """Enumerate the s3 buckets available."""
-        elements  = s3_lookup()
+        self.services = services
+        self.written = set()
 
-        self.services["s3"]["count"] = len(elements)
-        self.services["s3"]["elements"] = elements
+    def run_service(self, collector):
+        """Enumerate a service, unless it was already done by the interrupted run being resumed.
 
-        identifiers = []
-        for el in elements:
-            identifiers.append(el["Name"])
+        Parameters
+        ----------
+        collector : Collector
+            Description of the service
+        """
+        self.run_unit(collector.name, self.enumerate_service, collector)
 
-        self.services["s3"]["ids"] = identifiers
+    def finish(self):
+        """Save the enumeration and write its results where asked.
 
-        self.display_progress(self.services["s3"]["ids"], "s3", True)
-   
-    def enumerate_wafv2(self):
-        """Enumerate the waf web acls available."""
-        elements = misc_lookup("WAF", source.utils.utils.WAF_CLIENT.list_web_acls, "NextMarker", "WebACLs", Scope="REGIONAL", Limit=100)
+        Returns
+        -------
+        self.services : object
+            Object where the results of the functions are written
+        """
+        save_snapshot(self.region, self.services)
 
-        self.services["wafv2"]["count"] = len(elements)
-        self.services["wafv2"]["elements"] = elements
+        # the services of a journaled run are written as soon as they are enumerated
+        with tqdm(desc="[+] Writing results", leave=False, total = len(self.services)) as pbar:
+            for el in self.services:
+                if el not in self.written:
+                    self.write_service(el)
+                pbar.update() 
 
-        identifiers = []
-        for el in elements:
-            identifiers.append(el["ARN"])
+        if self.dl:
+            print(f"[+] Enumeration results stored in the folder {ROOT_FOLDER}{self.region}/enumeration/")
+        else:
+            print(f"[+] Enumeration results stored in the bucket {self.bucket}")
 
-        self.services["wafv2"]["ids"] = identifiers
+        return self.services
 
-        self.display_progress(self.services["wafv2"]["ids"], "wafv2", True)
-    
-    def enumerate_lambda(self):
-        """Enumerate the lambdas available."""
-        elements = paginate(source.utils.utils.LAMBDA_CLIENT, "list_functions", "Functions")
+    def write_service(self, name):
+        """Write the elements of a service where asked.
 
-        self.services["lambda"]["count"] = len(elements)
-        self.services["lambda"]["elements"] = elements
+        Parameters
+        ----------
+        name : str
+            Name of the service
 
-        identifiers = []
-        for el in elements:
-            identifiers.append(el["FunctionName"])
+        Returns
+        -------
+        output : dict
+            Where the elements were written and how many there are
+        """
+        value = self.services[name]
+        output = {"count": value["count"]}
+
+        if value["count"] > 0:
+            content = json.dumps(value["elements"], indent=4, default=str)
+            if self.dl:
+                confs = ROOT_FOLDER + self.region + "/enumeration/"
+                create_folder(confs)
+                write_file(confs + f"{name}.json", "w", content)
+                output["file"] = confs + f"{name}.json"
+            else:
+                write_s3(self.bucket, f"{self.region}/enumeration/{name}.json", content)
+                output.update({"bucket": self.bucket, "key": f"{self.region}/enumeration/{name}.json"})
 
-        self.services["lambda"]["ids"] = identifiers
+        self.written.add(name)
+        return output
 
-        self.display_progress(self.services["lambda"]["ids"], "lambda", True)
-    
-    def enumerate_vpc(self):
-        """Enumerate the vpcs available."""
-        elements = paginate(source.utils.utils.EC2_CLIENT, "describe_vpcs", "Vpcs")
+    def read_service(self, name, output):
+        """Read back the elements of a service written by the interrupted run being resumed.
 
-        self.services["vpc"]["count"] = len(elements)
-        self.services["vpc"]["elements"] = elements
+        Parameters
+        ----------
+        name : str
+            Name of the service
+        output : dict
+            Where the elements were written and how many there are
 
-        identifiers = []
-        for el in elements:
-            identifiers.append(el["VpcId"])
+        Returns
+        -------
+        service : dict
+            Count, elements and identifiers of the service
+        """
+        elements = []
+        if "file" in output:
+            with open(output["file"], "rt") as f:
+                elements = json.loads(f.read())
+        elif "key" in output:
+            elements = json.loads(read_s3(output["bucket"], output["key"]))
 
-        self.services["vpc"]["ids"] = identifiers
+        id_key = REGISTRY[name].id_key
+        ids = list(elements) if id_key is None else [element[id_key] for element in elements]
+        return {"count": output["count"], "elements": elements, "ids": ids}
 
-        self.display_progress(self.services["vpc"]["ids"], "vpc", True)
+    def enumerate_service(self, collector):
+        """Enumerate the elements of a service, as described by the registry.
 
-    def enumerate_elasticbeanstalk(self):
-        """Enumerate the elasticbeanstalk environments available."""
-        elements = paginate(source.utils.utils.EB_CLIENT, "describe_environments", "Environments")
-        
-        self.services["elasticbeanstalk"]["count"] = len(elements)
-        self.services["elasticbeanstalk"]["elements"] = elements
+        Parameters
+        ----------
+        collector : Collector
+            Description of the service
+        """
+        elements, identifiers = list_service(collector)
 
-        identifiers = []
-        for el in elements:
-            identifiers.append(el["EnvironmentArn"])
+        self.services[collector.name]["count"] = len(elements)
+        self.services[collector.name]["elements"] = elements
+        self.services[collector.name]["ids"] = identifiers
 
-        self.services["elasticbeanstalk"]["ids"] = identifiers
+        self.display_progress(identifiers, collector.name, not collector.list_ids)
 
-        self.display_progress(
-            self.services["elasticbeanstalk"]["ids"], "elasticbeanstalk", True
-        )
-   
-    def enumerate_route53(self):
-        """Enumerate the routes53 hosted zones available."""
-        elements = paginate(source.utils.utils.ROUTE53_CLIENT, "list_hosted_zones", "HostedZones")
+    def run_unit(self, name, func, *args):
+        """Run the enumeration function of a service, unless it was already completed by the interrupted run being resumed.
 
-        self.services["route53"]["count"] = len(elements)
-        self.services["route53"]["elements"] = elements
+        Parameters
+        ----------
+        name : str
+            Name of the service
+        func : function
+            Enumeration function of the service
+        *args : list
+            List of args of the function, optional
+        """
+        journal = source.utils.utils.JOURNAL
 
-        identifiers = []
-        for el in elements:
-            identifiers.append(el["Id"])
+        if journal and journal.is_done(self.region, "enumeration", name):
+            self.services[name] = self.read_service(name, journal.output(self.region, "enumeration", name))
+            self.written.add(name)
+            self.display_progress(self.services[name]["ids"], name, True)
+            return
 
-        self.services["route53"]["ids"] = identifiers
+        with timed_service("enumeration", self.region, name):
+            func(*args)
 
-        self.display_progress(self.services["route53"]["ids"], "route53", True)
-  
-    def enumerate_ec2(self):
-        """Enumerate the ec2 instances available."""
-        elements = ec2_lookup()
-        
-        self.services["ec2"]["count"] = len(elements)
-        self.services["ec2"]["elements"] = elements
+        if journal:
+            journal.mark_done(self.region, "enumeration", name, self.write_service(name))
 
-        
-        identifiers = []
-        for el in elements:
-            identifiers.append(el["InstanceId"])
-
-        self.services["ec2"]["ids"] = identifiers
-     
-        self.display_progress(self.services["ec2"]["ids"], "ec2", True)
-   
-    def enumerate_iam(self):
-        """Enumerate the IAM users available."""
-        elements = paginate(source.utils.utils.IAM_CLIENT, "list_users", "Users")
-
-        self.services["iam"]["count"] = len(elements)
-        self.services["iam"]["elements"] = elements
-
-        identifiers = []
-        for el in elements:
-            identifiers.append(el["Arn"])
-
-        self.services["iam"]["ids"] = identifiers
-
-        self.display_progress(self.services["iam"]["ids"], "iam", True)
-    
-    def enumerate_dynamodb(self):
-        """Enumerate the dynamodb tables available."""
-        elements = paginate(source.utils.utils.DYNAMODB_CLIENT, "list_tables", "TableNames")
-
-        self.services["dynamodb"]["count"] = len(elements)
-        self.services["dynamodb"]["elements"] = elements
-
-        identifiers = elements
-
-        self.services["dynamodb"]["ids"] = identifiers
-
-        self.display_progress(self.services["dynamodb"]["ids"], "dynamodb", True)
-  
-    def enumerate_rds(self):
-        """Enumerate the rds instances available."""
-        elements = paginate(source.utils.utils.RDS_CLIENT, "describe_db_instances", "DBInstances")
-
-        self.services["rds"]["count"] = len(elements)
-        self.services["rds"]["elements"] = elements
-
-        identifiers = []
-        for el in elements:
-            identifiers.append(el["DBInstanceArn"])
-
-        self.services["rds"]["ids"] = identifiers
-
-        self.display_progress(self.services["rds"]["ids"], "rds", True)
-    
-    def enumerate_eks(self):
-        """Enumerate the eks clusters available."""
-        elements = paginate(source.utils.utils.EKS_CLIENT, "list_clusters", "clusters")
-
-        self.services["eks"]["count"] = len(elements)
-        self.services["eks"]["elements"] = elements
-
-        identifiers = []
-        for el in elements:
-            identifiers.append(el)
-
-        self.services["eks"]["ids"] = identifiers
-
-        self.display_progress(self.services["eks"]["ids"], "eks", True)
-    
-    def enumerate_elasticsearch(self):
-        """Enumerate the elasticsearch domains available."""
-        response = try_except(source.utils.utils.ELS_CLIENT.list_domain_names)
-        response.pop("ResponseMetadata", None)
-        response = fix_json(response)
-        elements = response.get("DomainNames", [])
-
-        self.services["els"]["count"] = len(elements)
-        self.services["els"]["elements"] = elements
-
-        identifiers = []
-        for el in elements:
-            identifiers.append(el["DomainName"])
-
-        self.services["els"]["ids"] = identifiers
-
-        self.display_progress(self.services["els"]["ids"], "els", True)
-    
-    def enumerate_secrets(self):
-        """Enumerate the secretsmanager secrets available."""
-        elements = paginate(source.utils.utils.SECRETS_CLIENT, "list_secrets", "SecretList")
-            
-        self.services["secrets"]["count"] = len(elements)
-        self.services["secrets"]["elements"] = elements
-                
-        identifiers = []
-        for el in elements:
-            identifiers.append(el["ARN"])
-
-        self.services["secrets"]["ids"] = identifiers
-
-        self.display_progress(self.services["secrets"]["ids"], "secrets", True)
-    
-    def enumerate_kinesis(self):
-        """Enumerate the kinesis streams available."""
-        elements = paginate(source.utils.utils.KINESIS_CLIENT, "list_streams", "StreamNames")
-                    
-        self.services["kinesis"]["count"] = len(elements)
-        self.services["kinesis"]["elements"] = elements
-
-        self.services["kinesis"]["ids"] = elements
-
-        self.display_progress(self.services["kinesis"]["ids"], "kinesis", True)
-   
-    def enumerate_cloudwatch(self):
-        """Enumerate the cloudwatch dashboards available."""
-        elements = paginate(source.utils.utils.CLOUDWATCH_CLIENT, "list_dashboards", "DashboardEntries")
-
-        self.services["cloudwatch"]["count"] = len(elements)
-        self.services["cloudwatch"]["elements"] = elements
-       
-        identifiers = []
-        for el in elements:
-            identifiers.append(el["DashboardArn"])
-
-        self.services["cloudwatch"]["ids"] = identifiers
-
-        self.display_progress(self.services["cloudwatch"]["ids"], "cloudwatch", True)
-   
-    def enumerate_cloudtrail_trails(self):
-        """Enumerate the cloudtrail trails available."""
-        elements = paginate(source.utils.utils.CLOUDTRAIL_CLIENT, "list_trails", "Trails")
-
-        self.services["cloudtrail"]["count"] = len(elements)
-        self.services["cloudtrail"]["elements"] = elements
-
-        identifiers = []
-        for el in elements:
-            identifiers.append(el["Name"])
-
-        self.services["cloudtrail"]["ids"] = identifiers
-
-        self.display_progress(self.services["cloudtrail"]["ids"], "cloudtrail", True)
-    
-    def enumerate_guardduty(self):
-        """Enumerate the guardduty detectors available."""
-        elements = paginate(source.utils.utils.GUARDDUTY_CLIENT, "list_detectors", "DetectorIds")
-
-        self.services["guardduty"]["count"] = len(elements)
-        self.services["guardduty"]["elements"] = elements
-
-        identifiers = elements
-
-        self.services["guardduty"]["ids"] = identifiers
-
-        self.display_progress(self.services["guardduty"]["ids"], "guardduty", True)
-    
-    def enumerate_inspector2(self):
-        """Enumerate the inspector coverages available."""
-        elements = paginate(source.utils.utils.INSPECTOR_CLIENT, "list_coverage", "coveredResources")
- 
-        self.services["inspector"]["count"] = len(elements)
-        self.services["inspector"]["elements"] = elements
-
-        identifiers = []
-        for el in elements:
-            identifiers.append(el["resourceId"])
-
-        self.services["inspector"]["ids"] = identifiers
-
-        self.display_progress(self.services["inspector"]["ids"], "inspector", False)
-    
-    def enumerate_detective(self):
-        """Enumerate the detective graphs available."""
-        elements = misc_lookup("DETECTIVE", source.utils.utils.DETECTIVE_CLIENT.list_graphs, "NextToken", "GraphList", MaxResults=100)
-    
-        self.services["detective"]["count"] = len(elements)
-        self.services["detective"]["elements"] = elements
-
-        identifiers = []
-        for el in elements:
-            identifiers.append(el["Arn"])
-
-        self.services["detective"]["ids"] = identifiers
-
-        self.display_progress(self.services["detective"]["ids"], "detective", True)
-    
-    def enumerate_maciev2(self):
-        """Enumerate the macie buckets available."""
-        elements = paginate(source.utils.utils.MACIE_CLIENT, "describe_buckets", "buckets")
-
-        self.services["macie"]["count"] = len(elements)
-        self.services["macie"]["elements"] = elements
-
-        identifiers = []
-        for el in elements:
-            identifiers.append(el["bucketArn"])
-
-        self.services["macie"]["ids"] = identifiers
-
-        self.display_progress(self.services["macie"]["ids"], "macie", True)
- 
     def display_progress(self, ids, name, no_list=False):
         """Display the progress and the content of the service.
 
@@ -420,6 +218,8 @@ class Enumeration:
         no_list : bool
             True if we don't want the name of each identifiers to be printed out. False otherwise
         """
+        count_items("enumeration", self.region, name, len(ids))
+
         if len(ids) != 0:
             if no_list:
                 print("\t\u2705 " + name.upper() + "\033[1m" + " - Available")
@@ -4,11 +4,17 @@ from source.main.enumeration import Enumeration
 from source.main.configuration import Configuration
 from source.main.logs import Logs
 from source.main.analysis import Analysis
-from source.utils.utils import ENUMERATION_SERVICES, BOLD, ENDC
+from source.utils.utils import ENUMERATION_SERVICES, BOLD, ENDC, load_snapshot
+import source.utils.utils
+from source.utils.instrument import timed_step
+from source.utils.registry import collectors
+from source.utils.scheduler import run_graph
+from functools import partial
 
 class IR:
 
     services = None
+    region = None
     e = None
     c = None
     l = None
@@ -42,6 +48,8 @@ class IR:
             Contains the sql requirements to query the logs
         """
         print(f"\n[+] Working on region {BOLD}{region}{ENDC}")
+
+        self.region = region
         
         if "4" in steps:
             self.a = Analysis(region, dl)
@@ -60,6 +68,14 @@ class IR:
 
             if "1" in steps:
                 self.e = Enumeration(region, dl)
+            else:
+                # the enumeration of a recent run is reused instead of listing the services again
+                # the services of the previous region are forgotten, as they are shared between the regions
+                snapshot = load_snapshot(region)
+                for name in self.services:
+                    self.services[name] = snapshot.get(name, {"count": -1, "elements": [], "ids": []})
+                if snapshot:
+                    print(f"[+] Reusing the enumeration of {len(snapshot)} services from a previous run")
             if "2" in steps:
                 self.c = Configuration(region, dl)
             if "3" in steps:
@@ -73,7 +89,8 @@ class IR:
         regionless : str
             'not-all' if the tool is used on only one region. First region to run the tool on otherwise
         """
-        self.services = self.e.execute(self.services, regionless)
+        with timed_step("enumeration", self.region):
+            self.services = self.e.execute(self.services, regionless)
 
     def execute_configuration(self, regionless):
         """Run the configuration main function.
@@ -83,7 +100,8 @@ class IR:
         regionless : str
             'not-all' if the tool is used on only one region. First region to run the tool on otherwise
         """
-        self.c.execute(self.services, regionless)
+        with timed_step("configuration", self.region):
+            self.c.execute(self.services, regionless)
 
     def execute_logs(self, regionless, start, end):
         """Run the logs extraction main function.
@@ -97,7 +115,46 @@ class IR:
         end : str
             End date of the logs collected
         """
-        self.l.execute(self.services, regionless, start, end)
+        with timed_step("logs", self.region):
+            self.l.execute(self.services, regionless, start, end)
+
+    def execute_graph(self, regionless, start, end):
+        """Run the steps 1, 2 and 3 as a graph of services (--schedule graph).
+        The configuration and the logs of a service start as soon as its enumeration is done, instead of waiting for the enumeration of every service.
+        
+        Parameters
+        ----------
+        regionless : str
+            'not-all' if the tool is used on only one region. First region to run the tool on otherwise
+        start : str
+            Start date of the logs collected
+        end : str
+            End date of the logs collected
+        """
+        stages = [(step, runner) for step, runner in (("enumeration", self.e), ("configuration", self.c), ("logs", self.l)) if runner is not None]
+
+        if self.e:
+            self.e.begin(self.services)
+        if self.c:
+            self.c.begin(self.services)
+        if self.l:
+            self.l.begin(self.services, start, end)
+
+        '''
+        A node is a service in a step. It needs the first node of the same service in the previous steps : its enumeration or, without step 1, its configuration, which lists the service again.
+        The results of a step are written once all its nodes are done.
+        '''
+        nodes = {}
+        for step, runner in stages:
+            keys = []
+            for collector in collectors(step, self.region, regionless):
+                previous = [(name, collector.name) for name, _ in stages if (name, collector.name) in nodes][:1]
+                nodes[(step, collector.name)] = (partial(runner.run_service, collector), previous)
+                keys.append((step, collector.name))
+            nodes[(step, "results")] = (runner.finish, keys)
+
+        with timed_step("+".join(step for step, _ in stages), self.region):
+            run_graph(nodes, source.utils.utils.WORKERS)
 
     def execute_analysis(self, queryfile, exists, timeframe):
         """Run the logs analysis main function.
@@ -111,4 +168,5 @@ class IR:
         timeframe : str
             Timeframe used in the query to filter results
         """
-        self.a.execute(self.source, self.output, self.catalog, self.database, self.table, queryfile, exists, timeframe)
\ No newline at end of file
+        with timed_step("analysis", self.region):
+            self.a.execute(self.source, self.output, self.catalog, self.database, self.table, queryfile, exists, timeframe)
\ No newline at end of file
@@ -1,16 +1,24 @@
 """File used for the logs collection
 """
 
-import datetime
+import datetime, gc, threading
 from sys import exit
 from json import loads, dumps
 from time import sleep
-from os import remove, rmdir
-from requests import get
+from os import remove
+from os.path import isfile, dirname
+from requests import Session
+from requests.adapters import HTTPAdapter
 
 import source.utils.utils
-from source.utils.utils import write_file, create_folder, copy_or_write_s3, create_command, writefile_s3, LOGS_RESULTS, create_s3_if_not_exists, LOGS_BUCKET, ROOT_FOLDER, set_clients, write_or_dl, write_s3, athena_query
+from source.utils.utils import write_file, create_folder, copy_or_write_s3, create_command, writefile_s3, LOGS_RESULTS, create_s3_if_not_exists, ROOT_FOLDER, set_clients, write_or_dl, write_s3, athena_query, get_account_id, guardduty_criteria, macie_criteria, GUARDDUTY_FINDINGS_BATCH, MACIE_FINDINGS_BATCH, EB_POLL_DELAY, EB_BUNDLE_TIMEOUT
 from source.utils.enum import *
+from source.utils.metrics import count_items
+from source.utils.instrument import timed_service, over_memory_budget
+from source.utils.registry import collectors, enumerated
+
+# the services can be collected at the same time (--schedule graph), their results are stored and taken out to be written under this lock
+FLUSH_LOCK = threading.Lock()
 
 
 class Logs:
@@ -20,6 +28,8 @@ class Logs:
     dl = None
     confs = None
     results = None
+    start = None
+    end = None
 
     def __init__(self, region, dl):
         """Constructor of the Logs Collection class
@@ -38,7 +48,7 @@ class Logs:
 
         #Also created for cloudtrail-logs results
         self.confs = ROOT_FOLDER + self.region + "/logs"
-        self.bucket = create_s3_if_not_exists(self.region, LOGS_BUCKET)
+        self.bucket = create_s3_if_not_exists(self.region, source.utils.utils.LOGS_BUCKET)
 
         if self.dl:
             create_folder(self.confs)
@@ -63,100 +73,174 @@ class Logs:
         end : str  
             End time for logs collection
         """
-        
+        self.begin(services, start, end)
+
+        for collector in collectors("logs", self.region, regionless):
+            self.run_service(collector)
+
+        self.finish()
+
+    def begin(self, services, start, end):
+        """Start the logs extraction in the region
+
+        Parameters
+        ----------
+        services : list
+            Results of the enumeration, used to know the elements of each service
+        start : str
+            Start time for logs collection
+        end : str  
+            End time for logs collection
+        """
         print(f"[+] Beginning Logs Extraction")
 
         set_clients(self.region)
 
         self.services = services
+        self.start = start
+        self.end = end
 
-        if regionless == self.region or regionless == "not-all":
-            self.get_logs_s3()
-            self.get_logs_cloudtrail_logs(start, end)
+    def run_service(self, collector):
+        """Extract the logs of a service, unless it was already done by the interrupted run being resumed
 
-        self.get_logs_wafv2()
-        self.get_logs_vpc()
-        self.get_logs_elasticbeanstalk()
-    
-        self.get_logs_route53()
-        self.get_logs_rds()
+        Parameters
+        ----------
+        collector : Collector
+            Description of the service
+        """
+        args = (self.start, self.end) if collector.time_window else ()
+        self.run_unit(collector.name, getattr(self, "get_logs_" + collector.name.replace("-", "_")), *args)
+
+    def finish(self):
+        """Write the logs extracted where asked
+        """
+        with tqdm(desc="[+] Writing results", leave=False, total = len(self.results)) as pbar:
+            for key, value in self.results.items():
+                self.write_result(key, value)
+                pbar.update() 
+           
+        print(f"[+] Logs extraction results stored in the bucket {self.bucket}")
+
+    def write_result(self, key, value):
+        """Write the logs of a service where asked. The cloudtrail logs are written in the bucket in any case, for the analysis.
 
-        self.get_logs_cloudwatch()
-        self.get_logs_guardduty()
-        self.get_logs_inspector2()
-        self.get_logs_maciev2()
+        Parameters
+        ----------
+        key : str
+            Name of the service
+        value : dict
+            Logs of the service or buckets where they are stored, based on the const LOGS_RESULTS
+        """
+        if not value["results"]:
+            return
+
+        if key != "cloudtrail-logs":
+            if self.dl:
+                write_or_dl(key, value, self.confs)
+            else:
+                copy_or_write_s3(key, value, self.bucket, self.region)
+            return
 
         if self.dl:
-            with tqdm(desc="[+] Writing results", leave=False, total = len(self.results)) as pbar:
-                for key, value in self.results.items():
-                    if value["results"] and key != "cloudtrail-logs":
-                        write_or_dl(key, value, self.confs)
-                    elif key == "cloudtrail-logs":
-                        for el in value["results"]:
-                            trail = el["CloudTrailEvent"]
-                            obj = loads(trail)
-                            dump = dumps(obj, default=str)
-                            create_folder(f"{self.confs}/cloudtrail-logs/")
-                            write_file(
-                                f"{self.confs}/cloudtrail-logs/{obj['eventID']}.json",
-                                "w",
-                                dump,
-                            )
-                    pbar.update() 
-                    sleep(0.1)
+            create_folder(f"{self.confs}/cloudtrail-logs/")
+
+        with tqdm(desc="[+] Writing cloudtrail logs", leave=False, total = len(value["results"])) as pbar:
+            for el in value["results"]:
+                trail = el["CloudTrailEvent"]
+                obj = loads(trail)
+                dump = dumps(obj, default=str)
+
+                if self.dl:
+                    write_file(
+                        f"{self.confs}/cloudtrail-logs/{obj['eventID']}.json",
+                        "w",
+                        dump,
+                    )
+                write_s3(
+                    self.bucket,
+                    f"{self.region}/logs/cloudtrail-logs/{obj['eventID']}.json",
+                    dump,
+                ) 
+                pbar.update() 
+
+        # the high-water mark only moves once the events are written, a failed write leaving them to the next run
+        if source.utils.utils.INCREMENTAL:
+            account = get_account_id()
+            self.set_high_water_mark(account, value["results"], self.get_high_water_mark(account))
 
+    def write_unit(self, name):
+        """Write the logs of a completed service where asked and forget them, so a resumed run can skip the service.
+
+        Parameters
+        ----------
+        name : str
+            Name of the service
+
+        Returns
+        -------
+        output : dict
+            Where the logs were written and how many elements they contain
+        """
+        # the logs are taken out under the lock, so a flush of another service can't write them too
+        with FLUSH_LOCK:
+            value = self.results.get(name)
+            if not value or not value["results"]:
+                return {"count": 0}
+            value = {"action": value["action"], "results": value["results"]}
+            self.results[name]["results"] = []
+
+        output = {"count": len(value["results"])}
+        if self.dl:
+            output["folder"] = self.confs
         else:
-            with tqdm(desc="[+] Writing results", leave=False, total = len(self.results)) as pbar:
-                for key, value in self.results.items():
-                    if value["results"] and key != "cloudtrail-logs":
-                        copy_or_write_s3(key, value, self.bucket, self.region)
-                    pbar.update() 
-                    sleep(0.1)
-
-        # cloudtrail-logs has to be done in any case for further analysis
-        if self.results["cloudtrail-logs"]["results"]:
-            res = self.results["cloudtrail-logs"]["results"]
-
-            with tqdm(desc="[+] Writing results", leave=False, total = len(self.results["cloudtrail-logs"]["results"])) as pbar:
-                for el in res:
-
-                    trail = el["CloudTrailEvent"]
-                    obj = loads(trail)
-                    dump = dumps(obj, default=str)
-                    write_s3(
-                        self.bucket,
-                        f"{self.region}/logs/cloudtrail-logs/{obj['eventID']}.json",
-                        dump,
-                    ) 
-                    pbar.update() 
-                    sleep(0.1)
-           
-        print(f"[+] Logs extraction results stored in the bucket {self.bucket}")
+            output.update({"bucket": self.bucket, "prefix": f"{self.region}/logs/"})
+
+        self.write_result(name, value)
+        return output
+
+    def set_result(self, name, action, results):
+        """Store the logs of a service, under the lock of the writes as the services can be collected at the same time.
+
+        Parameters
+        ----------
+        name : str
+            Name of the service
+        action : int
+            0 if the results are the logs, 1 if they are the buckets where the logs are stored
+        results : list
+            Logs of the service or buckets where they are stored
+        """
+        with FLUSH_LOCK:
+            self.results[name]["action"] = action
+            self.results[name]["results"] = results
+
+    def flush_results(self):
+        """Write the logs collected so far and forget them, when the memory budget is exceeded."""
+        flushed = 0
+        with FLUSH_LOCK:
+            for key, value in self.results.items():
+                if value["results"]:
+                    self.write_result(key, value)
+                    value["results"] = []
+                    flushed += 1
+        if flushed:
+            gc.collect()
+            print(f"[+] Memory budget exceeded, the logs of {flushed} services were written and released")
   
     def get_logs_guardduty(self):
         """Retrieve the logs of the existing guardduty detectors
         """
 
-        guardduty_list = self.services["guardduty"]
-
         '''
         In the first part, we verify that the enumeration of the service is already done. 
         If it doesn't, we redo it.
         If it is, we verify if the service is available or not.
         '''
 
-        if guardduty_list["count"] == -1:
-            detector_ids = paginate(source.utils.utils.GUARDDUTY_CLIENT, "list_detectors", "DetectorIds")
-
-            if len(detector_ids) == 0:
-                self.display_progress(0, "guardduty")
-                return
-
-        elif guardduty_list["count"] == 0:
+        elements, detector_ids = enumerated(self.services, "guardduty")
+        if elements is None:
             self.display_progress(0, "guardduty")
             return
-        else:
-            detector_ids = guardduty_list["ids"]
 
         '''
         In this part, we get the logs of the service (if existing)
@@ -164,17 +248,19 @@ class Logs:
         '''
 
         findings_data = {}
-        with tqdm(desc="[+] Getting GUARDDUTY logs", leave=False, total = len(detector_ids)) as pbar:
-            for detector in detector_ids:
-                findings = paginate(source.utils.utils.GUARDDUTY_CLIENT, "list_findings", "FindingIds", DetectorId=detector)
-
-                response = try_except(
-                    source.utils.utils.GUARDDUTY_CLIENT.get_findings, DetectorId=detector, FindingIds=findings
-                )
-                response.pop("ResponseMetadata", None)
-                response = fix_json(response)
-                findings_data[detector] = response
-                pbar.update()
+        for detector in detector_ids:
+            findings = paginate(source.utils.utils.GUARDDUTY_CLIENT, "list_findings", "FindingIds", DetectorId=detector, **guardduty_criteria())
+
+            findings_data[detector] = self.stream_findings(
+                f"guardduty-findings-{detector}",
+                "GUARDDUTY",
+                source.utils.utils.GUARDDUTY_CLIENT.get_findings,
+                "FindingIds",
+                findings,
+                GUARDDUTY_FINDINGS_BATCH,
+                "Findings",
+                DetectorId=detector
+            )
 
         results = []
         results.append(
@@ -184,8 +270,7 @@ class Logs:
             )
         )
 
-        self.results["guardduty"]["action"] = 0
-        self.results["guardduty"]["results"] = results
+        self.set_result("guardduty", 0, results)
 
         self.display_progress(len(results), "guardduty")
 
@@ -200,7 +285,7 @@ class Logs:
             End time for logs collection
         """
 
-        trails_name = paginate(source.utils.utils.CLOUDTRAIL_CLIENT, "list_trails", "Trails")
+        trails_name = global_paginate(source.utils.utils.CLOUDTRAIL_CLIENT, "list_trails", "Trails")
         if trails_name:
             if len(trails_name) == 1:
                 response = source.utils.utils.CLOUDTRAIL_CLIENT.get_trail(Name=trails_name["TrailARN"])
@@ -233,88 +318,143 @@ class Logs:
 
         else:
 
-            start_date = start.split("-")
-            end_date = end.split("-")
-            datetime_start = datetime.datetime(int(start_date[0]), int(start_date[1]), int(start_date[2]))
-            datetime_end = datetime.datetime(int(end_date[0]), int(end_date[1]), int(end_date[2]))
+            datetime_start = None
+            if start != None:
+                start_date = start.split("-")
+                datetime_start = datetime.datetime(int(start_date[0]), int(start_date[1]), int(start_date[2]))
+
+            if end != None:
+                end_date = end.split("-")
+                datetime_end = datetime.datetime(int(end_date[0]), int(end_date[1]), int(end_date[2]))
+            else:
+                datetime_end = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+            '''
+            In incremental mode, only the events since the high-water mark of the previous collection are queried.
+            The events of the mark itself are queried again (StartTime is inclusive) and removed thanks to their ids.
+            Without -start, the events are queried from the mark, the first collection of the account and region needing -start.
+            '''
+
+            mark = None
+            if source.utils.utils.INCREMENTAL:
+                account = get_account_id()
+                mark = self.get_high_water_mark(account)
+                if mark:
+                    mark_time = datetime.datetime.fromisoformat(mark["event_time"]).replace(tzinfo=None)
+                    if datetime_start is None or mark_time > datetime_start:
+                        datetime_start = mark_time
+
+            if datetime_start is None:
+                print("[!] Error : No Cloudtrail logs were collected yet in this account and region, -start is needed")
+                self.display_progress(0, "cloudtrail-logs")
+                return
             
             logs = paginate(source.utils.utils.CLOUDTRAIL_CLIENT, "lookup_events", "Events", StartTime=datetime_start, EndTime=datetime_end)
 
+            if mark:
+                logs = [log for log in logs if log["EventId"] not in mark["event_ids"]]
+
             if len(logs) == 0:
                 self.display_progress(0, "cloudtrail")
                 return
             
-            self.results["cloudtrail-logs"]["action"] = 0
-            self.results["cloudtrail-logs"]["results"] = logs
+            self.set_result("cloudtrail-logs", 0, logs)
 
             self.display_progress(1, "cloudtrail-logs")
 
-    def get_logs_wafv2(self):
-        """Retrieve the logs of the existing waf web acls
+    def get_high_water_mark(self, account):
+        """Return the high-water mark of the cloudtrail logs collected by the previous runs in the account and region.
+
+        Parameters
+        ----------
+        account : str
+            Id of the account
+
+        Returns
+        -------
+        mark : dict
+            Time of the last collected event and ids of the events collected at this time. None if nothing was collected yet
         """
+        file = f"{self.confs}/cloudtrail-logs-{account}.hwm.json"
+
+        if not isfile(file):
+            return None
+
+        with open(file, "rt") as f:
+            return loads(f.read())
 
-        waf_list = self.services["wafv2"]
+    def set_high_water_mark(self, account, logs, mark):
+        """Move the high-water mark of the account and region to the last of the collected events.
 
-        if waf_list["count"] == -1:
-            wafs = misc_lookup("WAF", source.utils.utils.WAF_CLIENT.list_web_acls, "NextMarker", "WebACLs", Scope="REGIONAL", Limit=100)
+        Parameters
+        ----------
+        account : str
+            Id of the account
+        logs : list
+            Events collected by lookup_events and written
+        mark : dict
+            Previous high-water mark. None if there is none
+        """
+        last_time = max(datetime.datetime.fromisoformat(str(log["EventTime"])) for log in logs)
+        event_ids = [log["EventId"] for log in logs if datetime.datetime.fromisoformat(str(log["EventTime"])) == last_time]
 
-            if len(wafs) == 0:
-                self.display_progress(0, "wafv2")
+        if mark:
+            mark_time = datetime.datetime.fromisoformat(mark["event_time"])
+            if mark_time > last_time:
                 return
+            if mark_time == last_time:
+                event_ids.extend(mark["event_ids"])
+
+        create_folder(self.confs)
+        write_file(
+            f"{self.confs}/cloudtrail-logs-{account}.hwm.json",
+            "w",
+            dumps({"account": account, "region": self.region, "event_time": str(last_time), "event_ids": event_ids}, indent=4),
+        )
 
-            identifiers = []
-            for el in wafs:
-                identifiers.append(el["ARN"])
+    def get_logs_wafv2(self):
+        """Retrieve the logs of the existing waf web acls
+        """
 
-        elif waf_list["count"] == 0:
+        elements, identifiers = enumerated(self.services, "wafv2")
+        if elements is None:
             self.display_progress(0, "wafv2")
             return
-        else:
-            identifiers = waf_list["ids"]
-            return identifiers
 
         cnt = 0
 
-        self.results["wafv2"]["action"] = 1
+        buckets = []
 
-        with tqdm(desc="[+] Getting WAF logs", leave=False, total = len(identifiers)) as pbar:
-            for arn in identifiers:
-                logging = try_except(source.utils.utils.WAF_CLIENT.get_logging_configuration, ResourceArn=arn)
-                if "LoggingConfiguration" in logging:
-                    destinations = logging["LoggingConfiguration"]["LogDestinationConfigs"]
-                    for destination in destinations:
-                        if "s3" in destination:
-                            bucket = destination.split(":")[-1]
-                            src_bucket = bucket.split("/")[0]
+        loggings = fetch_details("WAF", source.utils.utils.WAF_CLIENT.get_logging_configuration, identifiers, "ResourceArn")
 
-                            self.results["wafv2"]["results"].append(src_bucket)
+        for logging in loggings.values():
+            if "LoggingConfiguration" in logging:
+                destinations = logging["LoggingConfiguration"]["LogDestinationConfigs"]
+                for destination in destinations:
+                    if "s3" in destination:
+                        bucket = destination.split(":")[-1]
+                        src_bucket = bucket.split("/")[0]
 
-                            cnt += 1
-                pbar.update()
+                        buckets.append(src_bucket)
+
+                        cnt += 1
 
+        self.set_result("wafv2", 1, buckets)
         self.display_progress(cnt, "wafv2")
 
     def get_logs_vpc(self):
         """Retrieve the logs of the existing vpcs
         """
 
-        vpc_list = self.services["vpc"]
-
-        if vpc_list["count"] == -1:
-            vpcs = paginate(source.utils.utils.EC2_CLIENT, "describe_vpcs", "Vpcs")
-
-            if len(vpcs) == 0:
-                self.display_progress(0, "vpc")
-                return
-
-        elif vpc_list["count"] == 0:
+        elements, _ = enumerated(self.services, "vpc")
+        if elements is None:
             self.display_progress(0, "vpc")
             return
 
         flow_logs = paginate(source.utils.utils.EC2_CLIENT, "describe_flow_logs", "FlowLogs")
         cnt = 0
 
-        self.results["vpc"]["action"] = 1
+        buckets = []
 
         with tqdm(desc="[+] Getting VPC logs", leave=False, total = len(flow_logs)) as pbar:
             for flow_log in flow_logs:
@@ -322,9 +462,11 @@ class Logs:
                     bucket = flow_log["LogDestination"].split(":")[-1]
                     src_bucket = bucket.split("/")[0]
 
-                    self.results["vpc"]["results"].append(src_bucket)
+                    buckets.append(src_bucket)
                     cnt += 1
                 pbar.update()
+
+        self.set_result("vpc", 1, buckets)
         self.display_progress(cnt, "vpc")
     
     def get_logs_elasticbeanstalk(self):
@@ -333,95 +475,132 @@ class Logs:
 
         eb = source.utils.utils.EB_CLIENT 
 
-        eb_list = self.services["elasticbeanstalk"]
-
-        if eb_list["count"] == -1:
-
-            environments = paginate(source.utils.utils.EB_CLIENT, "describe_environments", "Environments")
+        environments, _ = enumerated(self.services, "elasticbeanstalk")
+        if environments is None:
+            self.display_progress(0, "elasticbeanstalk")
+            return
 
-            if len(environments) == 0:
-                self.display_progress(0, "elasticbeanstalk")
-                return
+        names = [environment.get("EnvironmentName", "") for environment in environments]
+        names = [name for name in names if name != ""]
 
-        elif eb_list["count"] == 0:
+        # the bundles are downloaded from urls outside of the api, they can't be replayed
+        if source.utils.utils.STORE and source.utils.utils.STORE.replaying:
+            print("[+] The bundles of elasticbeanstalk are not collected when the responses are replayed")
             self.display_progress(0, "elasticbeanstalk")
             return
-        else:
-            environments = eb_list["elements"]
 
-        path = self.confs + "elasticbeanstalk/"
-        create_folder(path)
+        path = f"{self.confs}/elasticbeanstalk/"
+        if self.dl:
+            create_folder(path)
 
-        with tqdm(desc="[+] Getting ELASTICBEANSTALK logs", leave=False, total = len(environments)) as pbar:
-            for environment in environments:
-                name = environment.get("EnvironmentName", "")
-                if name == "":
-                    continue
+        '''
+        The bundles of every environment are requested at once.
+        Then they are polled until their url appears and downloaded concurrently.
+        '''
 
-                response = try_except(
-                    eb.request_environment_info, EnvironmentName=name, InfoType="bundle"
-                )
-                response.pop("ResponseMetadata", None)
-                response = fix_json(response)
-                sleep(60)
+        requested = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=1)
+        fetch_details("ELASTICBEANSTALK", eb.request_environment_info, names, "EnvironmentName", InfoType="bundle")
 
-                response = try_except(
-                    eb.retrieve_environment_info, EnvironmentName=name, InfoType="bundle"
-                )
-                response.pop("ResponseMetadata", None)
-                response = fix_json(response)
-
-                urls = response["EnvironmentInfo"]
-                if len(urls) > 0:
-                    url = urls[-1]
-                    url = url["Message"]
-
-                filename = path + name + ".zip"
-                r = get(url)
-                with open(filename, "wb") as f:
-                    f.write(r.content)
-
-                if not self.dl:
-                    key = "eb/" + name + ".zip"
-                    writefile_s3(self.bucket, key, filename)
-                    remove(filename)
-                    rmdir(path)
-                pbar.update()
+        urls = self.wait_bundles(eb, names, requested)
 
-        self.display_progress(len(environments), "elasticbeanstalk")
-  
-    def get_logs_cloudwatch(self):
-        """Retrieve the logs of the configuration of the existing cloudwatch dashboards
+        with Session() as session:
+            session.mount("https://", HTTPAdapter(pool_maxsize=source.utils.utils.WORKERS))
+            downloads = run_parallel(
+                "ELASTICBEANSTALK",
+                lambda name: self.download_bundle(session, name, urls[name], path),
+                list(urls)
+            )
+
+        for name, response in downloads.items():
+            if response != True:
+                print(f"[!] Error : Bundle of the environment {name} could not be downloaded : {response.get('error')}")
+
+        self.display_progress(len(urls), "elasticbeanstalk")
+
+    def wait_bundles(self, eb, names, requested):
+        """Poll the bundles of the elasticbeanstalk environments until their url is available.
+
+        Parameters
+        ----------
+        eb : object
+            Elasticbeanstalk client
+        names : list of str
+            Names of the environments of which a bundle was requested
+        requested : datetime
+            Time of the request. Older bundles are ignored
+
+        Returns
+        -------
+        urls : dict
+            Url of the bundle of each environment. Environments whose bundle did not appear in time are missing
         """
+        urls = {}
+        pending = list(names)
+        delay = EB_POLL_DELAY
+        deadline = datetime.datetime.now() + datetime.timedelta(seconds=EB_BUNDLE_TIMEOUT)
 
-        cloudwatch_list = self.services["cloudwatch"]
+        with tqdm(desc="[+] Waiting for the ELASTICBEANSTALK bundles", leave=False, total=len(names)) as pbar:
+            while pending and datetime.datetime.now() < deadline:
+                sleep(delay)
 
-        if cloudwatch_list["count"] == -1:
-            dashboards = paginate(source.utils.utils.CLOUDWATCH_CLIENT, "list_dashboards", "DashboardEntries")
+                for name in pending:
+                    response = try_except(eb.retrieve_environment_info, EnvironmentName=name, InfoType="bundle")
+                    infos = [info for info in response.get("EnvironmentInfo", []) if info.get("SampleTimestamp") and info["SampleTimestamp"] >= requested]
+                    if infos:
+                        urls[name] = max(infos, key=lambda info: info["SampleTimestamp"])["Message"]
+                        pbar.update()
 
-            if len(dashboards) == 0:
-                self.display_progress(0, "cloudwatch")
-                return
+                pending = [name for name in pending if name not in urls]
+                delay = min(delay * 2, 60)
+
+        for name in pending:
+            print(f"[!] Error : The bundle of the environment {name} was not available after {EB_BUNDLE_TIMEOUT} seconds.")
+
+        return urls
+
+    def download_bundle(self, session, name, url, path):
+        """Stream the bundle of an elasticbeanstalk environment to the disk or to the bucket.
+
+        Parameters
+        ----------
+        session : Session
+            Http session shared by the downloads
+        name : str
+            Name of the environment
+        url : str
+            Url of the bundle
+        path : str
+            Folder where the bundle is written if the results are downloaded
+
+        Returns
+        -------
+        ret : bool
+            True if the bundle was written
+        """
+        with session.get(url, stream=True, timeout=60) as r:
+            r.raise_for_status()
 
-        elif cloudwatch_list["count"] == 0:
+            if self.dl:
+                with open(f"{path}{name}.zip", "wb") as f:
+                    for chunk in r.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+            else:
+                r.raw.decode_content = True
+                source.utils.utils.S3_CLIENT.upload_fileobj(r.raw, self.bucket, f"eb/{name}.zip")
+
+        return True
+  
+    def get_logs_cloudwatch(self):
+        """Retrieve the logs of the configuration of the existing cloudwatch dashboards
+        """
+
+        dashboards, _ = enumerated(self.services, "cloudwatch")
+        if dashboards is None:
             self.display_progress(0, "cloudwatch")
             return
-        else:
-            dashboards = cloudwatch_list["elements"]
 
-        dashboards_data = {}
-
-        with tqdm(desc="[+] Getting CLOUDWATCH logs", leave=False, total = len(dashboards)) as pbar:
-            for dashboard in dashboards:
-                dashboard_name = dashboard.get("DashboardName", "")
-                if dashboard_name == "":
-                    continue
-                response = try_except(
-                    source.utils.utils.CLOUDWATCH_CLIENT.get_dashboard, DashboardName=dashboard_name
-                )
-                response.pop("ResponseMetadata", None)
-                dashboards_data[dashboard_name] = fix_json(response)
-                pbar.update()
+        dashboard_names = [dashboard.get("DashboardName", "") for dashboard in dashboards]
+        dashboards_data = fetch_details("CLOUDWATCH", source.utils.utils.CLOUDWATCH_CLIENT.get_dashboard, dashboard_names, "DashboardName")
 
         metrics = try_except(source.utils.utils.CLOUDWATCH_CLIENT, "list_metrics")
 
@@ -436,8 +615,7 @@ class Logs:
             create_command("cloudwatch describe-alarms --name <name>", alarms)
         )
 
-        self.results["cloudwatch"]["action"] = 0
-        self.results["cloudwatch"]["results"] = results
+        self.set_result("cloudwatch", 0, results)
 
         self.display_progress(len(results), "cloudwatch")
     
@@ -445,68 +623,42 @@ class Logs:
         """Retrieve the logs of the configuration of the existing s3 buckets
         """
 
-        s3_list = self.services["s3"]
-
-        if s3_list["count"] == -1:
-
-            elements = s3_lookup()
-
-            if len(elements) == 0:
-                self.display_progress(0, "s3")
-                return
-
-        elif s3_list["count"] == 0:
-            # if there is not bucket at all
+        elements, _ = enumerated(self.services, "s3")
+        if elements is None:
             self.display_progress(0, "s3")
             return
-        else:
-            elements = s3_list["elements"]
 
         cnt = 0
 
-        self.results["s3"]["action"] = 1
-        self.results["s3"]["results"] = []
+        buckets = []
         
-        with tqdm(desc="[+] Getting S3 logs", leave=False, total = len(elements)) as pbar:
-            
-            # Simulez une action quelconque.
-            for bucket in elements: 
-            
-                name = bucket["Name"]
+        loggings = fetch_details("S3", S3_CLIENT.get_bucket_logging, [bucket["Name"] for bucket in elements], "Bucket")
 
-                logging = try_except(S3_CLIENT.get_bucket_logging, Bucket=name)
+        for logging in loggings.values():
 
-                if "LoggingEnabled" in logging:
-                    target = logging["LoggingEnabled"]["TargetBucket"]
-                    bucket = target.split(":")[-1]
-                    src_bucket = bucket.split("/")[0]
+            if "LoggingEnabled" in logging:
+                target = logging["LoggingEnabled"]["TargetBucket"]
+                bucket = target.split(":")[-1]
+                src_bucket = bucket.split("/")[0]
 
-                    if logging["LoggingEnabled"]["TargetPrefix"]:
-                        prefix = logging["LoggingEnabled"]["TargetPrefix"]
-                    src_bucket = f"{src_bucket}|{prefix}"
+                prefix = ""
+                if logging["LoggingEnabled"]["TargetPrefix"]:
+                    prefix = logging["LoggingEnabled"]["TargetPrefix"]
+                src_bucket = f"{src_bucket}|{prefix}"
 
-                    self.results["s3"]["results"].append(src_bucket)
+                buckets.append(src_bucket)
 
-                    cnt += 1
-                pbar.update()
-       
+                cnt += 1
+
+        self.set_result("s3", 1, buckets)
         self.display_progress(cnt, "s3")
        
-    def get_logs_inspector2(self):
+    def get_logs_inspector(self):
         """Retrieve the logs of the configuration of the existing inspector coverages
         """
 
-        inspector_list = self.services["inspector"]
-
-        if inspector_list["count"] == -1:
-
-            covered = paginate(source.utils.utils.INSPECTOR_CLIENT, "list_coverage", "coveredResources")
-
-            if len(covered) == 0:
-                self.display_progress(0, "inspector")
-                return
-
-        elif inspector_list["count"] == 0:
+        elements, _ = enumerated(self.services, "inspector")
+        if elements is None:
             self.display_progress(0, "inspector")
             return
 
@@ -525,36 +677,30 @@ class Logs:
             )
         )
 
-        self.results["inspector"]["action"] = 0
-        self.results["inspector"]["results"] = results
+        self.set_result("inspector", 0, results)
 
         self.display_progress(len(results), "inspector")
     
-    def get_logs_maciev2(self):
+    def get_logs_macie(self):
         """Retrieve the logs of the configuration of the existing macie buckets
         """
 
-        macie_list = self.services["macie"]
-
-        if macie_list["count"] == -1:
-
-            elements = paginate(source.utils.utils.MACIE_CLIENT, "describe_buckets", "buckets")
-
-            if len(elements) == 0:
-                self.display_progress(0, "macie")
-                return
-        elif macie_list["count"] == 0:
+        elements, _ = enumerated(self.services, "macie")
+        if elements is None:
             self.display_progress(0, "macie")
             return
 
-        get_list_findings = simple_paginate(source.utils.utils.MACIE_CLIENT, "list_findings")
+        get_list_findings = paginate(source.utils.utils.MACIE_CLIENT, "list_findings", "findingIds", **macie_criteria())
 
-        response = try_except(
+        findings = self.stream_findings(
+            "macie-findings",
+            "MACIE",
             source.utils.utils.MACIE_CLIENT.get_findings,
-            findingIds=get_list_findings.get("findingIds", []),
+            "findingIds",
+            get_list_findings,
+            MACIE_FINDINGS_BATCH,
+            "findings"
         )
-        response.pop("ResponseMetadata", None)
-        findings = fix_json(response)
 
         results = []
         results.append(create_command("aws macie2 list-findings", get_list_findings))
@@ -562,13 +708,12 @@ class Logs:
             create_command("aws macie2 get-findings --finding-ids <ID>", findings)
         )
 
-        self.results["macie"]["action"] = 0
-        self.results["macie"]["results"] = results
+        self.set_result("macie", 0, results)
 
         self.display_progress(len(results), "macie")
 
-    def download_rds(self, nameDB, rds, logname):
-        """'Download' the rds logs
+    def download_rds(self, nameDB, rds, logname, filename):
+        """Download a rds log file portion by portion, following the markers until the end of the file.
 
         Parameters
         ----------
@@ -578,63 +723,121 @@ class Logs:
             RDS client
         logname : str
             name of the logfile to get
+        filename : str
+            local file where the logfile is written
 
         Returns
         -------
         ret : dict
-            Part of the response
+            Where the logfile was written and its size
         """
+        create_folder(dirname(filename))
 
-        response = try_except(
-            rds.download_db_log_file_portion,
-            DBInstanceIdentifier=nameDB,
-            LogFileName=logname,
-            Marker="0",
-        )
+        size = 0
+        marker = "0"
+        error = None
 
-        ret = response.get("LogFileData", "")
+        with open(filename, "w") as f:
+            while True:
+                response = try_except(
+                    rds.download_db_log_file_portion,
+                    DBInstanceIdentifier=nameDB,
+                    LogFileName=logname,
+                    Marker=marker,
+                )
+
+                if "error" in response:
+                    error = response["error"]
+                    break
+
+                data = response.get("LogFileData") or ""
+                f.write(data)
+                size += len(data)
+
+                if not response.get("AdditionalDataPending") or response.get("Marker", marker) == marker:
+                    break
+                marker = response["Marker"]
+
+        ret = {"file": filename, "size": size}
+        if not self.dl:
+            key = f"{self.region}/logs/rds/{nameDB}/{logname}"
+            writefile_s3(self.bucket, key, filename)
+            remove(filename)
+            ret = {"bucket": self.bucket, "key": key, "size": size}
+
+        if error:
+            ret["error"] = error
         return ret
     
-    def get_logs_rds(self):
-        """Retrieve the logs of the configuration of the existing rds instances
+    def get_logs_rds(self, start, end):
+        """Retrieve the log files of the existing rds instances
+
+        Parameters
+        ----------
+        start : str
+            Start time for logs collection
+        end : str  
+            End time for logs collection
         """
 
-        rds_list = self.services["rds"]
+        list_of_dbs, _ = enumerated(self.services, "rds")
+        if list_of_dbs is None:
+            self.display_progress(0, "rds")
+            return
 
-        if rds_list["count"] == -1:
+        '''
+        The log files depend on the engine of the instance, so they are listed instead of being guessed.
+        Only the files written during the -start/-end window are kept : the start is sent to the API, the end is checked here.
+        '''
 
-            list_of_dbs = paginate(source.utils.utils.RDS_CLIENT, "describe_db_instances", "DBInstances")
+        parameters = {}
+        if start:
+            datetime_start = datetime.datetime.strptime(start, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+            parameters["FileLastWritten"] = int(datetime_start.timestamp() * 1000)
 
-            if len(list_of_dbs) == 0:
-                self.display_progress(0, "rds")
-                return
+        last_written = None
+        if end:
+            datetime_end = datetime.datetime.strptime(end, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc) + datetime.timedelta(days=1)
+            last_written = int(datetime_end.timestamp() * 1000)
 
-        elif rds_list["count"] == 0:
-            self.display_progress(0, "rds")
-            return
-        else:
-            list_of_dbs = rds_list["elements"]
+        engines = {db["DBInstanceIdentifier"]: db.get("Engine", "") for db in list_of_dbs}
 
-        total_logs = []
+        log_files = run_parallel(
+            "RDS",
+            lambda name: paginate(source.utils.utils.RDS_CLIENT, "describe_db_log_files", "DescribeDBLogFiles", DBInstanceIdentifier=name, **parameters),
+            list(engines)
+        )
 
-        with tqdm(desc="[+] Getting RDS logs", leave=False, total = len(list_of_dbs)) as pbar:
-            for db in list_of_dbs:
-                total_logs.append(
-                    self.download_rds(
-                        db["DBInstanceIdentifier"],
-                        source.utils.utils.RDS_CLIENT,
-                        "external/mysql-external.log",
-                    )
-                )
-                total_logs.append(
-                    self.download_rds(
-                        db["DBInstanceIdentifier"], source.utils.utils.RDS_CLIENT, "error/mysql-error.log"
-                    )
-                )
-                pbar.update()
+        files = []
+        for name, logs in log_files.items():
+            if not isinstance(logs, list):
+                continue
+            for log in logs:
+                if last_written and log.get("LastWritten", 0) > last_written:
+                    continue
+                files.append((name, log["LogFileName"]))
+
+        # the files of every instance are downloaded at the same time, each one is written portion by portion
+        downloads = run_parallel(
+            "RDS",
+            lambda file: self.download_rds(file[0], source.utils.utils.RDS_CLIENT, file[1], f"{self.confs}/rds/{file[0]}/{file[1]}"),
+            files
+        )
 
-        self.results["rds"]["action"] = 0
-        self.results["rds"]["results"] = total_logs
+        total_logs = {}
+        for (name, logname), download in downloads.items():
+            total_logs.setdefault(name, {"engine": engines[name], "files": {}})
+            total_logs[name]["files"][logname] = download
+
+        results = []
+        results.append(
+            create_command(
+                "aws rds download-db-log-file-portion --db-instance-identifier <id> --log-file-name <name>",
+                total_logs,
+            )
+        )
+
+        self.set_result("rds", 0, results)
 
         self.display_progress(len(list_of_dbs), "rds")
     
@@ -642,25 +845,15 @@ class Logs:
         """Retrieve the logs of the configuration of the existing routes53 hosted zones
         """
 
-        route53_list = self.services["route53"]
-
-        if route53_list["count"] == -1:
-            
-            hosted_zones = paginate(source.utils.utils.ROUTE53_CLIENT, "list_hosted_zones", "HostedZones")
-
-            if hosted_zones:
-                self.display_progress(0, "route53")
-                return
-
-        elif route53_list["count"] == 0:
+        elements, _ = enumerated(self.services, "route53")
+        if elements is None:
             self.display_progress(0, "route53")
             return
 
         resolver_log_configs = paginate(source.utils.utils.ROUTE53_RESOLVER_CLIENT, "list_resolver_query_log_configs", "ResolverQueryLogConfigs")
         cnt = 0
 
-        self.results["route53"]["action"] = 1
-        self.results["route53"]["results"] = []
+        buckets = []
 
         with tqdm(desc="[+] Getting ROUTE53 logs", leave=False, total = len(resolver_log_configs)) as pbar:
             for bucket_location in resolver_log_configs:
@@ -676,13 +869,83 @@ class Logs:
                     else :
                         result = bucket
 
-                    self.results["route53"]["results"].append(result)
+                    buckets.append(result)
 
                     cnt += 1
                 pbar.update()
-                
+
+        self.set_result("route53", 1, buckets)
         self.display_progress(cnt, "route53")
 
+    def stream_findings(self, name, service, function, key, identifiers, size, array, **kwargs):
+        """Get the findings in batches of the size accepted by the API and write them to their own file, so they are never all held in memory.
+
+        Parameters
+        ----------
+        name : str
+            Name of the file
+        service : str
+            Name of the service, only used for the progress bar
+        function : str
+            Concatenation of the client and the command (CLIENT.COMMAND)
+        key : str
+            Name of the parameter receiving the ids of the findings
+        identifiers : list of str
+            Ids of the findings
+        size : int
+            Maximum number of ids of a single call
+        array : str
+            Part of the results written
+        **kwargs : list, optional
+            List of parameters to add to the command
+
+        Returns
+        -------
+        location : dict
+            Where the findings were written, how many were written and the errors of the failed batches
+        """
+        file = f"{self.confs}/{name}.json"
+        count, errors = fetch_chunks_to_file(service, function, key, identifiers, size, array, file, **kwargs)
+
+        location = {"file": file, "count": count}
+        if not self.dl:
+            key = f"{self.region}/logs/{name}.json"
+            writefile_s3(self.bucket, key, file)
+            remove(file)
+            location = {"bucket": self.bucket, "key": key, "count": count}
+
+        if errors:
+            location["errors"] = errors
+        return location
+
+    def run_unit(self, name, func, *args):
+        """Run the logs extraction function of a service, unless it was already completed by the interrupted run being resumed.
+
+        Parameters
+        ----------
+        name : str
+            Name of the service
+        func : function
+            Logs extraction function of the service
+        *args : list
+            List of args of the function, optional
+        """
+        journal = source.utils.utils.JOURNAL
+
+        if journal and journal.is_done(self.region, "logs", name):
+            output = journal.output(self.region, "logs", name)
+            self.display_progress(output["count"], name)
+            return
+
+        with timed_service("logs", self.region, name):
+            func(*args)
+
+        if journal:
+            journal.mark_done(self.region, "logs", name, self.write_unit(name))
+
+        if over_memory_budget():
+            self.flush_results()
+
     def display_progress(self, count, name):
         """Diplays if the configuration of the given service worked
 
@@ -693,6 +956,7 @@ class Logs:
         name : str
             Name of the service
         """
+        count_items("logs", self.region, name, count)
 
         if count != 0:
             print(
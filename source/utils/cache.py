@@ -0,0 +1,144 @@
+"""File containing the cache of the results of the global lookups (buckets, users, hosted zones, trails, ...)."""
+
+import os, threading
+from time import time
+from json import dumps, loads
+
+
+class ResultCache:
+
+    folder = None
+    ttl = None
+    values = None
+    locks = None
+    lock = None
+
+    def __init__(self, folder=None, ttl=None):
+        """Handle the constructor of the ResultCache class.
+
+        Parameters
+        ----------
+        folder : str, optional
+            Folder where the results are kept between runs. Results are only kept in memory if None
+        ttl : int, optional
+            Number of seconds a result kept on the disk can be reused
+        """
+        self.folder = folder
+        self.ttl = ttl
+        self.values = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def file(self, account, key):
+        """Return the file of a result kept on the disk.
+
+        Parameters
+        ----------
+        account : str
+            Id of the account
+        key : str
+            Name of the result
+
+        Returns
+        -------
+        path : str
+            Path of the file
+        """
+        return f"{self.folder}{account}/{key}.json"
+
+    def read(self, account, key):
+        """Read a result from the disk if it is younger than the ttl.
+
+        Parameters
+        ----------
+        account : str
+            Id of the account
+        key : str
+            Name of the result
+
+        Returns
+        -------
+        found : bool
+            True if a valid result was found
+        value : object
+            Result
+        """
+        if not self.folder:
+            return False, None
+
+        path = self.file(account, key)
+        if not os.path.isfile(path):
+            return False, None
+
+        try:
+            with open(path, "rt") as f:
+                entry = loads(f.read())
+        except ValueError:
+            return False, None
+
+        if time() - entry["time"] > self.ttl:
+            return False, None
+        return True, entry["value"]
+
+    def write(self, account, key, value):
+        """Write a result to the disk.
+
+        Parameters
+        ----------
+        account : str
+            Id of the account
+        key : str
+            Name of the result
+        value : object
+            Result
+        """
+        if not self.folder:
+            return
+
+        path = self.file(account, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(dumps({"time": time(), "value": value}, default=str))
+
+    def get(self, account, key, func, *args, **kwargs):
+        """Return the result of a lookup, calling it only if it was not done yet by the run (or by a recent run, with the disk cache).
+
+        Parameters
+        ----------
+        account : str
+            Id of the account
+        key : str
+            Name of the result
+        func : function
+            Lookup called if the result is not cached
+        *args : list, optional
+            Arguments of the lookup
+        **kwargs : list, optional
+            Key pairs arguments of the lookup
+
+        Returns
+        -------
+        value : object
+            Result of the lookup
+        """
+        with self.lock:
+            lock = self.locks.setdefault((account, key), threading.Lock())
+
+        # concurrent callers of the same lookup wait for the first one instead of calling it again
+        with lock:
+            if (account, key) in self.values:
+                return self.values[(account, key)]
+
+            found, value = self.read(account, key)
+            if not found:
+                value = func(*args, **kwargs)
+                self.write(account, key, value)
+
+            self.values[(account, key)] = value
+            return value
+
+    def clear(self):
+        """Forget the results kept in memory."""
+        with self.lock:
+            self.values = {}
+            self.locks = {}
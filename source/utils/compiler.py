@@ -0,0 +1,186 @@
+"""File containing the query compiler of the analysis : the detections of the query file that only filter the rows of the table are merged in a single query, so the table is scanned once for all of them."""
+
+import re
+
+# Query of a detection only filtering the rows of the table
+FILTER = re.compile(r"^\s*SELECT\s+\*\s+FROM\s+DATABASE\.TABLE\s+WHERE\s+(.+?)\s*;?\s*$", re.IGNORECASE | re.DOTALL)
+# Same filter, written with a subquery : SELECT * FROM ( SELECT * FROM DATABASE.TABLE WHERE A ) WHERE B
+NESTED_FILTER = re.compile(r"^\s*SELECT\s+\*\s+FROM\s*\(\s*SELECT\s+\*\s+FROM\s+DATABASE\.TABLE\s+WHERE\s+(.+?)\s*\)\s*WHERE\s+(.+?)\s*;?\s*$", re.IGNORECASE | re.DOTALL)
+# Literals, quoted identifiers, words and parentheses of a condition. A lone quote is a literal left open
+TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|['\"]|[A-Za-z_][A-Za-z0-9_]*|[();]")
+# Clauses ending the WHERE clause of a query
+CLAUSES = {"GROUP", "ORDER", "HAVING", "LIMIT", "OFFSET", "FETCH", "WINDOW", "UNION", "INTERSECT", "EXCEPT"}
+
+# Prefix of the columns of the merged query telling which detections matched each row
+LABEL = "invictus_detection_"
+
+def is_condition(text):
+    """Verify that a text is a single condition of a WHERE clause, the clauses following it (GROUP BY, LIMIT, ...) being excluded.
+
+    Parameters
+    ----------
+    text : str
+        Text following WHERE
+
+    Returns
+    -------
+    condition : bool
+        True if the text is a condition only
+    """
+    depth = 0
+
+    for token in TOKEN.finditer(text):
+        value = token.group()
+        if value in ("'", '"', ";"):
+            return False
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth -= 1
+            if depth < 0:
+                return False
+        elif depth == 0 and value.upper() in CLAUSES:
+            return False
+
+    return depth == 0
+
+def get_condition(query):
+    """Return the condition of a query only filtering the rows of the table.
+
+    Parameters
+    ----------
+    query : str
+        Query of a detection, as written in the query file
+
+    Returns
+    -------
+    condition : str
+        Condition of the query. None if the query does more than filtering the rows
+    """
+    match = FILTER.match(query)
+    if match and is_condition(match.group(1)):
+        return match.group(1)
+
+    match = NESTED_FILTER.match(query)
+    if match and is_condition(match.group(1)) and is_condition(match.group(2)):
+        return f"({match.group(1)}) AND ({match.group(2)})"
+
+    return None
+
+def compile_queries(queries):
+    """Sort the detections of a query file between the ones merged in a single query and the ones run alone.
+    Merging a single detection wouldn't save a scan, it is run alone.
+
+    Parameters
+    ----------
+    queries : dict
+        Query of each detection, by name
+
+    Returns
+    -------
+    merged : dict
+        Condition of each detection merged, by name, in the order of the file
+    others : dict
+        Query of each detection run alone, by name, in the order of the file
+    """
+    merged = {}
+    others = {}
+
+    for name, query in queries.items():
+        condition = get_condition(query)
+        if condition is None:
+            others[name] = query
+        else:
+            merged[name] = condition
+
+    if len(merged) < 2:
+        return {}, queries
+    return merged, others
+
+def merged_query(conditions, timeframe):
+    """Return the query running the merged detections in a single scan.
+    It returns the rows matched by at least one detection, with one column per detection set to 1 if it matched the row, 0 otherwise.
+
+    Parameters
+    ----------
+    conditions : list of str
+        Condition of each detection
+    timeframe : str
+        Number of days of the events kept. All of them if None
+
+    Returns
+    -------
+    query : str
+        Query, on DATABASE.TABLE as the ones of the query file
+    """
+    labels = ", ".join(f"CASE WHEN ({condition}) THEN 1 ELSE 0 END AS {LABEL}{i}" for i, condition in enumerate(conditions))
+    where = " OR ".join(f"({condition})" for condition in conditions)
+
+    if timeframe != None:
+        where = f"date_diff('day', from_iso8601_timestamp(eventtime), current_timestamp) <= {timeframe} AND ({where})"
+
+    return f"SELECT *, {labels} FROM DATABASE.TABLE WHERE {where};"
+
+def records(f):
+    """Iterate over the records of a csv file written by Athena. A quoted value can hold line breaks, a record ends with the first line leaving no quote open.
+
+    Parameters
+    ----------
+    f : file
+        Csv file, opened in binary mode
+
+    Returns
+    -------
+    records : generator of bytes
+        Records, with their line break
+    """
+    record = b""
+    for line in f:
+        record += line
+        if record.count(b'"') % 2 == 0:
+            yield record
+            record = b""
+
+def split_results(file, names):
+    """Split the results of the merged query in one csv file per detection, <name>-output.csv, holding the rows the detection would have returned alone.
+    The rows are copied as written by Athena, without their detection columns. Only the detections with hits get a file.
+
+    Parameters
+    ----------
+    file : str
+        Csv file of the results of the merged query
+    names : list of str
+        Name of each detection, in the order of the conditions of the query
+
+    Returns
+    -------
+    hits : dict
+        Number of rows of each detection, by name
+    """
+    hits = {name: 0 for name in names}
+    outputs = {}
+    header = None
+
+    try:
+        with open(file, "rb") as f:
+            for record in records(f):
+                # the detection columns come last and hold no comma
+                fields = record.rstrip(b"\r\n").rsplit(b",", len(names))
+                row = fields[0] + b"\n"
+
+                if header is None:
+                    header = row
+                    continue
+
+                for name, label in zip(names, fields[1:]):
+                    if label == b'"1"':
+                        if name not in outputs:
+                            outputs[name] = open(f"{name}-output.csv", "wb")
+                            outputs[name].write(header)
+                        outputs[name].write(row)
+                        hits[name] += 1
+    finally:
+        for output in outputs.values():
+            output.close()
+
+    return hits
@@ -0,0 +1,270 @@
+"""File containing the async engine of the tool (--engine async) : the calls of the enumeration helpers run as coroutines on aiobotocore, under a single semaphore."""
+
+import asyncio, threading
+from contextlib import AsyncExitStack
+
+# aiobotocore is optional, it is only needed by --engine async
+try:
+    from aiobotocore.session import get_session
+    from aiobotocore.config import AioConfig
+except ImportError:
+    get_session = None
+
+import source.utils.utils
+from source.utils.throttle import register_rate_limiter, get_bucket
+from source.utils.instrument import register_instrumentation
+
+ENGINE = None
+ENGINE_LOCK = threading.Lock()
+
+def engine_available():
+    """Verify if the async engine can be used.
+
+    Returns
+    -------
+    available : bool
+        True if aiobotocore is installed
+    """
+    return get_session is not None
+
+def get_engine():
+    """Return the async engine of the run, starting it if needed.
+
+    Returns
+    -------
+    engine : AsyncEngine
+        Async engine
+    """
+    global ENGINE
+
+    with ENGINE_LOCK:
+        if ENGINE is None:
+            ENGINE = AsyncEngine(source.utils.utils.WORKERS)
+        return ENGINE
+
+def close_engine():
+    """Close the clients of the async engine and stop its loop, if it was started."""
+    global ENGINE
+
+    with ENGINE_LOCK:
+        if ENGINE is not None:
+            ENGINE.close()
+            ENGINE = None
+
+
+class AsyncEngine:
+
+    loop = None
+    thread = None
+    session = None
+    config = None
+    semaphore = None
+    lock = None
+    stack = None
+    clients = None
+
+    def __init__(self, workers):
+        """Handle the constructor of the AsyncEngine class.
+        The event loop runs in its own thread, the collectors, which stay synchronous, wait for the coroutines they submit.
+
+        Parameters
+        ----------
+        workers : int
+            Maximum number of calls in flight, all services and regions included
+        """
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="invictus-async", daemon=True)
+        self.thread.start()
+
+        self.session = get_session()
+        self.config = AioConfig(retries={"mode": "standard", "max_attempts": 10}, max_pool_connections=workers)
+        self.clients = {}
+        self.run(self.start(workers))
+
+    async def start(self, workers):
+        """Create the objects bound to the loop of the engine.
+
+        Parameters
+        ----------
+        workers : int
+            Maximum number of calls in flight
+        """
+        self.semaphore = asyncio.Semaphore(workers)
+        self.lock = asyncio.Lock()
+        self.stack = AsyncExitStack()
+
+    def run(self, coroutine):
+        """Run a coroutine on the loop of the engine and wait for its result.
+
+        Parameters
+        ----------
+        coroutine : coroutine
+            Coroutine to run
+
+        Returns
+        -------
+        result : object
+            Result of the coroutine
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self):
+        """Close the clients and stop the loop."""
+        self.run(self.stack.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    async def client(self, client):
+        """Return the aiobotocore client matching a boto3 client, creating it if needed.
+        It gets the instrumentation and the hooks (record, replay, ...) of the boto3 clients. The rate limiter only counts its calls, the engine waits for the token buckets itself.
+
+        Parameters
+        ----------
+        client : object
+            Boto3 client
+
+        Returns
+        -------
+        client : object
+            Aiobotocore client of the same service and region
+        """
+        key = (client.meta.service_model.service_name, client.meta.region_name)
+
+        async with self.lock:
+            if key not in self.clients:
+                aio = await self.stack.enter_async_context(self.session.create_client(key[0], region_name=key[1], config=self.config))
+                register_rate_limiter(aio, False)
+                register_instrumentation(aio)
+                for hook in source.utils.utils.CLIENT_HOOKS:
+                    hook(aio)
+                self.clients[key] = aio
+            return self.clients[key]
+
+    async def wait_rate(self, client, operation):
+        """Wait until the token bucket of an operation allows a call, without blocking the loop.
+
+        Parameters
+        ----------
+        client : object
+            Aiobotocore client
+        operation : str
+            Name of the operation (ListBuckets, GetBucketPolicy, ...)
+        """
+        bucket = get_bucket((client.meta.service_model.service_name, client.meta.region_name, operation))
+        while True:
+            wait = bucket.reserve()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    async def call(self, client, method, **kwargs):
+        """Make a call as try_except does : an error is returned as an error object, the throttled attempts being retried by aiobotocore.
+
+        Parameters
+        ----------
+        client : object
+            Boto3 client
+        method : str
+            Name of the method of the client (get_bucket_policy, ...)
+        **kwargs : list, optional
+            Parameters of the call
+
+        Returns
+        -------
+        response : dict
+            Response of the call, or an error object
+        """
+        try:
+            aio = await self.client(client)
+            await self.wait_rate(aio, aio.meta.method_to_api_mapping[method])
+            async with self.semaphore:
+                return await getattr(aio, method)(**kwargs)
+        except Exception as e:
+            return {"count": 0, "error": str(e)}
+
+    def submit(self, function, **kwargs):
+        """Start a call on the engine.
+
+        Parameters
+        ----------
+        function : method
+            Method of a boto3 client (S3_CLIENT.get_bucket_policy, ...)
+        **kwargs : list, optional
+            Parameters of the call
+
+        Returns
+        -------
+        future : Future
+            Future of the response, as the ones of a ThreadPoolExecutor
+        """
+        return asyncio.run_coroutine_threadsafe(self.call(function.__self__, function.__name__, **kwargs), self.loop)
+
+    async def page_iterator(self, client, command, **kwargs):
+        """Return the aiobotocore page iterator of a command.
+
+        Parameters
+        ----------
+        client : object
+            Boto3 client
+        command : str
+            Command paginated
+        **kwargs : list, optional
+            Parameters of the command
+
+        Returns
+        -------
+        iterator : object
+            Async iterator of the pages
+        """
+        aio = await self.client(client)
+        return aio.get_paginator(command).paginate(**kwargs).__aiter__()
+
+    async def next_page(self, client, operation, iterator):
+        """Fetch the next page of a page iterator.
+
+        Parameters
+        ----------
+        client : object
+            Boto3 client
+        operation : str
+            Name of the operation
+        iterator : object
+            Async iterator of the pages
+
+        Returns
+        -------
+        page : dict
+            Next page. None after the last one
+        """
+        await self.wait_rate(await self.client(client), operation)
+        async with self.semaphore:
+            try:
+                return await iterator.__anext__()
+            except StopAsyncIteration:
+                return None
+
+    def pages(self, client, command, **kwargs):
+        """Iterate over the pages of a command, each page being fetched on the engine. Errors are raised as by the paginators of boto3.
+
+        Parameters
+        ----------
+        client : object
+            Boto3 client
+        command : str
+            Command paginated
+        **kwargs : list, optional
+            Parameters of the command
+
+        Returns
+        -------
+        pages : generator of dict
+            Pages of the command
+        """
+        operation = client.meta.method_to_api_mapping[command]
+        iterator = self.run(self.page_iterator(client, command, **kwargs))
+
+        while True:
+            page = self.run(self.next_page(client, operation, iterator))
+            if page is None:
+                return
+            yield page
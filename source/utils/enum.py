@@ -1,24 +1,276 @@
 """File containg all the aws enumeration function used to get data."""
 
-from source.utils.utils import fix_json, try_except, S3_CLIENT
+from source.utils.utils import fix_json, try_except, create_folder, S3_CLIENT
 import source.utils.utils
+from source.utils.engine import get_engine
 from tqdm import tqdm
+from json import dumps
+from os.path import dirname
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+
+EXECUTOR = None
+EXECUTOR_LOCK = threading.Lock()
+
+def get_executor():
+    """Return the shared pool running the per-identifier calls, creating it if needed.
+
+    Returns
+    -------
+    executor : ThreadPoolExecutor
+        Shared pool
+    """
+    global EXECUTOR
+
+    with EXECUTOR_LOCK:
+        if EXECUTOR is None:
+            EXECUTOR = ThreadPoolExecutor(max_workers=source.utils.utils.WORKERS, thread_name_prefix="invictus")
+        return EXECUTOR
+
+def submit_call(function, **kwargs):
+    """Start a call on the engine of the run : the shared pool, or the async engine with --engine async.
+
+    Parameters
+    ----------
+    function : method
+        Method of a client (S3_CLIENT.get_bucket_policy, ...)
+    **kwargs : list, optional
+        Parameters of the call
+
+    Returns
+    -------
+    future : Future
+        Future of the response. If the call failed, the response is an error object like the ones of try_except
+    """
+    if source.utils.utils.ENGINE == "async":
+        return get_engine().submit(function, **kwargs)
+    return get_executor().submit(try_except, function, **kwargs)
+
+def get_pages(client, command, **kwargs):
+    """Return the pages of a command, fetched by the engine of the run.
+
+    Parameters
+    ----------
+    client : object
+        Client used to call the request
+    command : str
+        Command paginated
+    **kwargs : list, optional
+        Parameters of the command
+
+    Returns
+    -------
+    pages : iterator of dict
+        Pages of the command
+    """
+    if source.utils.utils.ENGINE == "async":
+        return get_engine().pages(client, command, **kwargs)
+    return client.get_paginator(command).paginate(**kwargs)
+
+def run_parallel(name, func, elements):
+    """Run a function for each element on the shared pool. The calls are rate limited by the clients themselves.
+
+    Parameters
+    ----------
+    name : str
+        Name of the service, only used for the progress bar
+    func : function
+        Function called with each element
+    elements : list
+        Elements (usually identifiers) given to the function
+
+    Returns
+    -------
+    results : dict
+        Result of each element, in the same order as the elements. If the function failed, the result is an error object like the ones of try_except
+    """
+    def run(element):
+        try:
+            return func(element)
+        except Exception as e:
+            return {"count": 0, "error": str(e)}
+
+    elements = list(dict.fromkeys(elements))
+    futures = [get_executor().submit(run, element) for element in elements]
+
+    results = {}
+    with tqdm(desc=f"[+] Getting {name} details", leave=False, total=len(elements)) as pbar:
+        for element, future in zip(elements, futures):
+            results[element] = future.result()
+            pbar.update()
+
+    return results
+
+def fetch_details(name, function, identifiers, key, **kwargs):
+    """Call a detail command once per identifier, on the shared pool.
+
+    Parameters
+    ----------
+    name : str
+        Name of the service, only used for the progress bar
+    function : str
+        Concatenation of the client and the command (CLIENT.COMMAND)
+    identifiers : list of str
+        Identifiers of the elements
+    key : str
+        Name of the parameter receiving the identifier
+    **kwargs : list, optional
+        List of parameters to add to the command.
+
+    Returns
+    -------
+    results : dict
+        Response of each identifier, in the same order as the identifiers
+    """
+    identifiers = list(dict.fromkeys(identifier for identifier in identifiers if identifier != ""))
+    futures = [submit_call(function, **{key: identifier}, **kwargs) for identifier in identifiers]
+
+    results = {}
+    with tqdm(desc=f"[+] Getting {name} details", leave=False, total=len(identifiers)) as pbar:
+        for identifier, future in zip(identifiers, futures):
+            response = future.result()
+            response.pop("ResponseMetadata", None)
+            results[identifier] = fix_json(response)
+            pbar.update()
+
+    return results
+
+def fetch_chunks_to_file(name, function, key, identifiers, size, array, file, **kwargs):
+    """Call a command with the identifiers split in chunks of the size accepted by the API. The chunks are fetched on the shared pool and their results are written to a json file as soon as they arrive.
+
+    Parameters
+    ----------
+    name : str
+        Name of the service, only used for the progress bar
+    function : str
+        Concatenation of the client and the command (CLIENT.COMMAND)
+    key : str
+        Name of the parameter receiving the chunk of identifiers
+    identifiers : list of str
+        Identifiers of the elements
+    size : int
+        Maximum number of identifiers of a single call
+    array : str
+        Part of the results written
+    file : str
+        File where the results are written
+    **kwargs : list, optional
+        List of parameters to add to the command.
+
+    Returns
+    -------
+    count : int
+        Number of elements written
+    errors : list of str
+        Errors of the chunks that failed
+    """
+    identifiers = list(dict.fromkeys(identifiers))
+    chunks = [identifiers[i:i + size] for i in range(0, len(identifiers), size)]
+    futures = [submit_call(function, **{key: chunk}, **kwargs) for chunk in chunks]
+
+    count = 0
+    errors = []
+    create_folder(dirname(file))
+
+    with open(file, "w") as f:
+        f.write("[")
+        with tqdm(desc=f"[+] Getting {name} details", leave=False, total=len(chunks)) as pbar:
+            for future in as_completed(futures):
+                response = fix_json(future.result())
+                if "error" in response:
+                    errors.append(response["error"])
+                for el in response.get(array, []):
+                    f.write(("," if count else "") + "\n" + dumps(el, default=str))
+                    count += 1
+                pbar.update()
+        f.write("\n]")
+
+    return count, errors
+
+def count_region_resources(region):
+    """Count the resources of a region with the tagging api and a few cheap calls.
+
+    Parameters
+    ----------
+    region : str
+        Region to count
+
+    Returns
+    -------
+    count : int
+        Number of resources found. Only tells if the region is empty or not, as the calls only get their first page
+    """
+    count = 0
+
+    tagging = source.utils.utils.create_client("resourcegroupstaggingapi", region)
+    response = try_except(tagging.get_resources, ResourcesPerPage=100)
+    count += len(response.get("ResourceTagMappingList", []))
+
+    for probe in source.utils.utils.CENSUS_PROBES:
+        client = source.utils.utils.create_client(probe["service"], region)
+        response = try_except(getattr(client, probe["command"]), **probe["parameters"])
+        count += len(response.get(probe["array"], []))
+
+    return count
+
+def region_census(regions):
+    """Count the resources of every region, the regions being counted at the same time.
+
+    Parameters
+    ----------
+    regions : list of str
+        Regions to count
+
+    Returns
+    -------
+    census : dict
+        Number of resources found in each region
+    """
+    return run_parallel("REGIONS", count_region_resources, regions)
 
 def s3_lookup():
-    """Return all existing buckets.
+    """Return all existing buckets. The buckets are global, so the lookup is cached for the account.
     
     Returns
     -------
     elements : list
         List of the existing buckets
     """
-    response = try_except(S3_CLIENT.list_buckets)
-    buckets = fix_json(response)
+    def lookup():
+        response = try_except(S3_CLIENT.list_buckets)
+        buckets = fix_json(response)
 
-    elements = []
-    elements = buckets.get("Buckets", [])
+        elements = []
+        elements = buckets.get("Buckets", [])
 
-    return elements
+        return elements
+
+    return source.utils.utils.cached("s3-list_buckets", lookup)
+
+def global_paginate(client, command, array, **kwargs):
+    """Do the same as paginate for a global service (IAM, Route53, etc), the results being cached for the account.
+
+    Parameters
+    ----------
+    client : str
+        Name of the client used to call the request (IAM, ROUTE53, etc)
+    command : str
+        Command executed
+    array : str
+        Filter added to get a specific part of the results
+    **kwargs : list, optional
+        List of parameters to add to the command.
+
+    Returns
+    -------
+    elements : list
+        List of the results of the command
+    """
+    key = f"{client.meta.service_model.service_name}-{command}"
+    if kwargs:
+        key += "-" + "-".join(f"{name}={value}" for name, value in sorted(kwargs.items()))
+
+    return source.utils.utils.cached(key, paginate, client, command, array, **kwargs)
 
 def ec2_lookup():
     """Return all ec2 instances.
@@ -30,11 +282,10 @@ def ec2_lookup():
 
     """
     elements = []
-    paginator = source.utils.utils.EC2_CLIENT.get_paginator("describe_instances")
     
     try:
         with tqdm(desc=f"[+] Getting EC2 data", leave=False) as pbar:
-            for page in paginator.paginate():
+            for page in get_pages(source.utils.utils.EC2_CLIENT, "describe_instances"):
                 page.pop("ResponseMetadata", None)
                 page = fix_json(page)
                 if page["Reservations"]:
@@ -63,12 +314,10 @@ def simple_paginate(client, command, **kwargs):
         List of the results of the command
     """
     elements = []
-   
-    paginator = client.get_paginator(command)
     
     try:
         with tqdm(desc=f"[+] Getting {client.meta.service_model.service_name.upper()} data", leave=False) as pbar:
-            for page in paginator.paginate(**kwargs):
+            for page in get_pages(client, command, **kwargs):
                 page.pop("ResponseMetadata", None)
                 page = fix_json(page)
                 elements.append(page)
@@ -98,11 +347,10 @@ def paginate(client, command, array, **kwargs):
         List of the results of the command
     """
     elements = []
-    paginator = client.get_paginator(command)
     
     try:
         with tqdm(desc=f"[+] Getting {client.meta.service_model.service_name.upper()} data", leave=False) as pbar:
-            for page in paginator.paginate(**kwargs):
+            for page in get_pages(client, command, **kwargs):
                 page.pop("ResponseMetadata", None)
                 page = fix_json(page)
                 elements.extend(page.get(array, []))
@@ -113,6 +361,93 @@ def paginate(client, command, array, **kwargs):
 
     return elements  
 
+def paginate_to_file(client, command, array, file, keep=None, **kwargs):
+    """Do the same as paginate, but the results are written to a json file page by page instead of being kept in memory.
+
+    Parameters
+    ----------
+    client : str
+        Name of the client used to call the request (S3, LAMBDA, etc)
+    command : str
+        Command executed
+    array : str
+        Filter added to get a specific part of the results
+    file : str
+        File where the results are written
+    keep : function, optional
+        Return True if an element has to be written. Every element is written if None
+    **kwargs : list, optional
+        List of parameters to add to the command.
+
+    Returns
+    -------
+    count : int
+        Number of elements written
+    """
+    count = 0
+    create_folder(dirname(file))
+
+    with open(file, "w") as f:
+        f.write("[")
+        try:
+            with tqdm(desc=f"[+] Getting {client.meta.service_model.service_name.upper()} data", leave=False) as pbar:
+                for page in get_pages(client, command, **kwargs):
+                    page.pop("ResponseMetadata", None)
+                    page = fix_json(page)
+                    for el in page.get(array, []):
+                        if keep and not keep(el):
+                            continue
+                        f.write(("," if count else "") + "\n" + dumps(el, default=str))
+                        count += 1
+                    pbar.update()
+        except Exception as e:
+            print(f"[!] Error : {str(e)}")
+        f.write("\n]")
+
+    return count
+
+def pages_to_file(client, command, file, callback=None, **kwargs):
+    """Do the same as simple_paginate, but the pages are written to a json file one by one instead of being kept in memory.
+
+    Parameters
+    ----------
+    client : str
+        Name of the client used to call the request (S3, LAMBDA, etc)
+    command : str
+        Command executed
+    file : str
+        File where the pages are written
+    callback : function, optional
+        Function called with each page, before it is written
+    **kwargs : list, optional
+        List of parameters to add to the command.
+
+    Returns
+    -------
+    count : int
+        Number of pages written
+    """
+    count = 0
+    create_folder(dirname(file))
+
+    with open(file, "w") as f:
+        f.write("[")
+        try:
+            with tqdm(desc=f"[+] Getting {client.meta.service_model.service_name.upper()} data", leave=False) as pbar:
+                for page in get_pages(client, command, **kwargs):
+                    page.pop("ResponseMetadata", None)
+                    page = fix_json(page)
+                    if callback:
+                        callback(page)
+                    f.write(("," if count else "") + "\n" + dumps(page, default=str))
+                    count += 1
+                    pbar.update()
+        except Exception as e:
+            print(f"[!] Error : {str(e)}")
+        f.write("\n]")
+
+    return count
+
 def simple_misc_lookup(client, function, name_token, **kwargs):
     """Return all the results of the command, no matter the number of results. Used by functions not usable by paginate.
 
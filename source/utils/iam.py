@@ -0,0 +1,448 @@
+"""File containing the index of the IAM authorization details and the functions used to query it."""
+
+from fnmatch import fnmatchcase
+from json import dumps, loads
+from urllib.parse import unquote
+
+
+def as_list(value):
+    """Return the value of a policy element as a list.
+
+    Parameters
+    ----------
+    value : str or list
+        Value of the element (Action, Resource, Principal, ...)
+
+    Returns
+    -------
+    values : list
+        Value of the element as a list
+    """
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+def as_document(document):
+    """Return a policy document as a dict. Boto3 decodes the documents, but they can also be url encoded strings.
+
+    Parameters
+    ----------
+    document : str or dict
+        Policy document
+
+    Returns
+    -------
+    document : dict
+        Decoded policy document
+    """
+    if isinstance(document, str):
+        return loads(unquote(document))
+    return document or {}
+
+def match(patterns, value, case=False):
+    """Verify if a value matches one of the patterns of a policy (* and ? wildcards).
+
+    Parameters
+    ----------
+    patterns : list of str
+        Patterns of the policy
+    value : str
+        Value looked for
+    case : bool, optional
+        True if the comparison is case sensitive (resources), False otherwise (actions)
+
+    Returns
+    -------
+    match : bool
+        True if the value matches one of the patterns
+    """
+    if not case:
+        value = value.lower()
+        patterns = [pattern.lower() for pattern in patterns]
+    return any(fnmatchcase(value, pattern) for pattern in patterns)
+
+
+class AuthorizationIndex:
+
+    principals = None
+    policies = None
+    statements = None
+    actions = None
+    wildcards = None
+    not_actions = None
+    trusts = None
+    groups = None
+    attachments = None
+
+    def __init__(self):
+        """Handle the constructor of the AuthorizationIndex class.
+
+        The index is made of :
+        - principals : arn of each user, group and role with its type, groups and policies
+        - policies : id of each policy (arn for the managed ones, principal and name for the inline ones) with its statements
+        - statements : every statement of every policy, normalized
+        - actions : ids of the statements of each action without wildcard
+        - wildcards : ids of the statements of each action with a wildcard
+        - not_actions : ids of the statements using NotAction
+        - trusts : trust policy statements of each role
+        - groups : arn of each group name
+        """
+        self.principals = {}
+        self.policies = {}
+        self.statements = []
+        self.actions = {}
+        self.wildcards = {}
+        self.not_actions = []
+        self.trusts = {}
+        self.groups = {}
+        self.attachments = None
+
+    def add_policy(self, policy_id, name, document):
+        """Add the statements of a policy to the index.
+
+        Parameters
+        ----------
+        policy_id : str
+            Id of the policy
+        name : str
+            Name of the policy
+        document : str or dict
+            Policy document
+        """
+        document = as_document(document)
+        ids = []
+
+        for statement in as_list(document.get("Statement")):
+            statement_id = len(self.statements)
+            self.statements.append({
+                "policy": policy_id,
+                "sid": statement.get("Sid", ""),
+                "effect": statement.get("Effect", "Allow"),
+                "actions": as_list(statement.get("Action")),
+                "not_actions": as_list(statement.get("NotAction")),
+                "resources": as_list(statement.get("Resource")),
+                "not_resources": as_list(statement.get("NotResource")),
+                "condition": statement.get("Condition", {}),
+            })
+            ids.append(statement_id)
+
+            if "NotAction" in statement:
+                self.not_actions.append(statement_id)
+
+            for action in as_list(statement.get("Action")):
+                action = action.lower()
+                if "*" in action or "?" in action:
+                    self.wildcards.setdefault(action, []).append(statement_id)
+                else:
+                    self.actions.setdefault(action, []).append(statement_id)
+
+        self.policies[policy_id] = {"name": name, "statements": ids}
+
+    def add_principal(self, arn, kind, name, inline, attached, groups=None):
+        """Add a user, a group or a role to the index.
+
+        Parameters
+        ----------
+        arn : str
+            Arn of the principal
+        kind : str
+            Type of the principal (user, group, role)
+        name : str
+            Name of the principal
+        inline : list of dict
+            Inline policies of the principal (PolicyName, PolicyDocument)
+        attached : list of dict
+            Managed policies attached to the principal (PolicyArn)
+        groups : list of str, optional
+            Names of the groups of a user
+        """
+        policies = []
+
+        for policy in inline:
+            policy_id = f"{arn}:inline/{policy['PolicyName']}"
+            self.add_policy(policy_id, policy["PolicyName"], policy.get("PolicyDocument"))
+            policies.append(policy_id)
+
+        # managed policies can be listed on a later page, they are resolved when the index is queried
+        policies.extend(policy["PolicyArn"] for policy in attached)
+
+        self.principals[arn] = {"type": kind, "name": name, "groups": groups or [], "policies": policies}
+        if kind == "group":
+            self.groups[name] = arn
+
+    def add_page(self, page):
+        """Add a page of the response of get_account_authorization_details to the index.
+
+        Parameters
+        ----------
+        page : dict
+            Page of the response
+        """
+        for user in page.get("UserDetailList", []):
+            self.add_principal(user["Arn"], "user", user["UserName"], user.get("UserPolicyList", []), user.get("AttachedManagedPolicies", []), user.get("GroupList", []))
+
+        for group in page.get("GroupDetailList", []):
+            self.add_principal(group["Arn"], "group", group["GroupName"], group.get("GroupPolicyList", []), group.get("AttachedManagedPolicies", []))
+
+        for role in page.get("RoleDetailList", []):
+            self.add_principal(role["Arn"], "role", role["RoleName"], role.get("RolePolicyList", []), role.get("AttachedManagedPolicies", []))
+            self.trusts[role["Arn"]] = as_list(as_document(role.get("AssumeRolePolicyDocument")).get("Statement"))
+
+        for policy in page.get("Policies", []):
+            for version in policy.get("PolicyVersionList", []):
+                if version.get("IsDefaultVersion"):
+                    self.add_policy(policy["Arn"], policy["PolicyName"], version.get("Document"))
+
+    def save(self, file):
+        """Write the index to a json file.
+
+        Parameters
+        ----------
+        file : str
+            File where the index is written
+        """
+        index = {
+            "principals": self.principals,
+            "policies": self.policies,
+            "statements": self.statements,
+            "actions": self.actions,
+            "wildcards": self.wildcards,
+            "not_actions": self.not_actions,
+            "trusts": self.trusts,
+            "groups": self.groups,
+        }
+        with open(file, "w") as f:
+            f.write(dumps(index, default=str))
+
+    @classmethod
+    def load(cls, file):
+        """Read an index written by save.
+
+        Parameters
+        ----------
+        file : str
+            File where the index was written
+
+        Returns
+        -------
+        index : AuthorizationIndex
+            Loaded index
+        """
+        with open(file, "rt") as f:
+            data = loads(f.read())
+
+        index = cls()
+        for key, value in data.items():
+            setattr(index, key, value)
+        return index
+
+    def principal_policies(self, arn):
+        """Return the ids of the policies applying to a principal, including the ones of its groups.
+
+        Parameters
+        ----------
+        arn : str
+            Arn of the principal
+
+        Returns
+        -------
+        policies : list of str
+            Ids of the policies
+        """
+        principal = self.principals.get(arn)
+        if not principal:
+            return []
+
+        policies = list(principal["policies"])
+        for group in principal["groups"]:
+            if group in self.groups:
+                policies.extend(self.principals[self.groups[group]]["policies"])
+        return policies
+
+    def get_attachments(self):
+        """Return the users and roles to which each policy applies, directly or through a group. Computed once, on the first query.
+
+        Returns
+        -------
+        attachments : dict
+            Arns of the principals of each policy
+        """
+        if self.attachments is None:
+            self.attachments = {}
+            for arn, principal in self.principals.items():
+                if principal["type"] == "group":
+                    continue
+                for policy_id in self.principal_policies(arn):
+                    self.attachments.setdefault(policy_id, []).append(arn)
+        return self.attachments
+
+    def action_statements(self, action):
+        """Return the ids of the statements whose action part matches an action.
+
+        Parameters
+        ----------
+        action : str
+            Action looked for (ex : iam:PassRole)
+
+        Returns
+        -------
+        statements : set of int
+            Ids of the statements
+        """
+        action = action.lower()
+        ids = set(self.actions.get(action, []))
+
+        for pattern, statements in self.wildcards.items():
+            if fnmatchcase(action, pattern):
+                ids.update(statements)
+
+        for statement_id in self.not_actions:
+            if not match(self.statements[statement_id]["not_actions"], action):
+                ids.add(statement_id)
+
+        return ids
+
+    def resource_matches(self, statement, resource):
+        """Verify if the resource part of a statement matches a resource.
+
+        Parameters
+        ----------
+        statement : dict
+            Statement of the index
+        resource : str
+            Arn of the resource
+
+        Returns
+        -------
+        match : bool
+            True if the statement applies to the resource
+        """
+        if statement["not_resources"]:
+            return not match(statement["not_resources"], resource, True)
+        return match(statement["resources"], resource, True)
+
+    def all_resources(self, statement):
+        """Verify if a statement applies to every resource.
+
+        Parameters
+        ----------
+        statement : dict
+            Statement of the index
+
+        Returns
+        -------
+        all : bool
+            True if the resource part of the statement is *
+        """
+        return not statement["not_resources"] and "*" in statement["resources"]
+
+    def principals_allowed(self, action, resource=None):
+        """Return the principals allowed to do an action on a resource by their identity policies.
+        An explicit deny wins over an allow. Conditions, permissions boundaries and SCPs are not evaluated,
+        the allowing statements with a condition are returned so they can be verified.
+
+        Parameters
+        ----------
+        action : str
+            Action looked for (ex : iam:PassRole)
+        resource : str, optional
+            Arn of the resource. If not given, the principals allowed on at least one resource are returned, a deny only winning if it applies to every resource
+
+        Returns
+        -------
+        principals : dict
+            Allowing statements of each allowed principal
+        """
+        allowed = {}
+        denied = set()
+
+        statements = [statement_id for statement_id in self.action_statements(action) if resource is None or self.resource_matches(self.statements[statement_id], resource)]
+        by_policy = {}
+        for statement_id in statements:
+            by_policy.setdefault(self.statements[statement_id]["policy"], []).append(statement_id)
+
+        attachments = self.get_attachments()
+
+        for policy_id, statement_ids in by_policy.items():
+            for arn in attachments.get(policy_id, []):
+                for statement_id in statement_ids:
+                    statement = self.statements[statement_id]
+                    if statement["effect"] == "Deny" and not statement["condition"]:
+                        if resource is not None or self.all_resources(statement):
+                            denied.add(arn)
+                    elif statement["effect"] == "Allow":
+                        allowed.setdefault(arn, []).append(statement)
+
+        return {arn: statements for arn, statements in allowed.items() if arn not in denied}
+
+    def can(self, arn, action, resource=None):
+        """Verify if a principal is allowed to do an action on a resource by its identity policies.
+
+        Parameters
+        ----------
+        arn : str
+            Arn of the principal
+        action : str
+            Action looked for (ex : s3:GetObject)
+        resource : str, optional
+            Arn of the resource. Any resource if not given
+
+        Returns
+        -------
+        allowed : bool
+            True if an allowing statement and no explicit deny was found
+        """
+        return arn in self.principals_allowed(action, resource)
+
+    def permissions(self, arn):
+        """Return every statement applying to a principal.
+
+        Parameters
+        ----------
+        arn : str
+            Arn of the principal
+
+        Returns
+        -------
+        statements : list of dict
+            Statements of the policies of the principal and of its groups
+        """
+        statements = []
+        for policy_id in self.principal_policies(arn):
+            for statement_id in self.policies.get(policy_id, {}).get("statements", []):
+                statements.append(self.statements[statement_id])
+        return statements
+
+    def trusting(self, principal):
+        """Return the roles whose trust policy allows a principal to assume them.
+
+        Parameters
+        ----------
+        principal : str
+            Account id, arn or service (ex : 123456789012, arn:aws:iam::123456789012:role/x, ec2.amazonaws.com)
+
+        Returns
+        -------
+        roles : list of str
+            Arns of the roles
+        """
+        roles = []
+
+        for arn, statements in self.trusts.items():
+            for statement in statements:
+                if statement.get("Effect", "Allow") != "Allow":
+                    continue
+
+                trusted = statement.get("Principal", {})
+                if trusted == "*":
+                    values = ["*"]
+                else:
+                    values = [value for values in trusted.values() for value in as_list(values)]
+
+                if any(value == "*" or value == principal or value == f"arn:aws:iam::{principal}:root" or (principal.startswith("arn:") and value == f"arn:aws:iam::{principal.split(':')[4]}:root") for value in values):
+                    roles.append(arn)
+                    break
+
+        return roles
@@ -0,0 +1,465 @@
+"""File containing the instrumentation of the AWS calls and the timing report of the run."""
+
+import os, threading, resource, tracemalloc
+from time import monotonic, sleep
+from json import dumps
+from contextlib import contextmanager
+
+from source.utils.throttle import THROTTLING_ERRORS
+from source.utils.metrics import emit, inc, set_gauge
+
+
+CALLS = {}
+STEPS = []
+SERVICES = []
+PAGINATED = {}
+LOCK = threading.Lock()
+
+# Number of operations listed in the text report
+REPORT_TOP = 10
+
+# Seconds between two samples of the resident memory
+SAMPLE_INTERVAL = 0.5
+
+# Number of allocation sites kept for each service with --memory-profile
+PROFILE_TOP = 5
+
+# Memory kept by a service, in bytes, above which its allocation sites are looked for. Snapshots are slow on a large heap
+PROFILE_THRESHOLD = 1024 * 1024
+
+# Resident memory, in bytes, above which the collected results are flushed to the disk. None if there is no budget
+MAX_MEMORY = None
+
+SCOPES = []
+SAMPLER = None
+LAST_SNAPSHOT = None
+
+def set_report_top(top):
+    """Set the number of operations listed in the text report.
+
+    Parameters
+    ----------
+    top : int
+        Number of operations
+    """
+    global REPORT_TOP
+    REPORT_TOP = top
+
+def set_memory(max_memory=None, profile=False):
+    """Set the memory budget of the run and start the profiling of the allocations.
+
+    Parameters
+    ----------
+    max_memory : int, optional
+        Budget of resident memory, in megabytes
+    profile : bool, optional
+        True if the allocations of each service are traced with tracemalloc
+    """
+    global MAX_MEMORY
+    global LAST_SNAPSHOT
+
+    if max_memory:
+        MAX_MEMORY = max_memory * 1024 * 1024
+    if profile and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        LAST_SNAPSHOT = tracemalloc.take_snapshot()
+
+def current_rss():
+    """Return the resident memory of the process.
+
+    Returns
+    -------
+    rss : int
+        Resident memory, in bytes
+    """
+    try:
+        with open("/proc/self/statm", "rt") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # no procfs (macOS, ...) : the peak of the process is the best available value
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if os.uname().sysname == "Darwin" else rss * 1024
+
+def over_memory_budget():
+    """Verify if the resident memory of the process is above the budget given with --max-memory.
+
+    Returns
+    -------
+    over : bool
+        True if the budget is exceeded
+    """
+    return MAX_MEMORY is not None and current_rss() > MAX_MEMORY
+
+def sample_rss():
+    """Sample the resident memory and update the peak of every open scope (steps and services).
+
+    Returns
+    -------
+    rss : int
+        Resident memory, in bytes
+    """
+    rss = current_rss()
+    with LOCK:
+        for scope in SCOPES:
+            scope["peak_rss"] = max(scope["peak_rss"], rss)
+    set_gauge("invictus_aws_resident_memory_bytes", rss)
+    return rss
+
+def run_sampler():
+    """Sample the resident memory until the end of the process."""
+    while True:
+        sleep(SAMPLE_INTERVAL)
+        sample_rss()
+
+def open_scope():
+    """Start following the peak resident memory of a step or a service, starting the sampler if needed.
+
+    Returns
+    -------
+    scope : dict
+        Resident memory at the start and peak
+    """
+    global SAMPLER
+
+    with LOCK:
+        if SAMPLER is None:
+            SAMPLER = threading.Thread(target=run_sampler, name="invictus-rss", daemon=True)
+            SAMPLER.start()
+
+    rss = current_rss()
+    scope = {"start_rss": rss, "peak_rss": rss}
+    with LOCK:
+        SCOPES.append(scope)
+    return scope
+
+def close_scope(scope):
+    """Stop following the resident memory of a step or a service.
+
+    Parameters
+    ----------
+    scope : dict
+        Scope returned by open_scope
+
+    Returns
+    -------
+    memory : dict
+        Resident memory at the start and at the end, and peak, in bytes
+    """
+    rss = sample_rss()
+    with LOCK:
+        # removed by identity, two scopes can have the same values
+        SCOPES[:] = [el for el in SCOPES if el is not scope]
+    return {"start_rss": scope["start_rss"], "rss": rss, "peak_rss": scope["peak_rss"]}
+
+def allocation_sites():
+    """Return the lines that allocated the most memory still in use since the previous snapshot.
+
+    Returns
+    -------
+    sites : list of dict
+        File, line, size and number of the allocations of each site
+    """
+    global LAST_SNAPSHOT
+
+    snapshot = tracemalloc.take_snapshot()
+    stats = [stat for stat in snapshot.compare_to(LAST_SNAPSHOT, "lineno") if stat.size_diff > 0]
+    LAST_SNAPSHOT = snapshot
+
+    stats.sort(key=lambda stat: stat.size_diff, reverse=True)
+
+    sites = []
+    for stat in stats[:PROFILE_TOP]:
+        frame = stat.traceback[0]
+        sites.append({"site": f"{frame.filename}:{frame.lineno}", "size": stat.size_diff, "count": stat.count_diff})
+    return sites
+
+def new_entry():
+    """Return the counters of an operation.
+
+    Returns
+    -------
+    entry : dict
+        Counters of the operation
+    """
+    return {"calls": 0, "errors": 0, "retries": 0, "throttles": 0, "pages": 0, "bytes": 0, "time": 0.0, "max_time": 0.0}
+
+def record_call(key, duration, retries, code, size, paginated):
+    """Record a call made to AWS.
+
+    Parameters
+    ----------
+    key : tuple of str
+        Region, service and operation
+    duration : float
+        Time of the call, retries included, in seconds
+    retries : int
+        Number of retries made by botocore
+    code : str
+        Error code of the call. None if it succeeded
+    size : int
+        Size of the response, in bytes
+    paginated : bool
+        True if the operation can be paginated, each call then being a page
+    """
+    with LOCK:
+        entry = CALLS.setdefault(key, new_entry())
+        entry["calls"] += 1
+        entry["retries"] += retries
+        entry["bytes"] += size
+        entry["time"] += duration
+        entry["max_time"] = max(entry["max_time"], duration)
+        if paginated:
+            entry["pages"] += 1
+        if code:
+            entry["errors"] += 1
+
+    region, service, operation = key
+    inc("invictus_aws_api_calls_total", region=region, service=service)
+    if code:
+        inc("invictus_aws_api_errors_total", region=region, service=service)
+        emit("api_error", region=region, service=service, operation=operation, code=code)
+
+def record_throttle(key):
+    """Record a throttled attempt of a call.
+
+    Parameters
+    ----------
+    key : tuple of str
+        Region, service and operation
+    """
+    with LOCK:
+        CALLS.setdefault(key, new_entry())["throttles"] += 1
+    inc("invictus_aws_api_throttles_total", region=key[0], service=key[1])
+
+def paginated_operations(client):
+    """Return the operations of a client that can be paginated.
+
+    Parameters
+    ----------
+    client : object
+        Boto3 client
+
+    Returns
+    -------
+    operations : set of str
+        Names of the operations (ListBuckets, DescribeInstances, ...)
+    """
+    return {api for method, api in client.meta.method_to_api_mapping.items() if client.can_paginate(method)}
+
+def register_instrumentation(client):
+    """Register the timing and the counters on every call made by a client.
+
+    Parameters
+    ----------
+    client : object
+        Boto3 client
+    """
+    service = client.meta.service_model.service_name
+    region = client.meta.region_name or "global"
+
+    with LOCK:
+        if service not in PAGINATED:
+            PAGINATED[service] = paginated_operations(client)
+
+    # before-parameter-build is used instead of before-call, as a handler of before-call can answer the call by itself and skip the others
+    def before_call(model, context, **kwargs):
+        context["invictus_start"] = monotonic()
+
+    def after_call(http_response, parsed, model, context, **kwargs):
+        start = context.pop("invictus_start", None)
+        if start is None:
+            return
+
+        size = 0
+        if http_response is not None:
+            size = int(http_response.headers.get("content-length") or 0)
+
+        record_call(
+            (region, service, model.name),
+            monotonic() - start,
+            parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0),
+            parsed.get("Error", {}).get("Code"),
+            size,
+            model.name in PAGINATED[service],
+        )
+
+    def needs_retry(response, operation, **kwargs):
+        if response is not None and response[1].get("Error", {}).get("Code") in THROTTLING_ERRORS:
+            record_throttle((region, service, operation.name))
+        return None
+
+    client.meta.events.register("before-parameter-build", before_call)
+    client.meta.events.register("after-call", after_call)
+    client.meta.events.register("needs-retry", needs_retry)
+
+@contextmanager
+def timed_step(step, region):
+    """Measure the wall time of a step in a region.
+
+    Parameters
+    ----------
+    step : str
+        Name of the step (enumeration, configuration, logs, analysis)
+    region : str
+        Region where the step is run
+    """
+    start = monotonic()
+    scope = open_scope()
+    set_gauge("invictus_aws_step_running", 1, step=step, region=region)
+    emit("step_start", step=step, region=region)
+    try:
+        yield
+    finally:
+        entry = {"step": step, "region": region, "time": monotonic() - start}
+        entry.update(close_scope(scope))
+        with LOCK:
+            STEPS.append(entry)
+
+        set_gauge("invictus_aws_step_running", 0, step=step, region=region)
+        set_gauge("invictus_aws_step_duration_seconds", entry["time"], step=step, region=region)
+        inc("invictus_aws_steps_completed_total", step=step, region=region)
+        emit("step_end", **entry)
+
+@contextmanager
+def timed_service(step, region, service):
+    """Measure the wall time and the memory of the unit of a service in a step.
+    With --memory-profile, the memory traced by tracemalloc is also kept, with the lines allocating the most for the services keeping more than PROFILE_THRESHOLD.
+
+    Parameters
+    ----------
+    step : str
+        Name of the step (enumeration, configuration, logs)
+    region : str
+        Region where the step is run
+    service : str
+        Name of the service
+    """
+    start = monotonic()
+    scope = open_scope()
+    emit("service_start", step=step, region=region, service=service)
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        traced = tracemalloc.get_traced_memory()[0]
+
+    try:
+        yield
+    finally:
+        entry = {"step": step, "region": region, "service": service, "time": monotonic() - start}
+        entry.update(close_scope(scope))
+
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            entry["traced"] = current - traced
+            entry["traced_peak"] = peak - traced
+            entry["allocations"] = allocation_sites() if entry["traced"] >= PROFILE_THRESHOLD and LAST_SNAPSHOT is not None else []
+
+        with LOCK:
+            SERVICES.append(entry)
+
+        inc("invictus_aws_services_completed_total", step=step, region=region)
+        emit("service_end", **{key: value for key, value in entry.items() if key != "allocations"})
+
+def build_report():
+    """Return the report of the run : wall time of each step, wall time of each service and counters of each operation, the slowest first.
+
+    Returns
+    -------
+    report : dict
+        Report of the run
+    """
+    with LOCK:
+        calls = {key: dict(entry) for key, entry in CALLS.items()}
+        steps = list(STEPS)
+        services = sorted(SERVICES, key=lambda entry: entry["time"], reverse=True)
+
+    operations = []
+    for (region, service, operation), entry in calls.items():
+        entry.update({"region": region, "service": service, "operation": operation})
+        entry["mean_time"] = entry["time"] / entry["calls"] if entry["calls"] else 0.0
+        operations.append(entry)
+    operations.sort(key=lambda entry: entry["time"], reverse=True)
+
+    totals = new_entry()
+    totals.pop("max_time")
+    for entry in operations:
+        for counter in totals:
+            totals[counter] += entry[counter]
+
+    return {"steps": steps, "services": services, "totals": totals, "operations": operations}
+
+def format_report(report, top=None):
+    """Return the report of the run as text.
+
+    Parameters
+    ----------
+    report : dict
+        Report built by build_report
+    top : int, optional
+        Number of operations listed. REPORT_TOP if None
+
+    Returns
+    -------
+    text : str
+        Text report
+    """
+    if top is None:
+        top = REPORT_TOP
+
+    lines = ["Steps :"]
+    for step in report["steps"]:
+        lines.append(f"  {step['step']:<15} {step['region']:<16} {step['time']:>10.1f}s   peak rss {step['peak_rss'] / 1048576:>8.1f} MB")
+
+    lines.append("")
+    lines.append(f"Top {top} slowest services :")
+    for entry in report["services"][:top]:
+        lines.append(f"  {entry['step']:<15} {entry['region']:<16} {entry['service']:<22} {entry['time']:>10.1f}s   peak rss {entry['peak_rss'] / 1048576:>8.1f} MB")
+
+    profiled = [entry for entry in report["services"] if "traced" in entry]
+    if profiled:
+        lines.append("")
+        lines.append(f"Top {top} services by memory kept (tracemalloc) :")
+        for entry in sorted(profiled, key=lambda entry: entry["traced"], reverse=True)[:top]:
+            lines.append(f"  {entry['step']:<15} {entry['region']:<16} {entry['service']:<22} kept {entry['traced'] / 1048576:>8.1f} MB   peak {entry['traced_peak'] / 1048576:>8.1f} MB")
+            for site in entry["allocations"]:
+                lines.append(f"      {site['size'] / 1048576:>8.1f} MB  {site['count']:>9} blocks  {site['site']}")
+
+    totals = report["totals"]
+    lines.append("")
+    lines.append(f"AWS calls : {totals['calls']}, errors : {totals['errors']}, retries : {totals['retries']}, throttles : {totals['throttles']}, pages : {totals['pages']}, bytes : {totals['bytes']}, time in calls : {totals['time']:.1f}s")
+    lines.append("")
+    lines.append(f"Top {top} slowest operations (total time) :")
+    lines.append(f"  {'region':<16} {'service':<22} {'operation':<40} {'calls':>7} {'total':>9} {'mean':>8} {'max':>8} {'retries':>8} {'throttles':>9} {'bytes':>12}")
+    for entry in report["operations"][:top]:
+        lines.append(f"  {entry['region']:<16} {entry['service']:<22} {entry['operation']:<40} {entry['calls']:>7} {entry['time']:>8.2f}s {entry['mean_time']:>7.3f}s {entry['max_time']:>7.3f}s {entry['retries']:>8} {entry['throttles']:>9} {entry['bytes']:>12}")
+
+    return "\n".join(lines) + "\n"
+
+def write_report(folder, run_id):
+    """Write the JSON and text reports of the run.
+
+    Parameters
+    ----------
+    folder : str
+        Folder where the reports are written
+    run_id : str
+        Id of the run, used as the name of the reports
+
+    Returns
+    -------
+    path : str
+        Path of the reports, without the extension. None if no call was made
+    """
+    report = build_report()
+    if not report["operations"] and not report["steps"]:
+        return None
+
+    os.makedirs(folder, exist_ok=True)
+    path = f"{folder}{run_id}"
+
+    with open(f"{path}.json", "w") as f:
+        f.write(dumps(report, indent=4))
+    with open(f"{path}.txt", "w") as f:
+        f.write(format_report(report))
+
+    return path
@@ -0,0 +1,171 @@
+"""File containing the journal used to checkpoint a run and resume it later."""
+
+import os, threading
+from json import dumps, loads
+
+
+class Journal:
+
+    run_id = None
+    path = None
+    units = None
+    batches = None
+    buckets = None
+    lock = None
+
+    def __init__(self, folder, run_id, resume=False):
+        """Handle the constructor of the Journal class.
+
+        Parameters
+        ----------
+        folder : str
+            Folder where the journals of all the runs are kept
+        run_id : str
+            Identifier of the run
+        resume : bool, optional
+            True if the journal of an interrupted run has to be loaded
+        """
+        self.run_id = run_id
+        self.path = f"{folder}{run_id}/"
+        self.units = {}
+        self.batches = {}
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+        os.makedirs(self.path, exist_ok=True)
+
+        if resume:
+            self.load_journal()
+
+    def load_journal(self):
+        """Read the journal file of the run and rebuild the completed units and transfers."""
+        journal = f"{self.path}journal.jsonl"
+        if not os.path.isfile(journal):
+            return
+
+        with open(journal, "rt") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = loads(line)
+                except ValueError:
+                    # last line can be truncated if the run was killed while writing it
+                    continue
+
+                if entry["type"] == "run":
+                    self.buckets = entry["buckets"]
+                elif entry["type"] == "unit":
+                    self.units[(entry["region"], entry["step"], entry["service"])] = entry["output"]
+                elif entry["type"] == "batch":
+                    self.batches[entry["transfer"]] = entry["last_key"]
+
+    def append(self, entry):
+        """Append an entry to the journal file and flush it to the disk.
+
+        Parameters
+        ----------
+        entry : dict
+            Entry to be written
+        """
+        with self.lock:
+            with open(f"{self.path}journal.jsonl", "a") as f:
+                f.write(dumps(entry, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def start(self, buckets):
+        """Record the buckets used by the run, so a resumed run writes in the same ones.
+
+        Parameters
+        ----------
+        buckets : dict
+            Name of the buckets used by the run
+        """
+        if not self.buckets:
+            self.buckets = buckets
+            self.append({"type": "run", "run_id": self.run_id, "buckets": buckets})
+
+    def is_done(self, region, step, service):
+        """Verify if a unit was already completed.
+
+        Parameters
+        ----------
+        region : str
+            Region of the unit
+        step : str
+            Step of the unit (enumeration, configuration, logs)
+        service : str
+            Service of the unit
+
+        Returns
+        -------
+        done : bool
+            True if the unit was completed by a previous run
+        """
+        return (region, step, service) in self.units
+
+    def mark_done(self, region, step, service, output):
+        """Mark a unit as completed, with where its results were written. The results themselves are not copied in the journal.
+
+        Parameters
+        ----------
+        region : str
+            Region of the unit
+        step : str
+            Step of the unit (enumeration, configuration, logs)
+        service : str
+            Service of the unit
+        output : dict
+            Where the results of the unit were written and how many elements they contain
+        """
+        self.units[(region, step, service)] = output
+        self.append({"type": "unit", "region": region, "step": step, "service": service, "output": output})
+
+    def output(self, region, step, service):
+        """Return where the results of a completed unit were written.
+
+        Parameters
+        ----------
+        region : str
+            Region of the unit
+        step : str
+            Step of the unit (enumeration, configuration, logs)
+        service : str
+            Service of the unit
+
+        Returns
+        -------
+        output : dict
+            Where the results of the unit were written and how many elements they contain
+        """
+        return self.units[(region, step, service)]
+
+    def last_key(self, transfer):
+        """Return the last key of a transfer that was entirely processed.
+
+        Parameters
+        ----------
+        transfer : str
+            Identifier of the transfer (source, prefix and destination)
+
+        Returns
+        -------
+        key : str
+            Last processed key. Empty if the transfer never started
+        """
+        return self.batches.get(transfer, "")
+
+    def mark_batch(self, transfer, last_key):
+        """Record that every object of a transfer up to last_key was processed.
+
+        Parameters
+        ----------
+        transfer : str
+            Identifier of the transfer (source, prefix and destination)
+        last_key : str
+            Last key of the processed batch
+        """
+        self.batches[transfer] = last_key
+        self.append({"type": "batch", "transfer": transfer, "last_key": last_key})
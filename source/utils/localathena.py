@@ -0,0 +1,1649 @@
+"""File containing the local stand-in of Athena and S3 (--local-athena) : the queries of the analysis run on sqlite, over buckets kept in a local folder, without any network access."""
+
+import os, re, gzip, sqlite3, threading, datetime, asyncio
+from io import BytesIO
+from uuid import uuid4
+from json import dumps, loads
+from time import monotonic, sleep
+from urllib.parse import unquote
+from concurrent.futures import ThreadPoolExecutor
+from botocore.awsrequest import AWSResponse
+from botocore.response import StreamingBody
+
+CATALOG = "AwsDataCatalog"
+DEFAULT_DATABASE = "default"
+TEXT_INPUT_FORMAT = "org.apache.hadoop.mapred.TextInputFormat"
+TRAIL_INPUT_FORMAT = "com.amazon.emr.cloudtrail.CloudTrailInputFormat"
+OUTPUT_FORMAT = "org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat"
+DEFAULT_SERDE = "org.apache.hive.hcatalog.data.JsonSerDe"
+
+# Maximum number of rows of a page of GetQueryResults, the header included
+RESULTS_PAGE_SIZE = 1000
+
+# Empty file standing for the "folders" of S3 (keys ending with a /), so they are listed as in S3
+FOLDER_MARKER = ".s3-folder"
+
+'''
+Statements understood by the stand-in. The other ones fail as an unsupported statement would in Athena.
+'''
+CREATE_DATABASE = re.compile(r"^\s*CREATE\s+(?:DATABASE|SCHEMA)\s+(IF\s+NOT\s+EXISTS\s+)?`?(\w+)`?\s*;?\s*$", re.IGNORECASE)
+DROP_DATABASE = re.compile(r"^\s*DROP\s+(?:DATABASE|SCHEMA)\s+(IF\s+EXISTS\s+)?`?(\w+)`?(\s+CASCADE)?\s*;?\s*$", re.IGNORECASE)
+CREATE_TABLE = re.compile(r"^\s*CREATE\s+(?:EXTERNAL\s+)?TABLE\s+(IF\s+NOT\s+EXISTS\s+)?([`\w.]+)\s*\(", re.IGNORECASE)
+DROP_TABLE = re.compile(r"^\s*DROP\s+TABLE\s+(IF\s+EXISTS\s+)?([`\w.]+)\s*;?\s*$", re.IGNORECASE)
+SELECT = re.compile(r"^\s*\(?\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+IDENTIFIER = r'[A-Za-z_]\w*|"[^"]+"'
+CHAIN = re.compile(rf'(?<![\w."])({IDENTIFIER})((?:\.(?:{IDENTIFIER}))*)')
+TABLE_REFERENCE = re.compile(rf'\b(FROM|JOIN)(\s+)({IDENTIFIER})(?![\w."])', re.IGNORECASE)
+LITERAL = re.compile(r"('(?:[^']|'')*')")
+
+# Value of the CSV results, quoted or empty for null, with the separator following it
+CSV_FIELD = re.compile(rb'(?:"((?:[^"]|"")*)"|)(,|\n)')
+
+SQLITE_TYPES = {"tinyint": "INTEGER", "smallint": "INTEGER", "int": "INTEGER", "integer": "INTEGER", "bigint": "INTEGER", "boolean": "INTEGER", "float": "REAL", "double": "REAL", "decimal": "REAL"}
+ATHENA_TYPES = {"string": "varchar", "char": "char", "varchar": "varchar", "int": "integer", "struct": "row"}
+
+UNITS = {"millisecond": 0.001, "second": 1, "minute": 60, "hour": 3600, "day": 86400, "week": 604800}
+
+
+class LocalError(Exception):
+
+    code = None
+    status = None
+
+    def __init__(self, code, message, status=400):
+        """Handle the constructor of the LocalError class.
+
+        Parameters
+        ----------
+        code : str
+            Code of the error, as returned by AWS (NoSuchKey, MetadataException, ...)
+        message : str
+            Message of the error
+        status : int, optional
+            HTTP status of the error
+        """
+        super().__init__(message)
+        self.code = code
+        self.status = status
+
+##########
+# FORMAT #
+##########
+
+def split_top_level(text, separator=","):
+    """Split a text on a separator, except inside <>, () and quotes.
+
+    Parameters
+    ----------
+    text : str
+        Text to split
+    separator : str, optional
+        Separator
+
+    Returns
+    -------
+    parts : list of str
+        Parts of the text, stripped
+    """
+    parts = []
+    depth = 0
+    quoted = False
+    current = ""
+
+    for char in text:
+        if char == "'":
+            quoted = not quoted
+        elif not quoted and char in "<([":
+            depth += 1
+        elif not quoted and char in ">)]":
+            depth -= 1
+        elif not quoted and depth == 0 and char == separator:
+            parts.append(current.strip())
+            current = ""
+            continue
+        current += char
+
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+def closing_parenthesis(text, start):
+    """Return the position of the parenthesis closing the one at start.
+
+    Parameters
+    ----------
+    text : str
+        Text
+    start : int
+        Position of the opening parenthesis
+
+    Returns
+    -------
+    end : int
+        Position of the closing parenthesis, -1 if it is missing
+    """
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == "(":
+            depth += 1
+        elif text[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+def parse_type(text):
+    """Parse a Hive type (string, struct<...>, array<...>, map<...>).
+
+    Parameters
+    ----------
+    text : str
+        Type
+
+    Returns
+    -------
+    kind : tuple
+        Kind of the type and its content : the fields of a struct, the type of the elements of an array, the types of the keys and values of a map, the name of a scalar type
+    """
+    text = text.strip()
+    lower = text.lower()
+
+    if lower.startswith("struct<") and text.endswith(">"):
+        fields = []
+        for field in split_top_level(text[7:-1]):
+            name, kind = field.split(":", 1)
+            fields.append((name.strip().strip("`").lower(), parse_type(kind)))
+        return ("struct", fields)
+    if lower.startswith("array<") and text.endswith(">"):
+        return ("array", parse_type(text[6:-1]))
+    if lower.startswith("map<") and text.endswith(">"):
+        key, value = split_top_level(text[4:-1])
+        return ("map", (parse_type(key), parse_type(value)))
+    return ("scalar", lower.split("(")[0].strip())
+
+def convert(value, kind):
+    """Convert a value of a JSON record to the type of its column, as the JSON SerDe of Hive does. The names of the fields of a struct are matched whatever their case.
+
+    Parameters
+    ----------
+    value : object
+        Value of the record
+    kind : tuple
+        Type of the column, as returned by parse_type
+
+    Returns
+    -------
+    value : object
+        Converted value
+    """
+    if value is None:
+        return None
+
+    name, content = kind
+
+    if name == "struct":
+        if not isinstance(value, dict):
+            return None
+        fields = {key.lower(): item for key, item in value.items()}
+        return {field: convert(fields.get(field), sub) for field, sub in content}
+    if name == "array":
+        return [convert(item, content) for item in value] if isinstance(value, list) else None
+    if name == "map":
+        return {str(key): convert(item, content[1]) for key, item in value.items()} if isinstance(value, dict) else None
+
+    try:
+        if content in ("tinyint", "smallint", "int", "integer", "bigint"):
+            return int(value)
+        if content in ("float", "double", "decimal"):
+            return float(value)
+        if content == "boolean":
+            return int(value) if isinstance(value, bool) else int(str(value).lower() == "true")
+    except (TypeError, ValueError):
+        return None
+
+    # nested objects read as a string are kept as JSON, as Athena does with the CloudTrail requestParameters
+    if isinstance(value, (dict, list)):
+        return dumps(value, separators=(",", ":"))
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+def render(value):
+    """Return a value of a struct, array or map as Athena writes it in its results ({key=value, ...}).
+
+    Parameters
+    ----------
+    value : object
+        Value
+
+    Returns
+    -------
+    value : str
+        Value written
+    """
+    if value is None:
+        return "null"
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{key}={render(item)}" for key, item in value.items()) + "}"
+    if isinstance(value, list):
+        return "[" + ", ".join(render(item) for item in value) + "]"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+def athena_type(kind):
+    """Return the name of a type in the metadata of the results of Athena.
+
+    Parameters
+    ----------
+    kind : tuple
+        Type, as returned by parse_type
+
+    Returns
+    -------
+    name : str
+        Name of the type (varchar, row, array, ...)
+    """
+    name = kind[1] if kind[0] == "scalar" else kind[0]
+    return ATHENA_TYPES.get(name, name)
+
+def csv_line(values):
+    """Return a line of the CSV results of a query, as Athena writes them : every value quoted, null values empty.
+
+    Parameters
+    ----------
+    values : list of str
+        Values of the line
+
+    Returns
+    -------
+    line : str
+        Line of the CSV file
+    """
+    return ",".join("" if value is None else '"' + value.replace('"', '""') + '"' for value in values) + "\n"
+
+def read_csv_rows(f, count):
+    """Read rows of the CSV results of a query, as written by csv_line. A quoted value can hold line breaks, a row ends with the first line leaving no quote open.
+
+    Parameters
+    ----------
+    f : file
+        Results, opened in binary mode at the start of a row
+    count : int
+        Number of rows read
+
+    Returns
+    -------
+    rows : list of list
+        Values of the rows, None for the null values
+    """
+    rows = []
+    while len(rows) < count:
+        line = f.readline()
+        if not line:
+            break
+        while line.count(b'"') % 2:
+            line += f.readline()
+        values = (field.group(1) for field in CSV_FIELD.finditer(line))
+        rows.append([None if value is None else value.replace(b'""', b'"').decode("utf-8") for value in values])
+    return rows
+
+def split_location(location):
+    """Split a S3 location in bucket and prefix. The prefix always ends with a /.
+
+    Parameters
+    ----------
+    location : str
+        Location (s3://bucket/prefix/)
+
+    Returns
+    -------
+    bucket : str
+        Name of the bucket
+    prefix : str
+        Path in the bucket
+    """
+    path = location.replace("s3://", "", 1)
+    bucket, _, prefix = path.partition("/")
+    if prefix and not prefix.endswith("/"):
+        prefix += "/"
+    return bucket, prefix
+
+#################
+# SQL FUNCTIONS #
+#################
+
+def parse_timestamp(value):
+    """Parse a timestamp written by Athena, sqlite or in ISO 8601.
+
+    Parameters
+    ----------
+    value : str
+        Timestamp
+
+    Returns
+    -------
+    time : datetime
+        Timestamp, in UTC
+    """
+    time = datetime.datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=datetime.timezone.utc)
+    return time.astimezone(datetime.timezone.utc)
+
+def from_iso8601_timestamp(value):
+    """from_iso8601_timestamp of Presto : the timestamp is written as sqlite does, so it compares with current_timestamp."""
+    if value is None:
+        return None
+    try:
+        return parse_timestamp(value).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    except ValueError:
+        return None
+
+def date_diff(unit, start, end):
+    """date_diff of Presto : number of whole units between two timestamps."""
+    if start is None or end is None:
+        return None
+
+    unit = str(unit).lower()
+    start = parse_timestamp(start)
+    end = parse_timestamp(end)
+
+    if unit in UNITS:
+        return int((end - start).total_seconds() / UNITS[unit])
+
+    months = (end.year - start.year) * 12 + end.month - start.month
+    if months > 0 and end.replace(year=start.year, month=start.month) < start:
+        months -= 1
+    elif months < 0 and end.replace(year=start.year, month=start.month) > start:
+        months += 1
+    return {"month": months, "quarter": int(months / 3), "year": int(months / 12)}.get(unit)
+
+def regexp_extract(value, pattern, group=0):
+    """regexp_extract of Presto : first match of a pattern, or of one of its groups."""
+    if value is None:
+        return None
+    match = re.search(pattern, str(value))
+    return match.group(group) if match else None
+
+def regexp_like(value, pattern):
+    """regexp_like of Presto : 1 if the pattern is found in the value."""
+    if value is None:
+        return None
+    return int(re.search(pattern, str(value)) is not None)
+
+def json_extract_scalar(value, path):
+    """json_extract_scalar of Presto : scalar found at a JSON path ($.a.b, $.a[0], $["a"]), null for objects and arrays."""
+    if value is None:
+        return None
+    try:
+        item = loads(value)
+    except ValueError:
+        return None
+
+    for name, index, quoted in re.findall(r'\.(\w+)|\[(\d+)\]|\["([^"]+)"\]', path):
+        if index:
+            item = item[int(index)] if isinstance(item, list) and int(index) < len(item) else None
+        else:
+            item = item.get(name or quoted) if isinstance(item, dict) else None
+        if item is None:
+            return None
+
+    if isinstance(item, (dict, list)):
+        return None
+    if isinstance(item, bool):
+        return "true" if item else "false"
+    return str(item)
+
+def connect(path):
+    """Open the sqlite database of the tables, with the functions of Presto used by the queries of the tool.
+
+    Parameters
+    ----------
+    path : str
+        File of the database
+
+    Returns
+    -------
+    connection : Connection
+        Sqlite connection
+    """
+    connection = sqlite3.connect(path)
+    # the workers read while a table is loaded
+    connection.execute("PRAGMA journal_mode = WAL")
+    # LIKE is case sensitive in Athena
+    connection.execute("PRAGMA case_sensitive_like = ON")
+    connection.create_function("from_iso8601_timestamp", 1, from_iso8601_timestamp, deterministic=True)
+    connection.create_function("date_diff", 3, date_diff, deterministic=True)
+    connection.create_function("regexp_extract", 2, regexp_extract, deterministic=True)
+    connection.create_function("regexp_extract", 3, regexp_extract, deterministic=True)
+    connection.create_function("regexp_like", 2, regexp_like, deterministic=True)
+    connection.create_function("json_extract_scalar", 2, json_extract_scalar, deterministic=True)
+    return connection
+
+
+class LocalStorage:
+
+    folder = None
+    lock = None
+    uploads = None
+    operations = None
+
+    def __init__(self, folder):
+        """Handle the constructor of the LocalStorage class. Each bucket is a folder of the storage, each object a file.
+
+        Parameters
+        ----------
+        folder : str
+            Folder of the buckets
+        """
+        self.folder = folder
+        self.lock = threading.Lock()
+        self.uploads = {}
+        os.makedirs(folder, exist_ok=True)
+
+        self.operations = {
+            "ListBuckets": self.list_buckets,
+            "CreateBucket": self.create_bucket,
+            "HeadBucket": self.head_bucket,
+            "GetBucketLocation": self.get_bucket_location,
+            "DeleteBucket": self.delete_bucket,
+            "ListObjectsV2": self.list_objects_v2,
+            "PutObject": self.put_object,
+            "GetObject": self.get_object,
+            "HeadObject": self.head_object,
+            "CopyObject": self.copy_object,
+            "DeleteObject": self.delete_object,
+            "DeleteObjects": self.delete_objects,
+            "CreateMultipartUpload": self.create_multipart_upload,
+            "UploadPart": self.upload_part,
+            "CompleteMultipartUpload": self.complete_multipart_upload,
+            "AbortMultipartUpload": self.abort_multipart_upload,
+        }
+
+    def bucket_folder(self, bucket, create=False):
+        """Return the folder of a bucket.
+
+        Parameters
+        ----------
+        bucket : str
+            Name of the bucket
+        create : bool, optional
+            True to create the bucket if it doesn't exist
+
+        Returns
+        -------
+        folder : str
+            Folder of the bucket
+        """
+        if not bucket or "/" in bucket or bucket.startswith("."):
+            raise LocalError("InvalidBucketName", f"The specified bucket is not valid : {bucket}")
+
+        folder = os.path.join(self.folder, bucket)
+        if create:
+            os.makedirs(folder, exist_ok=True)
+        elif not os.path.isdir(folder):
+            raise LocalError("NoSuchBucket", f"The specified bucket does not exist : {bucket}", 404)
+        return folder
+
+    def path(self, bucket, key):
+        """Return the file of an object.
+
+        Parameters
+        ----------
+        bucket : str
+            Name of the bucket
+        key : str
+            Key of the object
+
+        Returns
+        -------
+        path : str
+            File of the object
+        """
+        folder = self.bucket_folder(bucket)
+        parts = key.split("/")
+        if ".." in parts or key.startswith("/"):
+            raise LocalError("InvalidArgument", f"Keys with .. can't be stored locally : {key}")
+        if key.endswith("/"):
+            return os.path.join(folder, *parts[:-1], FOLDER_MARKER)
+        return os.path.join(folder, *parts)
+
+    def key(self, bucket, path):
+        """Return the key of the object stored in a file.
+
+        Parameters
+        ----------
+        bucket : str
+            Name of the bucket
+        path : str
+            File of the object
+
+        Returns
+        -------
+        key : str
+            Key of the object
+        """
+        key = os.path.relpath(path, os.path.join(self.folder, bucket)).replace(os.sep, "/")
+        if os.path.basename(path) == FOLDER_MARKER:
+            return key[:-len(FOLDER_MARKER)]
+        return key
+
+    def read(self, bucket, key, start=0, length=-1):
+        """Return the content of an object, or of a part of it.
+
+        Parameters
+        ----------
+        bucket : str
+            Name of the bucket
+        key : str
+            Key of the object
+        start : int, optional
+            Offset of the first byte read
+        length : int, optional
+            Number of bytes read. Up to the end of the object if -1
+
+        Returns
+        -------
+        data : bytes
+            Content of the object
+        """
+        path = self.path(bucket, key)
+        if not os.path.isfile(path):
+            raise LocalError("NoSuchKey", f"The specified key does not exist : {key}", 404)
+        with open(path, "rb") as f:
+            f.seek(start)
+            return f.read(length)
+
+    def write(self, bucket, key, data):
+        """Write an object, replacing the previous one.
+
+        Parameters
+        ----------
+        bucket : str
+            Name of the bucket
+        key : str
+            Key of the object
+        data : bytes
+            Content of the object
+
+        Returns
+        -------
+        etag : str
+            ETag of the object
+        """
+        path = self.path(bucket, key)
+
+        with self.lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written under another name first, so a concurrent reader never gets a partial object
+            tmp = f"{path}.{uuid4().hex}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+        return self.etag(os.stat(path))
+
+    def move(self, bucket, key, path):
+        """Store a local file as an object, replacing the previous one. The file is moved, not copied.
+
+        Parameters
+        ----------
+        bucket : str
+            Name of the bucket
+        key : str
+            Key of the object
+        path : str
+            File moved, on the same disk as the storage
+        """
+        target = self.path(bucket, key)
+
+        with self.lock:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+
+    def delete(self, bucket, key):
+        """Delete an object and the folders left empty. Deleting a missing object is not an error, as in S3.
+
+        Parameters
+        ----------
+        bucket : str
+            Name of the bucket
+        key : str
+            Key of the object
+        """
+        path = self.path(bucket, key)
+        root = self.bucket_folder(bucket)
+
+        with self.lock:
+            if os.path.isfile(path):
+                os.remove(path)
+            folder = os.path.dirname(path)
+            while folder != root and os.path.isdir(folder) and not os.listdir(folder):
+                os.rmdir(folder)
+                folder = os.path.dirname(folder)
+
+    def etag(self, stat):
+        """Return the ETag of an object, built from its size and modification time."""
+        return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+    def describe(self, bucket, key, path):
+        """Return the description of an object, as in the listings of S3."""
+        stat = os.stat(path)
+        return {
+            "Key": key,
+            "Size": stat.st_size,
+            "ETag": self.etag(stat),
+            "LastModified": datetime.datetime.fromtimestamp(stat.st_mtime, datetime.timezone.utc),
+            "StorageClass": "STANDARD",
+        }
+
+    def list(self, bucket, prefix=""):
+        """Return the objects of a bucket whose key starts with a prefix, sorted by key as in S3.
+
+        Parameters
+        ----------
+        bucket : str
+            Name of the bucket
+        prefix : str, optional
+            Prefix of the keys
+
+        Returns
+        -------
+        objects : list of dict
+            Key, size, ETag and modification time of each object
+        """
+        root = self.bucket_folder(bucket)
+        # only the deepest folder of the prefix is walked
+        start = os.path.join(root, *prefix.split("/")[:-1])
+
+        objects = []
+        for folder, _, files in os.walk(start):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(folder, name)
+                key = self.key(bucket, path)
+                if key.startswith(prefix):
+                    objects.append(self.describe(bucket, key, path))
+
+        return sorted(objects, key=lambda obj: obj["Key"])
+
+    def list_buckets(self, params):
+        buckets = []
+        for name in sorted(os.listdir(self.folder)):
+            folder = os.path.join(self.folder, name)
+            if os.path.isdir(folder) and not name.startswith("."):
+                buckets.append({"Name": name, "CreationDate": datetime.datetime.fromtimestamp(os.stat(folder).st_ctime, datetime.timezone.utc)})
+        return {"Buckets": buckets, "Owner": {"DisplayName": "local", "ID": "local"}}
+
+    def create_bucket(self, params):
+        self.bucket_folder(params["Bucket"], True)
+        return {"Location": f"/{params['Bucket']}"}
+
+    def head_bucket(self, params):
+        if not os.path.isdir(os.path.join(self.folder, params["Bucket"])):
+            raise LocalError("404", "Not Found", 404)
+        return {}
+
+    def get_bucket_location(self, params):
+        self.bucket_folder(params["Bucket"])
+        return {"LocationConstraint": None}
+
+    def delete_bucket(self, params):
+        folder = self.bucket_folder(params["Bucket"])
+        if self.list(params["Bucket"]):
+            raise LocalError("BucketNotEmpty", "The bucket you tried to delete is not empty", 409)
+        with self.lock:
+            for path, folders, _ in os.walk(folder, topdown=False):
+                os.rmdir(path)
+        return {}
+
+    def list_objects_v2(self, params):
+        prefix = params.get("Prefix", "")
+        delimiter = params.get("Delimiter")
+        max_keys = params.get("MaxKeys", 1000)
+        after = max(params.get("StartAfter", ""), params.get("ContinuationToken", ""))
+
+        contents = []
+        prefixes = []
+        last = None
+        truncated = False
+
+        for obj in self.list(params["Bucket"], prefix):
+            key = obj["Key"]
+            if key <= after:
+                continue
+
+            common = None
+            if delimiter and delimiter in key[len(prefix):]:
+                common = key[:len(prefix) + key[len(prefix):].index(delimiter) + len(delimiter)]
+                if prefixes and prefixes[-1]["Prefix"] == common:
+                    continue
+
+            if len(contents) + len(prefixes) == max_keys:
+                truncated = True
+                break
+
+            if common:
+                prefixes.append({"Prefix": common})
+            else:
+                contents.append(obj)
+            # the token of the next page skips the rest of a common prefix
+            last = common + chr(0x10FFFF) if common else key
+
+        response = {"Name": params["Bucket"], "Prefix": prefix, "MaxKeys": max_keys, "KeyCount": len(contents) + len(prefixes), "IsTruncated": truncated}
+        # as in S3, the empty lists are left out
+        if contents:
+            response["Contents"] = contents
+        if prefixes:
+            response["CommonPrefixes"] = prefixes
+        if delimiter:
+            response["Delimiter"] = delimiter
+        if truncated:
+            response["NextContinuationToken"] = last
+        return response
+
+    def body(self, params):
+        """Return the content of the Body parameter of a call (bytes, str or file)."""
+        body = params.get("Body")
+        if body is None:
+            return b""
+        if hasattr(body, "read"):
+            body = body.read()
+        if isinstance(body, str):
+            body = body.encode()
+        return bytes(body)
+
+    def put_object(self, params):
+        return {"ETag": self.write(params["Bucket"], params["Key"], self.body(params))}
+
+    def get_object(self, params):
+        # only the bytes of the range are read, download_file getting large objects by parts
+        data = self.read(params["Bucket"], params["Key"], 0, 0)
+        response = self.head_object(params)
+        size = response["ContentLength"]
+
+        ranged = re.match(r"bytes=(\d*)-(\d*)$", params.get("Range", ""))
+        if ranged:
+            first, last = ranged.groups()
+            if first:
+                start, end = int(first), min(int(last), size - 1) if last else size - 1
+            else:
+                start, end = max(size - int(last), 0), size - 1
+            data = self.read(params["Bucket"], params["Key"], start, end - start + 1)
+            response["ContentRange"] = f"bytes {start}-{end}/{size}"
+        else:
+            data = self.read(params["Bucket"], params["Key"])
+
+        response["ContentLength"] = len(data)
+        response["Body"] = StreamingBody(BytesIO(data), len(data))
+        return response
+
+    def head_object(self, params):
+        path = self.path(params["Bucket"], params["Key"])
+        if not os.path.isfile(path):
+            raise LocalError("404", "Not Found", 404)
+        obj = self.describe(params["Bucket"], params["Key"], path)
+        return {"ContentLength": obj["Size"], "ETag": obj["ETag"], "LastModified": obj["LastModified"], "ContentType": "binary/octet-stream"}
+
+    def copy_object(self, params):
+        copy_source = params["CopySource"]
+        if isinstance(copy_source, dict):
+            bucket, key = copy_source["Bucket"], copy_source["Key"]
+        else:
+            # already written as bucket/key by botocore
+            bucket, _, key = unquote(copy_source.split("?versionId=")[0]).lstrip("/").partition("/")
+
+        etag = self.write(params["Bucket"], params["Key"], self.read(bucket, key))
+        return {"CopyObjectResult": {"ETag": etag, "LastModified": datetime.datetime.now(datetime.timezone.utc)}}
+
+    def delete_object(self, params):
+        self.delete(params["Bucket"], params["Key"])
+        return {}
+
+    def delete_objects(self, params):
+        deleted = []
+        for obj in params["Delete"]["Objects"]:
+            self.delete(params["Bucket"], obj["Key"])
+            deleted.append({"Key": obj["Key"]})
+        return {} if params["Delete"].get("Quiet") else {"Deleted": deleted}
+
+    def create_multipart_upload(self, params):
+        self.bucket_folder(params["Bucket"])
+        upload = uuid4().hex
+        with self.lock:
+            self.uploads[upload] = {}
+        return {"Bucket": params["Bucket"], "Key": params["Key"], "UploadId": upload}
+
+    def upload_part(self, params):
+        data = self.body(params)
+        with self.lock:
+            if params["UploadId"] not in self.uploads:
+                raise LocalError("NoSuchUpload", "The specified upload does not exist", 404)
+            self.uploads[params["UploadId"]][params["PartNumber"]] = data
+        return {"ETag": f'"{params["PartNumber"]:x}-{len(data):x}"'}
+
+    def complete_multipart_upload(self, params):
+        with self.lock:
+            parts = self.uploads.pop(params["UploadId"], None)
+        if parts is None:
+            raise LocalError("NoSuchUpload", "The specified upload does not exist", 404)
+
+        numbers = [part["PartNumber"] for part in params.get("MultipartUpload", {}).get("Parts", [])] or sorted(parts)
+        etag = self.write(params["Bucket"], params["Key"], b"".join(parts[number] for number in numbers))
+        return {"Bucket": params["Bucket"], "Key": params["Key"], "ETag": etag, "Location": f"s3://{params['Bucket']}/{params['Key']}"}
+
+    def abort_multipart_upload(self, params):
+        with self.lock:
+            self.uploads.pop(params["UploadId"], None)
+        return {}
+
+    def trails(self, region):
+        """Return a trail for each bucket holding CloudTrail logs (AWSLogs/ACCOUNT/CloudTrail/), so the trail buckets are told apart as with Cloudtrail.
+
+        Parameters
+        ----------
+        region : str
+            Region of the trails
+
+        Returns
+        -------
+        trails : list of dict
+            Trails, as returned by describe_trails
+        """
+        trails = []
+        for bucket in self.list_buckets({})["Buckets"]:
+            logs = os.path.join(self.folder, bucket["Name"], "AWSLogs")
+            if os.path.isdir(logs) and any(os.path.isdir(os.path.join(logs, account, "CloudTrail")) for account in os.listdir(logs)):
+                name = f"local-{bucket['Name']}"
+                trails.append({"Name": name, "S3BucketName": bucket["Name"], "HomeRegion": region, "IsMultiRegionTrail": True, "TrailARN": f"arn:aws:cloudtrail:{region}:000000000000:trail/{name}"})
+        return trails
+
+
+class LocalAthena:
+
+    folder = None
+    storage = None
+    catalog = None
+    executions = None
+    order = None
+    pool = None
+    local = None
+    lock = None
+    load_lock = None
+    latency = None
+    operations = None
+
+    def __init__(self, folder, concurrency=20, latency=0):
+        """Handle the constructor of the LocalAthena class.
+        The buckets are kept in folder/s3, the databases and tables in folder/athena/catalog.json.
+        The data of a table is read from its location when it is queried, and kept in folder/athena/tables.sqlite until its objects change. It is shared by the workers, each one reading it with its own connection.
+
+        Parameters
+        ----------
+        folder : str
+            Folder of the stand-in
+        concurrency : int, optional
+            Number of queries run at the same time, the other ones are queued as in Athena
+        latency : float, optional
+            Minimum duration of a query, in seconds, standing for the planning and queueing time of Athena
+        """
+        self.folder = folder
+        self.storage = LocalStorage(os.path.join(folder, "s3"))
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.executions = {}
+        self.order = []
+        self.local = threading.local()
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="invictus-athena")
+
+        os.makedirs(os.path.join(folder, "athena"), exist_ok=True)
+        self.catalog = {}
+        if os.path.isfile(self.catalog_file()):
+            with open(self.catalog_file()) as f:
+                self.catalog = loads(f.read())
+
+        # signature of the objects of each table when it was loaded
+        self.connection().execute("CREATE TABLE IF NOT EXISTS loaded (name TEXT PRIMARY KEY, signature TEXT)")
+
+        self.operations = {
+            "StartQueryExecution": self.start_query_execution,
+            "GetQueryExecution": self.get_query_execution,
+            "BatchGetQueryExecution": self.batch_get_query_execution,
+            "GetQueryResults": self.get_query_results,
+            "ListQueryExecutions": self.list_query_executions,
+            "StopQueryExecution": self.stop_query_execution,
+            "ListDataCatalogs": self.list_data_catalogs,
+            "GetDataCatalog": self.get_data_catalog,
+            "ListDatabases": self.list_databases,
+            "GetDatabase": self.get_database,
+            "ListTableMetadata": self.list_table_metadata,
+            "GetTableMetadata": self.get_table_metadata,
+        }
+
+    def catalog_file(self):
+        """Return the file where the databases and tables are kept."""
+        return os.path.join(self.folder, "athena", "catalog.json")
+
+    def save_catalog(self):
+        """Write the databases and tables. It is written under another name first, so a crash never leaves a partial file."""
+        tmp = f"{self.catalog_file()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(dumps(self.catalog, indent=4))
+        os.replace(tmp, self.catalog_file())
+
+    ###########
+    # CATALOG #
+    ###########
+
+    def check_catalog(self, name):
+        """Raise the error of Athena if a data catalog doesn't exist."""
+        if name != CATALOG:
+            raise LocalError("MetadataException", f"Catalog {name} does not exist")
+
+    def tables(self, database):
+        """Return the tables of a database, by name.
+
+        Parameters
+        ----------
+        database : str
+            Name of the database
+
+        Returns
+        -------
+        tables : dict
+            Definition of each table
+        """
+        if database.lower() not in self.catalog:
+            raise LocalError("MetadataException", f"Database {database} not found.")
+        return self.catalog[database.lower()]
+
+    def table_metadata(self, table):
+        """Return the metadata of a table, as returned by get_table_metadata.
+
+        Parameters
+        ----------
+        table : dict
+            Definition of the table
+
+        Returns
+        -------
+        metadata : dict
+            Metadata of the table
+        """
+        return {
+            "Name": table["name"],
+            "CreateTime": datetime.datetime.fromisoformat(table["created"]),
+            "TableType": "EXTERNAL_TABLE",
+            "Columns": [{"Name": name, "Type": kind} for name, kind in table["columns"]],
+            "PartitionKeys": [{"Name": name, "Type": kind} for name, kind in table["partitions"]],
+            "Parameters": {
+                "EXTERNAL": "TRUE",
+                "inputformat": table["input_format"],
+                "outputformat": OUTPUT_FORMAT,
+                "location": table["location"],
+                "serde.serialization.lib": table["serde"],
+            },
+        }
+
+    def list_data_catalogs(self, params):
+        return {"DataCatalogsSummary": [{"CatalogName": CATALOG, "Type": "GLUE"}]}
+
+    def get_data_catalog(self, params):
+        self.check_catalog(params["Name"])
+        return {"DataCatalog": {"Name": CATALOG, "Type": "GLUE", "Parameters": {}}}
+
+    def list_databases(self, params):
+        self.check_catalog(params["CatalogName"])
+        with self.lock:
+            return {"DatabaseList": [{"Name": name, "Parameters": {}} for name in sorted(self.catalog)]}
+
+    def get_database(self, params):
+        self.check_catalog(params["CatalogName"])
+        with self.lock:
+            self.tables(params["DatabaseName"])
+        return {"Database": {"Name": params["DatabaseName"].lower(), "Parameters": {}}}
+
+    def list_table_metadata(self, params):
+        self.check_catalog(params["CatalogName"])
+        expression = params.get("Expression")
+        with self.lock:
+            tables = self.tables(params["DatabaseName"])
+            return {"TableMetadataList": [self.table_metadata(table) for name, table in sorted(tables.items()) if not expression or re.fullmatch(expression, name)]}
+
+    def get_table_metadata(self, params):
+        self.check_catalog(params["CatalogName"])
+        with self.lock:
+            tables = self.tables(params["DatabaseName"])
+            if params["TableName"].lower() not in tables:
+                raise LocalError("MetadataException", f"Table {params['TableName']} not found in database {params['DatabaseName']}.")
+            return {"TableMetadata": self.table_metadata(tables[params["TableName"].lower()])}
+
+    ###########
+    # QUERIES #
+    ###########
+
+    def start_query_execution(self, params):
+        output = params.get("ResultConfiguration", {}).get("OutputLocation")
+        if not output:
+            raise LocalError("InvalidRequestException", "No output location provided. An output location is required either through the Workgroup result configuration setting or as an API input.")
+
+        context = params.get("QueryExecutionContext", {})
+        now = datetime.datetime.now(datetime.timezone.utc)
+        execution = {
+            "QueryExecutionId": str(uuid4()),
+            "Query": params["QueryString"],
+            "StatementType": "DML" if SELECT.match(params["QueryString"]) else "DDL",
+            "ResultConfiguration": {"OutputLocation": output},
+            "QueryExecutionContext": {"Catalog": context.get("Catalog", CATALOG), "Database": context.get("Database", DEFAULT_DATABASE)},
+            "Status": {"State": "QUEUED", "SubmissionDateTime": now},
+            "Statistics": {"EngineExecutionTimeInMillis": 0, "DataScannedInBytes": 0, "TotalExecutionTimeInMillis": 0},
+            "WorkGroup": params.get("WorkGroup", "primary"),
+        }
+
+        with self.lock:
+            self.executions[execution["QueryExecutionId"]] = {"execution": execution, "columns": [], "offsets": [], "rows": 0, "object": None}
+            self.order.append(execution["QueryExecutionId"])
+
+        self.pool.submit(self.run, execution["QueryExecutionId"])
+        return {"QueryExecutionId": execution["QueryExecutionId"]}
+
+    def execution(self, id):
+        """Return a query execution, as returned by get_query_execution.
+
+        Parameters
+        ----------
+        id : str
+            Id of the query execution
+
+        Returns
+        -------
+        execution : dict
+            Query execution
+        """
+        with self.lock:
+            if id not in self.executions:
+                raise LocalError("InvalidRequestException", f"QueryExecution {id} was not found")
+            execution = self.executions[id]["execution"]
+            return {**execution, "Status": dict(execution["Status"]), "Statistics": dict(execution["Statistics"])}
+
+    def get_query_execution(self, params):
+        return {"QueryExecution": self.execution(params["QueryExecutionId"])}
+
+    def batch_get_query_execution(self, params):
+        executions = []
+        unprocessed = []
+        for id in params["QueryExecutionIds"]:
+            try:
+                executions.append(self.execution(id))
+            except LocalError as e:
+                unprocessed.append({"QueryExecutionId": id, "ErrorCode": e.code, "ErrorMessage": str(e)})
+        return {"QueryExecutions": executions, "UnprocessedQueryExecutionIds": unprocessed}
+
+    def get_query_results(self, params):
+        execution = self.execution(params["QueryExecutionId"])
+        state = execution["Status"]["State"]
+        if state == "FAILED":
+            raise LocalError("InvalidRequestException", execution["Status"]["StateChangeReason"])
+        if state != "SUCCEEDED":
+            raise LocalError("InvalidRequestException", f"Query has not yet finished. Current state: {state}")
+
+        with self.lock:
+            results = self.executions[params["QueryExecutionId"]]
+            columns, offsets, total, location = results["columns"], results["offsets"], results["rows"], results["object"]
+
+        start = int(params.get("NextToken") or 0)
+        end = min(start + min(params.get("MaxResults", RESULTS_PAGE_SIZE), RESULTS_PAGE_SIZE), total)
+
+        '''
+        As with Athena, the rows are read back from the results written in the output location, the first page starting with the names of the columns.
+        The offset of every RESULTS_PAGE_SIZE rows was kept when they were written, so a page is read without the rows before it.
+        '''
+        rows = []
+        if start < end:
+            try:
+                with open(self.storage.path(*location), "rb") as f:
+                    f.seek(offsets[start // RESULTS_PAGE_SIZE])
+                    read_csv_rows(f, start % RESULTS_PAGE_SIZE)
+                    rows = read_csv_rows(f, end - start)
+            except FileNotFoundError:
+                raise LocalError("InvalidRequestException", f"The results of the query were removed from {execution['ResultConfiguration']['OutputLocation']}")
+
+        response = {
+            "UpdateCount": 0,
+            "ResultSet": {
+                "Rows": [{"Data": [{} if value is None else {"VarCharValue": value} for value in row]} for row in rows],
+                "ResultSetMetadata": {"ColumnInfo": [{"CatalogName": "hive", "SchemaName": "", "TableName": "", "Name": name, "Label": name, "Type": kind, "Precision": 0, "Scale": 0, "Nullable": "UNKNOWN", "CaseSensitive": kind == "varchar"} for name, kind in columns]},
+            },
+        }
+        if end < total:
+            response["NextToken"] = str(end)
+        return response
+
+    def list_query_executions(self, params):
+        with self.lock:
+            ids = self.order[::-1]
+        start = int(params.get("NextToken") or 0)
+        end = min(start + params.get("MaxResults", 50), len(ids))
+        response = {"QueryExecutionIds": ids[start:end]}
+        if end < len(ids):
+            response["NextToken"] = str(end)
+        return response
+
+    def stop_query_execution(self, params):
+        self.execution(params["QueryExecutionId"])
+        with self.lock:
+            status = self.executions[params["QueryExecutionId"]]["execution"]["Status"]
+            if status["State"] in ("QUEUED", "RUNNING"):
+                status["State"] = "CANCELLED"
+                status["CompletionDateTime"] = datetime.datetime.now(datetime.timezone.utc)
+        return {}
+
+    def run(self, id):
+        """Run a query on a worker of the stand-in and write its results in its output location, as Athena does.
+
+        Parameters
+        ----------
+        id : str
+            Id of the query execution
+        """
+        with self.lock:
+            execution = self.executions[id]["execution"]
+            if execution["Status"]["State"] == "CANCELLED":
+                return
+            execution["Status"]["State"] = "RUNNING"
+
+        begin = monotonic()
+        query = execution["Query"]
+        database = execution["QueryExecutionContext"]["Database"].lower()
+        bucket, prefix = split_location(execution["ResultConfiguration"]["OutputLocation"])
+
+        tmp = os.path.join(self.folder, "athena", f"{id}.csv.tmp")
+
+        try:
+            scanned = 0
+            columns, offsets, rows = [], [], 0
+
+            if execution["StatementType"] == "DML":
+                # the results are written as they are read, whatever their size
+                with open(tmp, "wb") as f:
+                    columns, offsets, rows, scanned = self.select(query, database, f)
+                key = f"{prefix}{id}.csv"
+                self.storage.move(bucket, key, tmp)
+                self.storage.write(bucket, f"{key}.metadata", dumps({"columns": columns}).encode())
+            else:
+                self.ddl(query, database)
+                key = f"{prefix}{id}.txt"
+                self.storage.write(bucket, key, b"")
+
+            state, reason = "SUCCEEDED", None
+        except Exception as e:
+            state, reason = "FAILED", str(e)
+            if os.path.isfile(tmp):
+                os.remove(tmp)
+
+        engine = monotonic() - begin
+        if self.latency > engine:
+            sleep(self.latency - engine)
+
+        with self.lock:
+            results = self.executions[id]
+            status = execution["Status"]
+            if status["State"] == "CANCELLED":
+                return
+
+            if state == "SUCCEEDED":
+                results["columns"], results["offsets"], results["rows"], results["object"] = columns, offsets, rows, (bucket, key)
+                execution["ResultConfiguration"]["OutputLocation"] = f"s3://{bucket}/{key}"
+            else:
+                status["StateChangeReason"] = reason
+                status["AthenaError"] = {"ErrorCategory": 2, "ErrorType": 1000, "Retryable": False, "ErrorMessage": reason}
+
+            status["State"] = state
+            status["CompletionDateTime"] = datetime.datetime.now(datetime.timezone.utc)
+            execution["Statistics"] = {
+                "EngineExecutionTimeInMillis": int(engine * 1000),
+                "DataScannedInBytes": scanned,
+                "TotalExecutionTimeInMillis": int((status["CompletionDateTime"] - status["SubmissionDateTime"]).total_seconds() * 1000),
+            }
+
+    def ddl(self, query, database):
+        """Run a statement creating or dropping a database or a table.
+
+        Parameters
+        ----------
+        query : str
+            Statement
+        database : str
+            Database of the context of the query
+        """
+        create_database = CREATE_DATABASE.match(query)
+        drop_database = DROP_DATABASE.match(query)
+        create_table = CREATE_TABLE.match(query)
+        drop_table = DROP_TABLE.match(query)
+
+        with self.lock:
+            if create_database:
+                name = create_database.group(2).lower()
+                if name in self.catalog and not create_database.group(1):
+                    raise LocalError("InvalidRequestException", f"FAILED: AlreadyExistsException Database {name} already exists")
+                self.catalog.setdefault(name, {})
+
+            elif drop_database:
+                name = drop_database.group(2).lower()
+                if name not in self.catalog:
+                    if not drop_database.group(1):
+                        raise LocalError("InvalidRequestException", f"FAILED: SemanticException [Error 10072]: Database does not exist: {name}")
+                elif self.catalog[name] and not drop_database.group(3):
+                    raise LocalError("InvalidRequestException", f"FAILED: InvalidOperationException Database {name} is not empty. One or more tables exist.")
+                else:
+                    del self.catalog[name]
+
+            elif create_table:
+                table = self.parse_table(query, create_table, database)
+                tables = self.catalog.get(table["database"])
+                if tables is None:
+                    raise LocalError("InvalidRequestException", f"FAILED: SemanticException [Error 10072]: Database does not exist: {table['database']}")
+                if table["name"] in tables:
+                    if not create_table.group(1):
+                        raise LocalError("InvalidRequestException", f"FAILED: AlreadyExistsException Table {table['name']} already exists")
+                else:
+                    tables[table["name"]] = table
+
+            elif drop_table:
+                db, name = self.table_name(drop_table.group(2), database)
+                if name not in self.catalog.get(db, {}):
+                    if not drop_table.group(1):
+                        raise LocalError("InvalidRequestException", f"FAILED: SemanticException [Error 10001]: Table not found {db}.{name}")
+                else:
+                    del self.catalog[db][name]
+
+            else:
+                raise LocalError("InvalidRequestException", f"This statement is not supported by the local Athena : {query.strip()[:80]}")
+
+            self.save_catalog()
+
+    def table_name(self, name, database):
+        """Split a table name in database and table, the database of the context being used if there is none."""
+        db, _, table = name.replace("`", "").lower().rpartition(".")
+        return db or database, table
+
+    def parse_table(self, query, match, database):
+        """Return the definition of the table created by a CREATE TABLE statement.
+
+        Parameters
+        ----------
+        query : str
+            Statement
+        match : Match
+            Match of CREATE_TABLE on the statement
+        database : str
+            Database of the context of the query
+
+        Returns
+        -------
+        table : dict
+            Definition of the table
+        """
+        db, name = self.table_name(match.group(2), database)
+
+        end = closing_parenthesis(query, match.end() - 1)
+        if end == -1:
+            raise LocalError("InvalidRequestException", "line 1:1: mismatched input. Missing ')' in the columns of the table")
+        columns = [self.parse_column(column) for column in split_top_level(query[match.end():end])]
+        if not columns:
+            raise LocalError("InvalidRequestException", f"FAILED: ParseException : the table {name} has no columns")
+
+        rest = query[end + 1:]
+        partitions = []
+        partitioned = re.search(r"PARTITIONED\s+BY\s*\(", rest, re.IGNORECASE)
+        if partitioned:
+            close = closing_parenthesis(rest, partitioned.end() - 1)
+            partitions = [self.parse_column(column) for column in split_top_level(rest[partitioned.end():close])]
+
+        location = re.search(r"LOCATION\s+'([^']+)'", rest, re.IGNORECASE)
+        input_format = re.search(r"INPUTFORMAT\s+'([^']+)'", rest, re.IGNORECASE)
+        serde = re.search(r"SERDE\s+'([^']+)'", rest, re.IGNORECASE)
+        if not location:
+            raise LocalError("InvalidRequestException", f"FAILED: the external table {name} has no LOCATION")
+
+        return {
+            "database": db,
+            "name": name,
+            "columns": columns,
+            "partitions": partitions,
+            "location": location.group(1),
+            "input_format": input_format.group(1) if input_format else TEXT_INPUT_FORMAT,
+            "serde": serde.group(1) if serde else DEFAULT_SERDE,
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+
+    def parse_column(self, text):
+        """Return the name and type of a column of a CREATE TABLE statement, its comment left out."""
+        name, kind = text.split(None, 1)
+        kind = re.split(r"\s+COMMENT\s+", kind, flags=re.IGNORECASE)[0]
+        # the types are written as Athena returns them
+        return [name.strip("`").lower(), re.sub(r"\s+", "", kind).lower()]
+
+    def connection(self):
+        """Return the connection of the worker to the database of the tables."""
+        if getattr(self.local, "connection", None) is None:
+            self.local.connection = connect(os.path.join(self.folder, "athena", "tables.sqlite"))
+        return self.local.connection
+
+    def load(self, table):
+        """Load the data of a table in the database, unless its objects didn't change since they were loaded. The tables are loaded one at a time.
+
+        Parameters
+        ----------
+        table : dict
+            Definition of the table
+
+        Returns
+        -------
+        scanned : int
+            Size of the objects of the table, in bytes
+        """
+        connection = self.connection()
+        bucket, prefix = split_location(table["location"])
+
+        # as Hive, the files starting with _ or . are left out
+        objects = [obj for obj in self.storage.list(bucket, prefix) if not obj["Key"].rsplit("/", 1)[-1].startswith(("_", "."))]
+        signature = dumps([table, [[obj["Key"], obj["ETag"]] for obj in objects]], sort_keys=True)
+        scanned = sum(obj["Size"] for obj in objects)
+        sql_name = f'"{table["database"]}.{table["name"]}"'
+
+        with self.load_lock:
+            loaded = connection.execute("SELECT signature FROM loaded WHERE name = ?", (sql_name,)).fetchone()
+            if loaded is None or loaded[0] != signature:
+                try:
+                    connection.execute(f"DROP TABLE IF EXISTS {sql_name}")
+                    connection.execute(f"CREATE TABLE {sql_name} ({self.definition(table)})")
+                    connection.executemany(f"INSERT INTO {sql_name} VALUES ({', '.join('?' * (len(table['columns']) + len(table['partitions'])))})", self.rows(table, bucket, prefix, objects))
+                    connection.execute("INSERT OR REPLACE INTO loaded VALUES (?, ?)", (sql_name, signature))
+                    connection.commit()
+                except Exception:
+                    # the table is loaded again by the next query
+                    connection.rollback()
+                    raise
+
+        return scanned
+
+    def definition(self, table):
+        """Return the columns of the sqlite table of a table : the scalars with their type, the structs, arrays and maps as JSON."""
+        columns = [(name, parse_type(kind)) for name, kind in table["columns"]]
+        definition = ", ".join(f'"{name}" {SQLITE_TYPES.get(kind[1], "TEXT") if kind[0] == "scalar" else "TEXT"}' for name, kind in columns)
+        return definition + "".join(f', "{name}" TEXT' for name, _ in table["partitions"])
+
+    def rows(self, table, bucket, prefix, objects):
+        """Return the rows of a table, one object at a time.
+
+        Parameters
+        ----------
+        table : dict
+            Definition of the table
+        bucket : str
+            Bucket of the location of the table
+        prefix : str
+            Path of the location of the table in the bucket
+        objects : list of dict
+            Objects of the table
+
+        Returns
+        -------
+        rows : generator of list
+            Values of each row
+        """
+        columns = [(name, parse_type(kind)) for name, kind in table["columns"]]
+        partitions = [name for name, _ in table["partitions"]]
+
+        for obj in objects:
+            # the partitions are read in the key (.../year=2023/month=06/...)
+            values = dict(part.split("=", 1) for part in obj["Key"][len(prefix):].split("/")[:-1] if "=" in part)
+
+            for record in self.records(bucket, obj["Key"], table["input_format"]):
+                if not isinstance(record, dict):
+                    continue
+                fields = {key.lower(): value for key, value in record.items()}
+                row = []
+                for name, kind in columns:
+                    value = convert(fields.get(name), kind)
+                    row.append(dumps(value) if kind[0] != "scalar" and value is not None else value)
+                yield row + [values.get(name) for name in partitions]
+
+    def records(self, bucket, key, input_format):
+        """Return the records of an object of a table : the Records of a CloudTrail file, or one record per line.
+
+        Parameters
+        ----------
+        bucket : str
+            Name of the bucket
+        key : str
+            Key of the object
+        input_format : str
+            Input format of the table
+
+        Returns
+        -------
+        records : list of dict
+            Records of the object
+        """
+        data = self.storage.read(bucket, key)
+        if data[:2] == b"\x1f\x8b":
+            data = gzip.decompress(data)
+        text = data.decode("utf-8")
+
+        if input_format == TRAIL_INPUT_FORMAT:
+            return loads(text).get("Records", [])
+
+        records = []
+        for number, line in enumerate(text.splitlines()):
+            if line.strip():
+                try:
+                    records.append(loads(line))
+                except ValueError:
+                    raise LocalError("InvalidRequestException", f"HIVE_CURSOR_ERROR: Row is not a valid JSON Object - s3://{bucket}/{key} line {number + 1}")
+        return records
+
+    def rewrite(self, query, database):
+        """Rewrite a query of Athena for sqlite : the tables are named database.table, the fields of the structs are read with json_extract.
+
+        Parameters
+        ----------
+        query : str
+            Query
+        database : str
+            Database of the context of the query
+
+        Returns
+        -------
+        query : str
+            Query for sqlite
+        tables : list of dict
+            Definitions of the tables queried
+        """
+        with self.lock:
+            catalog = {db: dict(tables) for db, tables in self.catalog.items()}
+
+        tables = {}
+        parts = LITERAL.split(query)
+
+        # first the tables, named database.table or only table after FROM and JOIN
+        def find_table(match):
+            names = [match.group(1)] + re.findall(IDENTIFIER, match.group(2))
+            names = [name.strip('"').lower() for name in names]
+            if len(names) >= 2 and names[1] in catalog.get(names[0], {}):
+                tables[(names[0], names[1])] = catalog[names[0]][names[1]]
+                return f'"{names[0]}.{names[1]}"' + "".join("." + name for name in names[2:])
+            return match.group(0)
+
+        def find_context_table(match):
+            name = match.group(3).strip('"').lower()
+            if name in catalog.get(database, {}):
+                tables[(database, name)] = catalog[database][name]
+                return f'{match.group(1)}{match.group(2)}"{database}.{name}"'
+            return match.group(0)
+
+        for i in range(0, len(parts), 2):
+            parts[i] = TABLE_REFERENCE.sub(find_context_table, CHAIN.sub(find_table, parts[i]))
+
+        complex_columns = {name for table in tables.values() for name, kind in table["columns"] if parse_type(kind)[0] == "struct"}
+
+        # then the fields of the structs : column.field or alias.column.field
+        def read_field(match):
+            names = [match.group(1)] + re.findall(IDENTIFIER, match.group(2))
+            lower = [name.strip('"').lower() for name in names]
+            if len(names) >= 2 and lower[0] in complex_columns:
+                return f"json_extract(\"{lower[0]}\", '$.{'.'.join(lower[1:])}')"
+            if len(names) >= 3 and lower[1] in complex_columns:
+                return f"json_extract({names[0]}.\"{lower[1]}\", '$.{'.'.join(lower[2:])}')"
+            return match.group(0)
+
+        for i in range(0, len(parts), 2):
+            parts[i] = CHAIN.sub(read_field, parts[i])
+
+        return "".join(parts), list(tables.values())
+
+    def select(self, query, database, output):
+        """Run a SELECT statement and write its results in CSV, row by row.
+
+        Parameters
+        ----------
+        query : str
+            Statement
+        database : str
+            Database of the context of the query
+        output : file
+            File where the results are written, opened in binary mode
+
+        Returns
+        -------
+        columns : list of tuple
+            Name and type of each column of the results
+        offsets : list of int
+            Offset in the file of every RESULTS_PAGE_SIZE rows, the header being the first row
+        rows : int
+            Number of rows written, the header included
+        scanned : int
+            Size of the objects of the tables queried, in bytes
+        """
+        sql, tables = self.rewrite(query, database)
+        scanned = sum(self.load(table) for table in tables)
+
+        kinds = {}
+        for table in tables:
+            for name, kind in table["columns"] + table["partitions"]:
+                kinds[name] = parse_type(kind)
+
+        cursor = self.connection().execute(sql)
+        names = [description[0] for description in cursor.description]
+        columns = [(name, athena_type(kinds[name.lower()]) if name.lower() in kinds else "varchar") for name in names]
+
+        offsets = [0]
+        position = output.write(csv_line(names).encode())
+        rows = 1
+
+        for row in cursor:
+            if rows % RESULTS_PAGE_SIZE == 0:
+                offsets.append(position)
+
+            values = []
+            for name, value in zip(names, row):
+                kind = kinds.get(name.lower())
+                if value is None:
+                    values.append(None)
+                elif kind and kind[0] != "scalar":
+                    values.append(render(loads(value)))
+                elif kind and kind[1] == "boolean":
+                    values.append("true" if value else "false")
+                else:
+                    values.append(str(value))
+            position += output.write(csv_line(values).encode())
+            rows += 1
+
+        return columns, offsets, rows, scanned
+
+    ##########
+    # CLIENT #
+    ##########
+
+    def statistics(self):
+        """Return the statistics of the queries run by the stand-in.
+
+        Returns
+        -------
+        statistics : dict
+            Number of queries by state, data scanned and engine time
+        """
+        with self.lock:
+            executions = [results["execution"] for results in self.executions.values()]
+
+        states = {}
+        for execution in executions:
+            states[execution["Status"]["State"]] = states.get(execution["Status"]["State"], 0) + 1
+
+        return {
+            "queries": len(executions),
+            "states": states,
+            "data_scanned_bytes": sum(execution["Statistics"]["DataScannedInBytes"] for execution in executions),
+            "engine_time": sum(execution["Statistics"]["EngineExecutionTimeInMillis"] for execution in executions) / 1000,
+        }
+
+    def close(self):
+        """Wait for the queries running and stop the workers."""
+        self.pool.shutdown(wait=True)
+
+    def register(self, client):
+        """Answer the calls of a client to Athena and S3 with the stand-in, without any network access.
+        The lookups made around the analysis are also answered : describe_trails of Cloudtrail, so the trail buckets of the storage are recognized, and get_region_opt_status of Account, every region being enabled. The other clients are left untouched.
+
+        Parameters
+        ----------
+        client : object
+            Boto3 client
+        """
+        service = client.meta.service_model.service_name
+        region = client.meta.region_name or "us-east-1"
+
+        if service == "athena":
+            operations = self.operations
+        elif service == "s3":
+            operations = self.storage.operations
+        elif service == "cloudtrail":
+            operations = {"DescribeTrails": lambda params: {"trailList": self.storage.trails(region)}}
+        elif service == "account":
+            operations = {"GetRegionOptStatus": lambda params: {"RegionName": params["RegionName"], "RegionOptStatus": "ENABLED_BY_DEFAULT"}}
+        else:
+            return
+
+        def keep_params(params, model, context, **kwargs):
+            context["local_athena_params"] = dict(params)
+
+        def answer(model, context, **kwargs):
+            operation = operations.get(model.name)
+
+            if operation is None:
+                # the other calls to Cloudtrail and Account are sent as usual
+                if service in ("cloudtrail", "account"):
+                    return None
+                error = {"Error": {"Code": "NotImplemented", "Message": f"{model.name} is not supported by the local Athena"}, "ResponseMetadata": {"HTTPStatusCode": 501}}
+                return AWSResponse(None, 501, {}, None), error
+
+            try:
+                response = operation(context.get("local_athena_params", {}))
+            except LocalError as e:
+                error = {"Error": {"Code": e.code, "Message": str(e)}, "ResponseMetadata": {"HTTPStatusCode": e.status}}
+                return AWSResponse(None, e.status, {}, None), error
+
+            response["ResponseMetadata"] = {"HTTPStatusCode": 200, "RetryAttempts": 0}
+            return AWSResponse(None, 200, {}, None), response
+
+        async def answer_async(model, context, **kwargs):
+            return answer(model, context, **kwargs)
+
+        # answered before the rate limiter, nothing is sent to AWS
+        client.meta.events.register("before-parameter-build", keep_params)
+        client.meta.events.register_first("before-call", answer_async if asyncio.iscoroutinefunction(client._make_api_call) else answer)
@@ -0,0 +1,279 @@
+"""File containing the structured events of the run and the metrics file read by the textfile collector of node_exporter."""
+
+import os, threading, datetime
+from time import time, sleep
+from json import dumps
+
+# Seconds between two writes of the metrics file
+METRICS_INTERVAL = 15
+
+ENABLED = False
+RUN_ID = None
+LABELS = {}
+EVENTS = None
+METRICS_FILE = None
+WRITER = None
+VALUES = {}
+LOCK = threading.Lock()
+
+'''
+Metrics of the run : type and help of each one. The values are kept by name and labels.
+'''
+METRICS = {
+    "invictus_aws_run_start_timestamp_seconds": ("gauge", "Time the run started, in seconds since the epoch."),
+    "invictus_aws_run_finished": ("gauge", "1 once the run is finished, 0 while it runs."),
+    "invictus_aws_last_event_timestamp_seconds": ("gauge", "Time of the last event of the run, in seconds since the epoch. Stalls when the run is stuck."),
+    "invictus_aws_step_running": ("gauge", "1 while a step runs in a region, 0 once it is done."),
+    "invictus_aws_step_duration_seconds": ("gauge", "Wall time of a step in a region."),
+    "invictus_aws_steps_completed_total": ("counter", "Steps completed."),
+    "invictus_aws_services_completed_total": ("counter", "Services completed by a step."),
+    "invictus_aws_service_items": ("gauge", "Number of elements found for a service by a step."),
+    "invictus_aws_api_calls_total": ("counter", "Calls made to AWS."),
+    "invictus_aws_api_errors_total": ("counter", "Calls to AWS that returned an error."),
+    "invictus_aws_api_throttles_total": ("counter", "Attempts of calls to AWS that were throttled."),
+    "invictus_aws_objects_transferred_total": ("counter", "S3 objects copied to the bucket of the tool or downloaded."),
+    "invictus_aws_bytes_transferred_total": ("counter", "Size of the S3 objects copied to the bucket of the tool or downloaded."),
+    "invictus_aws_resident_memory_bytes": ("gauge", "Resident memory of the process."),
+}
+
+def set_metrics(run_id, events=None, metrics_dir=None, interval=None):
+    """Start writing the events of the run and its metrics.
+
+    Parameters
+    ----------
+    run_id : str
+        Id of the run, added to each event and metric
+    events : str, optional
+        File where the events are appended, one JSON object per line
+    metrics_dir : str, optional
+        Folder where the metrics file is written, for the textfile collector of node_exporter
+    interval : int, optional
+        Seconds between two writes of the metrics file
+    """
+    global ENABLED
+    global RUN_ID
+    global EVENTS
+    global METRICS_FILE
+    global METRICS_INTERVAL
+    global WRITER
+
+    if not events and not metrics_dir:
+        return
+
+    ENABLED = True
+    RUN_ID = run_id
+
+    # set by the organization mode, so the runs of the accounts can be told apart
+    if os.environ.get("INVICTUS_AWS_ACCOUNT"):
+        LABELS["account"] = os.environ["INVICTUS_AWS_ACCOUNT"]
+
+    if events:
+        folder = os.path.dirname(events)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        # appended, several runs (--org, ...) can share the same file
+        EVENTS = open(events, "a")
+
+    set_gauge("invictus_aws_run_start_timestamp_seconds", time())
+    set_gauge("invictus_aws_run_finished", 0)
+
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        METRICS_FILE = os.path.join(metrics_dir, f"invictus_aws_{run_id}.prom")
+        if interval:
+            METRICS_INTERVAL = interval
+        write_metrics()
+        WRITER = threading.Thread(target=run_writer, name="invictus-metrics", daemon=True)
+        WRITER.start()
+
+    emit("run_start")
+
+def emit(event, **fields):
+    """Write an event of the run.
+
+    Parameters
+    ----------
+    event : str
+        Name of the event (step_start, service_end, transfer, api_error, ...)
+    **fields : list, optional
+        Fields of the event
+    """
+    if not ENABLED:
+        return
+
+    now = time()
+    set_gauge("invictus_aws_last_event_timestamp_seconds", now)
+
+    if EVENTS is None:
+        return
+
+    record = {"time": datetime.datetime.fromtimestamp(now, datetime.timezone.utc).isoformat(), "run_id": RUN_ID}
+    record.update(LABELS)
+    record["event"] = event
+    record.update(fields)
+    line = dumps(record, default=str) + "\n"
+
+    with LOCK:
+        # one write per line, so the lines of concurrent runs are not mixed
+        EVENTS.write(line)
+        EVENTS.flush()
+
+def inc(name, value=1, **labels):
+    """Increase a counter.
+
+    Parameters
+    ----------
+    name : str
+        Name of the counter
+    value : int, optional
+        Value added
+    **labels : list, optional
+        Labels of the counter
+    """
+    if not ENABLED:
+        return
+
+    key = (name, tuple(sorted(labels.items())))
+    with LOCK:
+        VALUES[key] = VALUES.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    """Set the value of a gauge.
+
+    Parameters
+    ----------
+    name : str
+        Name of the gauge
+    value : float
+        Value of the gauge
+    **labels : list, optional
+        Labels of the gauge
+    """
+    if not ENABLED:
+        return
+
+    with LOCK:
+        VALUES[(name, tuple(sorted(labels.items())))] = value
+
+def count_items(step, region, service, count):
+    """Record the number of elements found for a service by a step.
+
+    Parameters
+    ----------
+    step : str
+        Name of the step (enumeration, configuration, logs)
+    region : str
+        Region where the step is run
+    service : str
+        Name of the service
+    count : int
+        Number of elements found
+    """
+    set_gauge("invictus_aws_service_items", count, step=step, region=region, service=service)
+    emit("service_items", step=step, region=region, service=service, count=count)
+
+def record_transfer(mode, bucket, prefix, objects, size):
+    """Record a batch of S3 objects copied to the bucket of the tool or downloaded.
+
+    Parameters
+    ----------
+    mode : str
+        copy or download
+    bucket : str
+        Source bucket
+    prefix : str
+        Path copied in the source bucket
+    objects : int
+        Number of objects transferred
+    size : int
+        Size of the objects transferred, in bytes
+    """
+    if not objects:
+        return
+
+    inc("invictus_aws_objects_transferred_total", objects, mode=mode)
+    inc("invictus_aws_bytes_transferred_total", size, mode=mode)
+    emit("transfer", mode=mode, bucket=bucket, prefix=prefix, objects=objects, bytes=size)
+
+def escape(value):
+    """Return a label value escaped for the text format.
+
+    Parameters
+    ----------
+    value : object
+        Value of the label
+
+    Returns
+    -------
+    value : str
+        Escaped value
+    """
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def format_metrics():
+    """Return the metrics of the run in the text format of Prometheus.
+
+    Returns
+    -------
+    text : str
+        Metrics of the run
+    """
+    with LOCK:
+        values = dict(VALUES)
+
+    common = [("run_id", RUN_ID)] + sorted(LABELS.items())
+
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        samples = sorted((labels, value) for (metric, labels), value in values.items() if metric == name)
+        if not samples:
+            continue
+
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            text = ",".join(f'{key}="{escape(item)}"' for key, item in common + list(labels))
+            lines.append(f"{name}{{{text}}} {value}")
+
+    return "\n".join(lines) + "\n"
+
+def write_metrics():
+    """Write the metrics file. It is written under another name first, so the collector never reads a partial file."""
+    if METRICS_FILE is None:
+        return
+
+    tmp = f"{METRICS_FILE}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            f.write(format_metrics())
+        os.replace(tmp, METRICS_FILE)
+    except OSError as e:
+        print(f"[!] Error : The metrics file could not be written : {str(e)}")
+
+def run_writer():
+    """Write the metrics file every METRICS_INTERVAL seconds until the end of the process."""
+    while True:
+        sleep(METRICS_INTERVAL)
+        write_metrics()
+
+def close_metrics(**fields):
+    """Write the last event and the last metrics of the run.
+
+    Parameters
+    ----------
+    **fields : list, optional
+        Fields of the run_end event
+    """
+    global EVENTS
+
+    if not ENABLED:
+        return
+
+    set_gauge("invictus_aws_run_finished", 1)
+    emit("run_end", **fields)
+    write_metrics()
+
+    if EVENTS is not None:
+        with LOCK:
+            EVENTS.close()
+            EVENTS = None
@@ -0,0 +1,158 @@
+"""File containing the functions used to acquire every account of an AWS Organization."""
+
+import os, sys, subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import source.utils.utils
+from source.utils.utils import create_client, try_except, get_account_id, create_folder, ROOT_FOLDER
+
+# Arguments of the organization mode, removed from the command run in each account
+ORG_ARGUMENTS = {"--org": 1, "--max-accounts": 1}
+
+def list_accounts():
+    """Return the active accounts of the organization.
+
+    Returns
+    -------
+    accounts : list of dict
+        Id and name of each account
+    """
+    client = create_client("organizations")
+    paginator = client.get_paginator("list_accounts")
+
+    accounts = []
+    for page in paginator.paginate():
+        for account in page.get("Accounts", []):
+            if account.get("Status") == "ACTIVE":
+                accounts.append({"id": account["Id"], "name": account.get("Name", "")})
+    return accounts
+
+def assume_role(account, role):
+    """Assume a role in a member account.
+
+    Parameters
+    ----------
+    account : str
+        Id of the account
+    role : str
+        Name of the role to assume
+
+    Returns
+    -------
+    credentials : dict
+        Temporary credentials of the role. Contains an error if the role could not be assumed
+    """
+    client = create_client("sts")
+    response = try_except(
+        client.assume_role,
+        RoleArn=f"arn:aws:iam::{account}:role/{role}",
+        RoleSessionName=f"invictus-aws-{source.utils.utils.RUN_ID}"[:64],
+    )
+    if "error" in response:
+        return response
+    return response["Credentials"]
+
+def account_arguments(argv):
+    """Return the arguments of the tool without the ones of the organization mode.
+
+    Parameters
+    ----------
+    argv : list of str
+        Arguments of the tool
+
+    Returns
+    -------
+    arguments : list of str
+        Arguments given to the tool run in each account
+    """
+    arguments = []
+    skip = 0
+
+    for arg in argv:
+        if skip:
+            skip -= 1
+            continue
+        name = arg.split("=", 1)[0]
+        if name in ORG_ARGUMENTS:
+            if "=" not in arg:
+                skip = ORG_ARGUMENTS[name]
+            continue
+        arguments.append(arg)
+
+    return arguments
+
+def run_account(account, role, current, arguments):
+    """Run the tool in a separate process for one account, with its own credentials and output folder.
+    The role is assumed just before the process starts, so the credentials of the last accounts don't expire while they wait.
+
+    Parameters
+    ----------
+    account : dict
+        Id and name of the account
+    role : str
+        Name of the role assumed in the account
+    current : str
+        Id of the account of the current credentials, used without assuming the role
+    arguments : list of str
+        Arguments of the tool
+
+    Returns
+    -------
+    code : int or str
+        Exit code of the process, or the error if the role could not be assumed
+    """
+    credentials = None
+    if account["id"] != current:
+        credentials = assume_role(account["id"], role)
+        if "error" in credentials:
+            return f"the role {role} could not be assumed : {credentials['error']}"
+
+    folder = f"{ROOT_FOLDER}{account['id']}/"
+    create_folder(folder)
+
+    env = dict(os.environ)
+    env["INVICTUS_AWS_RESULTS"] = folder
+    env["INVICTUS_AWS_ACCOUNT"] = account["id"]
+    if credentials:
+        env["AWS_ACCESS_KEY_ID"] = credentials["AccessKeyId"]
+        env["AWS_SECRET_ACCESS_KEY"] = credentials["SecretAccessKey"]
+        env["AWS_SESSION_TOKEN"] = credentials["SessionToken"]
+        env.pop("AWS_PROFILE", None)
+
+    with open(f"{folder}acquisition.log", "w") as log:
+        process = subprocess.run([sys.executable, sys.argv[0]] + arguments, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return process.returncode
+
+def run_organization(role, max_accounts, argv):
+    """Acquire every active account of the organization, several accounts at the same time.
+
+    Parameters
+    ----------
+    role : str
+        Name of the role assumed in each member account
+    max_accounts : int
+        Maximum number of accounts acquired at the same time
+    argv : list of str
+        Arguments of the tool
+    """
+    accounts = list_accounts()
+    current = get_account_id()
+    arguments = account_arguments(argv)
+
+    print(f"[+] {len(accounts)} active accounts found in the organization")
+
+    # the threads only wait for the processes, each account is acquired by its own process with its own clients
+    with ThreadPoolExecutor(max_workers=max_accounts) as executor:
+        jobs = {executor.submit(run_account, account, role, current, arguments): account for account in accounts}
+
+        for job in as_completed(jobs):
+            account = jobs[job]
+            try:
+                code = job.result()
+            except Exception as e:
+                code = str(e)
+
+            if code == 0:
+                print(f"[+] Account {account['id']} ({account['name']}) acquired in {ROOT_FOLDER}{account['id']}/")
+            else:
+                print(f"[!] Error : The acquisition of the account {account['id']} ({account['name']}) failed ({code}). See {ROOT_FOLDER}{account['id']}/acquisition.log if it exists")
@@ -0,0 +1,289 @@
+"""File containing the registry of the collected services : how each service is listed and configured, and the executor running these descriptions."""
+
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from source.utils.utils import create_command, fix_json, try_except
+import source.utils.utils
+from source.utils.enum import s3_lookup, ec2_lookup, paginate, global_paginate, simple_paginate, misc_lookup, simple_misc_lookup, fetch_details
+
+STEPS = ("enumeration", "configuration", "logs")
+
+@dataclass(frozen=True)
+class Call:
+    """Description of a call made to collect a service.
+
+    Parameters
+    ----------
+    client : str
+        Name of the client in source.utils.utils (LAMBDA_CLIENT, EC2_CLIENT, ...)
+    operation : str
+        Method of the client (list_functions, describe_vpcs, ...)
+    result : str, optional
+        Part of the response kept (Functions, Vpcs, ...). The whole responses are kept if not given
+    token : str, optional
+        Token of the next page, for the operations without a paginator (NextMarker, NextToken, ...)
+    per_id : str, optional
+        Parameter receiving each identifier of the service : the call is made once per element
+    element_key : str, optional
+        With per_id, field of the elements sent instead of their identifiers
+    parameters : dict, optional
+        Parameters added to the call
+    cached : bool, optional
+        True if the results are the same in every region, they are then fetched once for the account
+    command : str, optional
+        Command of the aws cli written in the configuration results
+    lookup : function, optional
+        Function returning the results, used instead of the operation (s3_lookup, ec2_lookup)
+    listed : bool, optional
+        True if the results are the elements listed by the enumeration, no call is made again
+    """
+    client: Optional[str] = None
+    operation: Optional[str] = None
+    result: Optional[str] = None
+    token: Optional[str] = None
+    per_id: Optional[str] = None
+    element_key: Optional[str] = None
+    parameters: dict = field(default_factory=dict)
+    cached: bool = False
+    command: Optional[str] = None
+    lookup: Optional[Callable] = None
+    listed: bool = False
+
+@dataclass(frozen=True)
+class Collector:
+    """Description of a collected service.
+
+    Parameters
+    ----------
+    name : str
+        Name of the service, key of its results (s3, lambda, ...)
+    listing : Call, optional
+        Call listing the elements of the service
+    id_key : str, optional
+        Field of the elements used as their identifier. The element itself if not given
+    global_steps : tuple of str, optional
+        Steps where the service is only collected in the first region (global services)
+    list_ids : bool, optional
+        True if the identifiers found by the enumeration are printed
+    steps : tuple of str, optional
+        Steps collecting the service
+    configuration : tuple of Call, optional
+        Calls of the configuration. If empty, the service has its own method (get_configuration_<name>)
+    time_window : bool, optional
+        True if the logs of the service are collected between the -start and -end dates
+    results : str, optional
+        Key of the configuration results, if it isn't the name of the service
+    """
+    name: str
+    listing: Optional[Call] = None
+    id_key: Optional[str] = None
+    global_steps: tuple = ()
+    list_ids: bool = False
+    steps: tuple = STEPS
+    configuration: tuple = ()
+    time_window: bool = False
+    results: Optional[str] = None
+
+'''
+The services, in the order they are collected by each step.
+'''
+SERVICES = [
+    Collector("s3", Call(lookup=s3_lookup), "Name", global_steps=STEPS),
+    Collector("iam", Call("IAM_CLIENT", "list_users", "Users", cached=True), "Arn", global_steps=STEPS, steps=("enumeration", "configuration")),
+    Collector("cloudtrail", Call("CLOUDTRAIL_CLIENT", "list_trails", "Trails", cached=True), "Name", global_steps=STEPS, steps=("enumeration", "configuration")),
+    Collector("cloudtrail-logs", global_steps=STEPS, steps=("logs",), time_window=True),
+    Collector("route53", Call("ROUTE53_CLIENT", "list_hosted_zones", "HostedZones", cached=True), "Id", global_steps=("enumeration", "configuration")),
+    Collector("wafv2", Call("WAF_CLIENT", "list_web_acls", "WebACLs", token="NextMarker", parameters={"Scope": "REGIONAL", "Limit": 100}), "ARN"),
+    Collector("lambda", Call("LAMBDA_CLIENT", "list_functions", "Functions"), "FunctionName", steps=("enumeration", "configuration"), configuration=(
+        Call("LAMBDA_CLIENT", "get_function_configuration", per_id="FunctionName", command="aws lambda get-function-configuration --function-name <name>"),
+        Call("LAMBDA_CLIENT", "get_account_settings", command="aws lambda get-account-settings"),
+        Call("LAMBDA_CLIENT", "list_event_source_mappings", command="aws lambda list-event-source-mappings"),
+    )),
+    Collector("vpc", Call("EC2_CLIENT", "describe_vpcs", "Vpcs"), "VpcId", configuration=(
+        Call("EC2_CLIENT", "describe_vpc_attribute", per_id="VpcId", parameters={"Attribute": "enableDnsSupport"}, command="aws ec2 describe-vpc-attribute --vpc-id <id> --attribute enableDnsSupport"),
+        Call("EC2_CLIENT", "describe_vpc_attribute", per_id="VpcId", parameters={"Attribute": "enableDnsHostnames"}, command="aws ec2 describe-vpc-attribute --vpc-id <id> --attribute enableDnsHostnames"),
+        Call("EC2_CLIENT", "describe_flow_logs", command="aws ec2 describe-flow-logs"),
+        Call("EC2_CLIENT", "describe_vpc_peering_connections", command="aws ec2 describe-vpc-peering-connections"),
+        Call("EC2_CLIENT", "describe_vpc_endpoint_connections", command="aws ec2 describe-vpc-endpoint-connections"),
+        Call("EC2_CLIENT", "describe_vpc_endpoint_service_configurations", command="aws ec2 describe-vpc-endpoint-service-configurations"),
+        Call("EC2_CLIENT", "describe_vpc_classic_link", command="aws ec2 describe-vpc-classic-link"),
+        Call("EC2_CLIENT", "describe_vpc_endpoints", command="aws ec2 describe-vpc-endpoints"),
+        Call("EC2_CLIENT", "describe_local_gateway_route_table_vpc_associations", command="aws ec2 describe-local-gateway-route-table-vpc-associations"),
+    )),
+    Collector("elasticbeanstalk", Call("EB_CLIENT", "describe_environments", "Environments"), "EnvironmentArn", results="eb"),
+    Collector("ec2", Call(lookup=ec2_lookup), "InstanceId", steps=("enumeration", "configuration")),
+    Collector("dynamodb", Call("DYNAMODB_CLIENT", "list_tables", "TableNames"), steps=("enumeration", "configuration")),
+    Collector("rds", Call("RDS_CLIENT", "describe_db_instances", "DBInstances"), "DBInstanceArn", time_window=True, configuration=(
+        Call("RDS_CLIENT", "describe_db_clusters", command="aws rds describe-db-clusters"),
+        Call("RDS_CLIENT", "describe_db_snapshots", command="aws rds describe-db-snapshots"),
+        Call("RDS_CLIENT", "describe_db_proxies", command="aws rds describe-db-proxies "),
+    )),
+    Collector("eks", Call("EKS_CLIENT", "list_clusters", "clusters"), steps=("enumeration",)),
+    Collector("els", Call("ELS_CLIENT", "list_domain_names", "DomainNames"), "DomainName", steps=("enumeration",)),
+    Collector("secrets", Call("SECRETS_CLIENT", "list_secrets", "SecretList"), "ARN", steps=("enumeration",)),
+    Collector("kinesis", Call("KINESIS_CLIENT", "list_streams", "StreamNames"), steps=("enumeration",)),
+    Collector("cloudwatch", Call("CLOUDWATCH_CLIENT", "list_dashboards", "DashboardEntries", cached=True), "DashboardArn", configuration=(
+        Call("CLOUDWATCH_CLIENT", "get_dashboard", per_id="DashboardName", element_key="DashboardName", command="aws cloudwatch get-dashboard --name <name>"),
+        Call("CLOUDWATCH_CLIENT", "list_metrics", command="aws cloudwatch list-metrics --name <name>"),
+    )),
+    Collector("guardduty", Call("GUARDDUTY_CLIENT", "list_detectors", "DetectorIds")),
+    Collector("detective", Call("DETECTIVE_CLIENT", "list_graphs", "GraphList", token="NextToken", parameters={"MaxResults": 100}), "Arn", steps=("enumeration", "configuration"), configuration=(
+        Call(listed=True, command="aws detective list-graphs "),
+    )),
+    Collector("inspector", Call("INSPECTOR_CLIENT", "list_coverage", "coveredResources"), "resourceId", list_ids=True, configuration=(
+        Call(listed=True, command="aws inspector2 list-coverage"),
+        Call("INSPECTOR_CLIENT", "list_usage_totals", command="aws inspector2 list-usage-totals"),
+        Call("INSPECTOR_CLIENT", "list_account_permissions", command="aws inspector2 list-account-permissions"),
+    )),
+    Collector("macie", Call("MACIE_CLIENT", "describe_buckets", "buckets"), "bucketArn", configuration=(
+        Call("MACIE_CLIENT", "get_finding_statistics", parameters={"groupBy": "severity.description"}, command="aws macie2 get-finding-statistics --group-by severity.description"),
+        Call("MACIE_CLIENT", "get_finding_statistics", parameters={"groupBy": "type"}, command="aws macie2 get-finding-statistics --group-by type"),
+    )),
+]
+
+REGISTRY = {collector.name: collector for collector in SERVICES}
+
+def collectors(step, region, regionless):
+    """Return the services collected by a step in a region, in their order.
+
+    Parameters
+    ----------
+    step : str
+        Name of the step (enumeration, configuration, logs)
+    region : str
+        Region where the step is run
+    regionless : str
+        "not-all" if the tool is used on only one region. First region to run the tool on otherwise
+
+    Returns
+    -------
+    collectors : list of Collector
+        Services collected
+    """
+    first = (regionless != "" and regionless == region) or regionless == "not-all"
+    return [collector for collector in SERVICES if step in collector.steps and (first or step not in collector.global_steps)]
+
+def run_call(call, name, identifiers=None, elements=None):
+    """Make a call of the registry.
+
+    Parameters
+    ----------
+    call : Call
+        Description of the call
+    name : str
+        Name of the service, only used for the progress bars
+    identifiers : list, optional
+        Identifiers of the elements of the service, for the calls made once per element
+    elements : list, optional
+        Elements of the service, for the calls made once per element or returning them
+
+    Returns
+    -------
+    results : object
+        Results of the call : list of the elements, list of the pages, response, or response of each identifier
+    """
+    if call.lookup:
+        return call.lookup()
+
+    if call.listed:
+        return elements
+
+    client = getattr(source.utils.utils, call.client)
+    function = getattr(client, call.operation)
+
+    if call.per_id:
+        if call.element_key:
+            identifiers = [element.get(call.element_key, "") for element in elements]
+        return fetch_details(name.upper(), function, identifiers, call.per_id, **call.parameters)
+
+    if call.token:
+        if call.result:
+            return misc_lookup(name.upper(), function, call.token, call.result, **call.parameters)
+        return simple_misc_lookup(name.upper(), function, call.token, **call.parameters)
+
+    # operations without paginator nor token, a single call
+    if not client.can_paginate(call.operation):
+        response = try_except(function, **call.parameters)
+        response.pop("ResponseMetadata", None)
+        response = fix_json(response)
+        if call.result:
+            return response.get(call.result, [])
+        return response
+
+    if not call.result:
+        return simple_paginate(client, call.operation, **call.parameters)
+    if call.cached:
+        return global_paginate(client, call.operation, call.result, **call.parameters)
+    return paginate(client, call.operation, call.result, **call.parameters)
+
+def list_service(collector):
+    """List the elements of a service and their identifiers.
+
+    Parameters
+    ----------
+    collector : Collector
+        Description of the service
+
+    Returns
+    -------
+    elements : list
+        Elements of the service
+    ids : list
+        Identifiers of the elements
+    """
+    elements = run_call(collector.listing, collector.name)
+
+    if collector.id_key is None:
+        return elements, list(elements)
+    return elements, [element[collector.id_key] for element in elements]
+
+def enumerated(services, name):
+    """Return the elements of a service found by the enumeration. They are listed again if the enumeration was not run, and kept for the next steps.
+
+    Parameters
+    ----------
+    services : dict
+        Results of the enumeration, based on the const ENUMERATION_SERVICES
+    name : str
+        Name of the service
+
+    Returns
+    -------
+    elements : list
+        Elements of the service. None if there is none
+    ids : list
+        Identifiers of the elements. None if there is none
+    """
+    service = services[name]
+
+    if service["count"] == -1:
+        elements, ids = list_service(REGISTRY[name])
+        service.update({"count": len(elements), "elements": elements, "ids": ids})
+
+    if service["count"] == 0:
+        return None, None
+    return service["elements"], service["ids"]
+
+def configure_service(collector, elements, ids):
+    """Run the configuration calls of a service.
+
+    Parameters
+    ----------
+    collector : Collector
+        Description of the service
+    elements : list
+        Elements of the service
+    ids : list
+        Identifiers of the elements
+
+    Returns
+    -------
+    results : list of dict
+        Results of each call, with its aws cli command
+    """
+    results = []
+    for call in collector.configuration:
+        data = run_call(call, collector.name, ids, elements)
+        results.append(create_command(call.command, data))
+    return results
@@ -0,0 +1,303 @@
+"""File containing the record and the replay of the AWS responses, so a run can be done again without the account."""
+
+import os, gzip, threading, datetime
+from io import BytesIO, IOBase
+from hashlib import sha256
+from base64 import b64encode, b64decode
+from json import dumps, loads
+from botocore.awsrequest import AWSResponse
+from botocore.response import StreamingBody
+
+# Operations only reading the account. A missing response of another operation (the writes of the tool in its own buckets) is answered with an empty success
+READ_PREFIXES = ("List", "Describe", "Get", "Lookup", "Search", "Batch", "Head", "Select", "Download", "Filter", "Query", "Scan")
+
+def encode(value):
+    """Return a value of a response or of the parameters of a call as json, keeping the datetimes, bytes and streams.
+
+    Parameters
+    ----------
+    value : object
+        Value to encode
+
+    Returns
+    -------
+    value : object
+        Encoded value
+    """
+    if isinstance(value, dict):
+        return {key: encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": b64encode(value).decode()}
+    if isinstance(value, (StreamingBody, IOBase)) or hasattr(value, "read"):
+        return {"__stream__": None}
+    return value
+
+def decode(value):
+    """Return a value encoded by encode.
+
+    Parameters
+    ----------
+    value : object
+        Encoded value
+
+    Returns
+    -------
+    value : object
+        Decoded value
+    """
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    if "__datetime__" in value:
+        return datetime.datetime.fromisoformat(value["__datetime__"])
+    if "__bytes__" in value:
+        return b64decode(value["__bytes__"])
+    if "__stream__" in value:
+        data = b64decode(value["__stream__"] or "")
+        return StreamingBody(BytesIO(data), len(data))
+    return {key: decode(item) for key, item in value.items()}
+
+def request_key(service, region, model, params):
+    """Return the address of a call : hash of the service, region, operation and parameters.
+    The idempotency tokens, generated for each call, are left out. The bodies are replaced by their hash.
+
+    Parameters
+    ----------
+    service : str
+        Name of the service
+    region : str
+        Region of the client
+    model : OperationModel
+        Model of the operation
+    params : dict
+        Parameters of the call
+
+    Returns
+    -------
+    key : str
+        Address of the call
+    """
+    members = model.input_shape.members if model.input_shape is not None else {}
+    kept = {}
+
+    for name, value in params.items():
+        if name in members and members[name].metadata.get("idempotencyToken"):
+            continue
+        if isinstance(value, str) and name == "Body":
+            value = value.encode()
+        if isinstance(value, (bytes, bytearray)):
+            value = {"__sha256__": sha256(value).hexdigest()}
+        kept[name] = encode(value)
+
+    return sha256(dumps([service, region, model.name, kept], sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResponseStore:
+
+    folder = None
+    replaying = None
+    index = None
+    served = None
+    lock = None
+
+    def __init__(self, folder, replaying=False):
+        """Handle the constructor of the ResponseStore class.
+
+        The folder contains :
+        - objects/ : the responses, compressed, each one in a file named after the hash of its content, so identical responses are kept once
+        - index.jsonl : for each recorded call, its address and the hash of its response, in the order of the calls
+        - run.json : the buckets of the recorded run
+
+        Parameters
+        ----------
+        folder : str
+            Folder of the recorded responses
+        replaying : bool, optional
+            True if the responses are replayed, False if they are recorded
+        """
+        self.folder = folder if folder.endswith("/") else folder + "/"
+        self.replaying = replaying
+        self.index = {}
+        self.served = {}
+        self.lock = threading.Lock()
+
+    def write_object(self, response):
+        """Write a response in the store, unless the same response is already there.
+
+        Parameters
+        ----------
+        response : dict
+            Encoded response
+
+        Returns
+        -------
+        digest : str
+            Hash of the response
+        """
+        content = dumps(response).encode()
+        digest = sha256(content).hexdigest()
+        path = f"{self.folder}objects/{digest[:2]}/{digest}.json.gz"
+
+        if not os.path.isfile(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written under another name first, so a concurrent reader never sees a partial file
+            tmp = f"{path}.{threading.get_ident()}"
+            with gzip.open(tmp, "wb") as f:
+                f.write(content)
+            os.replace(tmp, path)
+
+        return digest
+
+    def read_object(self, digest):
+        """Read a response of the store.
+
+        Parameters
+        ----------
+        digest : str
+            Hash of the response
+
+        Returns
+        -------
+        response : dict
+            Encoded response
+        """
+        with gzip.open(f"{self.folder}objects/{digest[:2]}/{digest}.json.gz", "rb") as f:
+            return loads(f.read())
+
+    def save_run(self, buckets):
+        """Write the buckets of the recorded run.
+
+        Parameters
+        ----------
+        buckets : dict
+            Names of the preparation and logs buckets
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        with open(f"{self.folder}run.json", "w") as f:
+            f.write(dumps({"buckets": buckets}))
+
+    def load_run(self):
+        """Read the buckets of the recorded run and the index of the calls.
+
+        Returns
+        -------
+        buckets : dict
+            Names of the preparation and logs buckets. Empty if they were not saved
+        """
+        with open(f"{self.folder}index.jsonl", "rt") as f:
+            for line in f:
+                if line.strip():
+                    entry = loads(line)
+                    self.index.setdefault(entry["request"], []).append(entry["response"])
+
+        if not os.path.isfile(f"{self.folder}run.json"):
+            return {}
+        with open(f"{self.folder}run.json", "rt") as f:
+            return loads(f.read()).get("buckets", {})
+
+    def record(self, client):
+        """Record every call of a client, after it was answered by AWS.
+
+        Parameters
+        ----------
+        client : object
+            Boto3 client
+        """
+        service = client.meta.service_model.service_name
+        region = client.meta.region_name or "global"
+
+        # before-call receives the serialized request, the parameters of the call are kept before
+        def keep_params(params, model, context, **kwargs):
+            context["record_key"] = request_key(service, region, model, params)
+
+        def after_call(http_response, parsed, model, context, **kwargs):
+            key = context.pop("record_key", None)
+            if key is None:
+                return
+
+            '''
+            The streamed bodies (s3 objects, ...) are read to be recorded and replaced by a copy for the tool.
+            '''
+            stream = None
+            for name, value in parsed.items():
+                if isinstance(value, StreamingBody):
+                    data = value.read()
+                    parsed[name] = StreamingBody(BytesIO(data), len(data))
+                    stream = (name, data)
+
+            response = encode(parsed)
+            if stream:
+                response[stream[0]] = {"__stream__": b64encode(stream[1]).decode()}
+            response.get("ResponseMetadata", {}).pop("HTTPHeaders", None)
+            response.get("ResponseMetadata", {}).pop("RequestId", None)
+
+            status = http_response.status_code if http_response is not None else 200
+            digest = self.write_object({"status": status, "response": response})
+
+            with self.lock:
+                with open(f"{self.folder}index.jsonl", "a") as f:
+                    f.write(dumps({"request": key, "response": digest, "operation": f"{region}:{service}:{model.name}"}) + "\n")
+
+        '''
+        The response is recorded before the handlers of botocore transform it (policy documents decoding, ...), as they transform the replayed one again.
+        The handlers of the most specific events are called first, so it is registered for every operation of the service rather than for every call.
+        '''
+        client.meta.events.register("before-parameter-build", keep_params)
+        client.meta.events.register_first(f"after-call.{client.meta.service_model.service_id.hyphenize()}.*", after_call)
+
+    def next_response(self, key):
+        """Return the next recorded response of a call. A call made several times (polling, ...) gets its responses in the recorded order, then the last one.
+
+        Parameters
+        ----------
+        key : str
+            Address of the call
+
+        Returns
+        -------
+        digest : str
+            Hash of the response. None if the call was not recorded
+        """
+        with self.lock:
+            responses = self.index.get(key)
+            if not responses:
+                return None
+            position = self.served.get(key, 0)
+            self.served[key] = position + 1
+            return responses[min(position, len(responses) - 1)]
+
+    def replay(self, client):
+        """Answer every call of a client with the recorded responses, without any network access.
+
+        Parameters
+        ----------
+        client : object
+            Boto3 client
+        """
+        service = client.meta.service_model.service_name
+        region = client.meta.region_name or "global"
+
+        def keep_params(params, model, context, **kwargs):
+            context["replay_key"] = request_key(service, region, model, params)
+
+        def answer(model, context, **kwargs):
+            digest = self.next_response(context.get("replay_key"))
+
+            if digest is None:
+                if model.name.startswith(READ_PREFIXES):
+                    error = {"Error": {"Code": "ReplayMissing", "Message": f"{model.name} was not recorded with these parameters"}, "ResponseMetadata": {"HTTPStatusCode": 404}}
+                    return AWSResponse(None, 404, {}, None), error
+                return AWSResponse(None, 200, {}, None), {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+            recorded = self.read_object(digest)
+            return AWSResponse(None, recorded["status"], {}, None), decode(recorded["response"])
+
+        # answered before the rate limiter, nothing is sent to AWS
+        client.meta.events.register("before-parameter-build", keep_params)
+        client.meta.events.register_first("before-call", answer)
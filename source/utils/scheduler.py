@@ -0,0 +1,55 @@
+"""File containing the scheduler of --schedule graph : the services of steps 1, 2 and 3 are the nodes of a graph, each one starting as soon as the nodes it needs are done."""
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+def run_graph(nodes, workers):
+    """Run the nodes of a dependency graph, each one as soon as its dependencies are done.
+    A node that fails doesn't stop the others : its error is printed and the nodes depending on it are still run, as a failed step doesn't stop the next ones.
+    The nodes only orchestrate, their calls are still made on the shared pool (or the async engine).
+
+    Parameters
+    ----------
+    nodes : dict
+        Function and keys of the dependencies of each node, by key. The nodes ready at the same time start in the order of the dict
+    workers : int
+        Maximum number of nodes run at the same time
+
+    Returns
+    -------
+    errors : dict
+        Error of each node that failed, by key
+    """
+    remaining = {key: set(dependencies) & set(nodes) for key, (function, dependencies) in nodes.items()}
+    dependents = {key: [] for key in nodes}
+    for key, dependencies in remaining.items():
+        for dependency in dependencies:
+            dependents[dependency].append(key)
+
+    errors = {}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(nodes))), thread_name_prefix="invictus-node") as pool:
+
+        def start_ready():
+            for key in [key for key, dependencies in remaining.items() if not dependencies]:
+                del remaining[key]
+                running[pool.submit(nodes[key][0])] = key
+
+        start_ready()
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    errors[key] = error
+                    print(f"[!] Error : {' '.join(key)} : {str(error)}")
+                for dependent in dependents[key]:
+                    remaining[dependent].discard(key)
+            start_ready()
+
+    if remaining:
+        raise ValueError(f"Cycle in the graph of the services : {', '.join(' '.join(key) for key in remaining)}")
+
+    return errors
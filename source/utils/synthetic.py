@@ -0,0 +1,344 @@
+"""File containing the synthetic account answering the AWS calls of the tool, used by the offline benchmark."""
+
+import datetime, threading, asyncio, os, gzip
+from random import Random
+from time import sleep
+from json import dumps
+from urllib.parse import quote
+from botocore.awsrequest import AWSResponse
+
+from source.utils.instrument import record_throttle
+from source.utils.throttle import record_throttled
+
+# Same number of attempts as the retries of the clients
+MAX_ATTEMPTS = 10
+
+ACCOUNT = "123456789012"
+
+# Events of the synthetic trail read by the analysis, a few of them matched by the default queries
+TRAIL_EVENTS = [
+    ("s3.amazonaws.com", "GetObject"),
+    ("s3.amazonaws.com", "ListBuckets"),
+    ("iam.amazonaws.com", "CreateAccessKey"),
+    ("sts.amazonaws.com", "GetSessionToken"),
+    ("ec2.amazonaws.com", "DescribeInstances"),
+    ("ec2.amazonaws.com", "ModifySnapshotAttribute"),
+    ("cloudtrail.amazonaws.com", "StopLogging"),
+    ("lambda.amazonaws.com", "ListFunctions20150331"),
+]
+TRAIL_IDENTITIES = ["IAMUser", "AssumedRole", "Root"]
+
+# Number of records of each file of the synthetic trail
+TRAIL_FILE_RECORDS = 500
+
+
+class SyntheticAccount:
+
+    buckets = None
+    functions = None
+    snapshots = None
+    events = None
+    users = None
+    latency = None
+    throttle_rate = None
+    page_size = None
+    random = None
+    lock = None
+    pages = None
+
+    def __init__(self, buckets=10, functions=10, snapshots=10, events=100, users=10, latency=0, throttle_rate=0.0, page_size=50, seed=0):
+        """Handle the constructor of the SyntheticAccount class.
+
+        Parameters
+        ----------
+        buckets : int, optional
+            Number of S3 buckets
+        functions : int, optional
+            Number of Lambda functions
+        snapshots : int, optional
+            Number of EC2 snapshots
+        events : int, optional
+            Number of CloudTrail events
+        users : int, optional
+            Number of IAM users
+        latency : float, optional
+            Latency added to each call, in seconds
+        throttle_rate : float, optional
+            Probability of an attempt to be throttled
+        page_size : int, optional
+            Number of elements of each page of the paginated operations
+        seed : int, optional
+            Seed of the injected throttling, so two runs make the same calls
+        """
+        self.buckets = buckets
+        self.functions = functions
+        self.snapshots = snapshots
+        self.events = events
+        self.users = users
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.page_size = page_size
+        self.random = Random(seed)
+        self.lock = threading.Lock()
+
+        '''
+        Paginated operations of the account : array of the response, input and output tokens, and function building the nth element.
+        The other operations are answered with an empty response.
+        '''
+        self.pages = {
+            ("s3", "ListBuckets"): ("Buckets", None, None, self.bucket, lambda: self.buckets),
+            ("lambda", "ListFunctions"): ("Functions", "Marker", "NextMarker", self.function, lambda: self.functions),
+            ("ec2", "DescribeSnapshots"): ("Snapshots", "NextToken", "NextToken", self.snapshot, lambda: self.snapshots),
+            ("cloudtrail", "LookupEvents"): ("Events", "NextToken", "NextToken", self.event, lambda: self.events),
+            ("iam", "ListUsers"): ("Users", "Marker", "Marker", self.user, lambda: self.users),
+            ("iam", "GetAccountAuthorizationDetails"): ("UserDetailList", "Marker", "Marker", self.user_details, lambda: self.users),
+        }
+
+    def scale(self):
+        """Return the size of the account.
+
+        Returns
+        -------
+        scale : dict
+            Number of elements of each kind, latency and throttle rate
+        """
+        return {
+            "buckets": self.buckets,
+            "functions": self.functions,
+            "snapshots": self.snapshots,
+            "events": self.events,
+            "users": self.users,
+            "latency": self.latency,
+            "throttle_rate": self.throttle_rate,
+            "page_size": self.page_size,
+        }
+
+    def bucket(self, i, region):
+        """Return the nth bucket of the account."""
+        return {"Name": f"synthetic-bucket-{i:06d}", "CreationDate": datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)}
+
+    def function(self, i, region):
+        """Return the nth Lambda function of the account."""
+        name = f"synthetic-function-{i:06d}"
+        return {"FunctionName": name, "FunctionArn": f"arn:aws:lambda:{region}:{ACCOUNT}:function:{name}", "Runtime": "python3.11", "MemorySize": 128}
+
+    def snapshot(self, i, region):
+        """Return the nth EC2 snapshot of the account."""
+        return {"SnapshotId": f"snap-{i:017x}", "VolumeId": f"vol-{i:017x}", "State": "completed", "VolumeSize": 8, "StartTime": datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc), "OwnerId": ACCOUNT}
+
+    def event(self, i, region):
+        """Return the nth CloudTrail event of the account, the most recent first."""
+        time = datetime.datetime(2023, 6, 1, tzinfo=datetime.timezone.utc) - datetime.timedelta(seconds=i)
+        event_id = f"00000000-0000-0000-0000-{i:012d}"
+        record = {"eventVersion": "1.08", "eventID": event_id, "eventTime": time.strftime("%Y-%m-%dT%H:%M:%SZ"), "eventSource": "s3.amazonaws.com", "eventName": "GetObject", "awsRegion": region, "recipientAccountId": ACCOUNT}
+        return {"EventId": event_id, "EventName": "GetObject", "EventTime": time, "EventSource": "s3.amazonaws.com", "CloudTrailEvent": dumps(record)}
+
+    def user(self, i, region):
+        """Return the nth IAM user of the account."""
+        name = f"synthetic-user-{i:06d}"
+        return {"UserName": name, "UserId": f"AIDA{i:017d}", "Arn": f"arn:aws:iam::{ACCOUNT}:user/{name}", "Path": "/", "CreateDate": datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)}
+
+    def user_details(self, i, region):
+        """Return the authorization details of the nth IAM user of the account."""
+        user = self.user(i, region)
+        # the documents are url encoded as in the responses of AWS, botocore decodes them
+        document = {"Version": "2012-10-17", "Statement": [{"Effect": "Allow", "Action": "s3:GetObject", "Resource": "*"}]}
+        user["UserPolicyList"] = [{"PolicyName": "inline", "PolicyDocument": quote(dumps(document))}]
+        user["AttachedManagedPolicies"] = []
+        user["GroupList"] = []
+        return user
+
+    def trail_record(self, i, region):
+        """Return the nth record of the synthetic trail, the most recent first."""
+        time = datetime.datetime(2023, 6, 1, tzinfo=datetime.timezone.utc) - datetime.timedelta(seconds=i)
+        source, name = TRAIL_EVENTS[i % len(TRAIL_EVENTS)]
+        kind = TRAIL_IDENTITIES[i % len(TRAIL_IDENTITIES)]
+
+        user = f"synthetic-user-{i % max(self.users, 1):06d}"
+        identity = {"type": kind, "principalId": f"AIDA{i % max(self.users, 1):017d}", "accountId": ACCOUNT, "accessKeyId": f"AKIA{i:016d}"}
+        if kind == "IAMUser":
+            identity.update({"arn": f"arn:aws:iam::{ACCOUNT}:user/{user}", "userName": user})
+        elif kind == "AssumedRole":
+            role = {"type": "Role", "principalId": "AROABENCHMARK", "arn": f"arn:aws:iam::{ACCOUNT}:role/synthetic-role", "accountId": ACCOUNT, "userName": "synthetic-role"}
+            identity.update({"arn": f"arn:aws:sts::{ACCOUNT}:assumed-role/synthetic-role/{user}", "sessionContext": {"sessionIssuer": role, "attributes": {"mfaAuthenticated": "false", "creationDate": time.strftime("%Y-%m-%dT%H:%M:%SZ")}}})
+        else:
+            identity["arn"] = f"arn:aws:iam::{ACCOUNT}:root"
+
+        return {
+            "eventVersion": "1.08",
+            "userIdentity": identity,
+            "eventTime": time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "eventSource": source,
+            "eventName": name,
+            "awsRegion": region,
+            "sourceIPAddress": f"198.51.100.{i % 256}",
+            "userAgent": "aws-cli/2.13.0",
+            "requestParameters": {"bucketName": f"synthetic-bucket-{i % max(self.buckets, 1):06d}"} if source == "s3.amazonaws.com" else None,
+            "responseElements": None,
+            "requestID": f"{i:032x}",
+            "eventID": f"00000000-0000-0000-0000-{i:012d}",
+            "readOnly": name.startswith(("Get", "List", "Describe")),
+            "eventType": "AwsApiCall",
+            "managementEvent": True,
+            "recipientAccountId": ACCOUNT,
+        }
+
+    def write_trail(self, folder, region):
+        """Write the synthetic trail in a folder, as CloudTrail delivers it to its bucket : gzipped files of records under AWSLogs/ACCOUNT/CloudTrail/REGION/YYYY/MM/DD/.
+
+        Parameters
+        ----------
+        folder : str
+            Folder of the bucket of the trail
+        region : str
+            Region of the records
+
+        Returns
+        -------
+        files : int
+            Number of files written
+        """
+        files = 0
+
+        for start in range(0, self.events, TRAIL_FILE_RECORDS):
+            records = [self.trail_record(i, region) for i in range(start, min(start + TRAIL_FILE_RECORDS, self.events))]
+            time = datetime.datetime.strptime(records[0]["eventTime"], "%Y-%m-%dT%H:%M:%SZ")
+
+            path = os.path.join(folder, "AWSLogs", ACCOUNT, "CloudTrail", region, time.strftime("%Y"), time.strftime("%m"), time.strftime("%d"))
+            os.makedirs(path, exist_ok=True)
+            name = f"{ACCOUNT}_CloudTrail_{region}_{time.strftime('%Y%m%dT%H%M%SZ')}_{files:016d}.json.gz"
+            with gzip.open(os.path.join(path, name), "wt") as f:
+                f.write(dumps({"Records": records}))
+            files += 1
+
+        return files
+
+    def empty_response(self, model):
+        """Return a response with an empty list or map for each list or map of the output of the operation.
+
+        Parameters
+        ----------
+        model : OperationModel
+            Model of the operation
+
+        Returns
+        -------
+        response : dict
+            Empty response
+        """
+        response = {}
+        if model.output_shape is None:
+            return response
+
+        for name, shape in model.output_shape.members.items():
+            if shape.type_name == "list":
+                response[name] = []
+            elif shape.type_name == "map":
+                response[name] = {}
+        return response
+
+    def response(self, service, model, params, region):
+        """Return the response of a call.
+
+        Parameters
+        ----------
+        service : str
+            Name of the service
+        model : OperationModel
+            Model of the operation
+        params : dict
+            Parameters of the call
+        region : str
+            Region of the client
+
+        Returns
+        -------
+        response : dict
+            Response of the call
+        """
+        if service == "sts" and model.name == "GetCallerIdentity":
+            return {"Account": ACCOUNT, "Arn": f"arn:aws:iam::{ACCOUNT}:user/benchmark", "UserId": "AIDABENCHMARK"}
+
+        response = self.empty_response(model)
+        if (service, model.name) not in self.pages:
+            return response
+
+        array, input_token, output_token, element, count = self.pages[(service, model.name)]
+        total = count()
+
+        if input_token is None:
+            start, end = 0, total
+        else:
+            start = int(params.get(input_token) or 0)
+            end = min(start + self.page_size, total)
+            if end < total:
+                response[output_token] = str(end)
+            if output_token == "Marker":
+                response["IsTruncated"] = end < total
+
+        response[array] = [element(i, region) for i in range(start, end)]
+        return response
+
+    def throttled(self):
+        """Draw if an attempt is throttled.
+
+        Returns
+        -------
+        throttled : bool
+            True if the attempt is throttled
+        """
+        with self.lock:
+            return self.random.random() < self.throttle_rate
+
+    def register(self, client):
+        """Answer every call of a client with the synthetic account, without any network access.
+
+        Parameters
+        ----------
+        client : object
+            Boto3 client
+        """
+        service = client.meta.service_model.service_name
+        region = client.meta.region_name or "global"
+        limiter_region = client.meta.region_name
+
+        # before-call receives the serialized request, the parameters of the call are kept before
+        def keep_params(params, model, context, **kwargs):
+            context["synthetic_params"] = dict(params)
+
+        def outcome(model, context):
+            '''
+            The throttled attempts are retried here, as the answer skips the retries of botocore.
+            Each one lowers the rate of the operation in the rate limiter and is counted as the instrumentation would, as a throttled attempt sent to AWS.
+            '''
+            attempts = 0
+            while self.throttled():
+                record_throttle((region, service, model.name))
+                record_throttled((service, limiter_region, model.name))
+                attempts += 1
+                if attempts == MAX_ATTEMPTS:
+                    error = {"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}, "ResponseMetadata": {"HTTPStatusCode": 400, "RetryAttempts": attempts}}
+                    return attempts, (AWSResponse(None, 400, {}, None), error)
+
+            response = self.response(service, model, context.get("synthetic_params", {}), region)
+            response["ResponseMetadata"] = {"HTTPStatusCode": 200, "RetryAttempts": attempts}
+            size = len(dumps(response, default=str))
+            return attempts, (AWSResponse(None, 200, {"content-length": str(size)}, None), response)
+
+        # each attempt waits for the latency
+        def answer(model, context, **kwargs):
+            attempts, result = outcome(model, context)
+            if self.latency:
+                sleep(self.latency * (attempts + 1))
+            return result
+
+        # the clients of the async engine await their handlers, the latency must not block their loop
+        async def answer_async(model, context, **kwargs):
+            attempts, result = outcome(model, context)
+            if self.latency:
+                await asyncio.sleep(self.latency * (attempts + 1))
+            return result
+
+        client.meta.events.register("before-parameter-build", keep_params)
+        # first, so the call is answered before being signed and sent
+        client.meta.events.register_first("before-call", answer_async if asyncio.iscoroutinefunction(client._make_api_call) else answer)
@@ -0,0 +1,229 @@
+"""File containing the rate limiters and the counters of the AWS calls."""
+
+import threading
+from time import sleep, monotonic
+
+
+THROTTLING_ERRORS = [
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestThrottledException",
+    "TooManyRequestsException",
+    "ProvisionedThroughputExceededException",
+    "TransactionInProgressException",
+    "RequestLimitExceeded",
+    "BandwidthLimitExceeded",
+    "LimitExceededException",
+    "RequestThrottled",
+    "SlowDown",
+    "PriorRequestNotComplete",
+    "EC2ThrottledException",
+]
+
+'''
+The calls of an operation are not limited until it is throttled : its rate is then set to half of the calls of the last second, halved again on each throttle and raised after each successful call.
+The throttles of the calls in flight when the rate is lowered are answers to the same burst, the rate is lowered at most once per COOLDOWN seconds.
+Once back to MAX_RATE, the operation is not limited anymore.
+'''
+MIN_RATE = 0.5
+MAX_RATE = 200.0
+COOLDOWN = 1.0
+
+
+class TokenBucket:
+
+    rate = None
+    tokens = None
+    last = None
+    second = None
+    calls = None
+    lowered = None
+    lock = None
+
+    def __init__(self, rate=None):
+        """Handle the constructor of the TokenBucket class.
+
+        Parameters
+        ----------
+        rate : float, optional
+            Number of calls allowed per second. Not limited if None
+        """
+        self.rate = rate
+        self.tokens = 1.0
+        self.last = monotonic()
+        # calls of the last second, counted while the bucket isn't limited
+        self.second = self.last
+        self.calls = [0, 0]
+        self.lowered = None
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take a call from the bucket if one is allowed, without waiting.
+
+        Returns
+        -------
+        wait : float
+            0 if the call is allowed. Time to wait before trying again otherwise, in seconds
+        """
+        with self.lock:
+            now = monotonic()
+
+            if self.rate is None:
+                if now - self.second >= 1:
+                    self.calls = [self.calls[1] if now - self.second < 2 else 0, 0]
+                    self.second = now
+                self.calls[1] += 1
+                return 0
+
+            # the bucket holds one call at least, or a rate below 1 call per second would never allow any
+            self.tokens = min(max(self.rate, 1), self.tokens + (now - self.last) * self.rate)
+            self.last = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Wait until a call is allowed by the bucket."""
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return
+            sleep(wait)
+
+    def throttled(self):
+        """Halve the rate of the bucket after a throttling error, the first one limiting it to half of the calls of the last second."""
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.tokens, 0)
+
+            if self.lowered is not None and now - self.lowered < COOLDOWN:
+                return
+            self.lowered = now
+
+            if self.rate is None:
+                self.rate = max(MIN_RATE, min(MAX_RATE, max(self.calls)) / 2)
+                self.last = now
+            else:
+                self.rate = max(MIN_RATE, self.rate / 2)
+
+    def succeeded(self):
+        """Increase the rate of the bucket after a successful call, by 1% and 0.1 call per second so a low rate doesn't take long to rise. The bucket isn't limited anymore once back to MAX_RATE."""
+        with self.lock:
+            if self.rate is not None:
+                self.rate = self.rate * 1.01 + 0.1
+                if self.rate >= MAX_RATE:
+                    self.rate = None
+                    self.second = monotonic()
+                    self.calls = [0, 0]
+
+
+BUCKETS = {}
+STATS = {}
+LOCK = threading.Lock()
+
+def get_bucket(key):
+    """Return the token bucket of an operation, creating it if needed.
+
+    Parameters
+    ----------
+    key : tuple of str
+        Service, region and operation
+
+    Returns
+    -------
+    bucket : TokenBucket
+        Token bucket of the operation
+    """
+    with LOCK:
+        if key not in BUCKETS:
+            BUCKETS[key] = TokenBucket()
+        return BUCKETS[key]
+
+def count(key, counter):
+    """Increment a counter of an operation.
+
+    Parameters
+    ----------
+    key : tuple of str
+        Service, region and operation
+    counter : str
+        Name of the counter (calls, throttles, errors)
+    """
+    with LOCK:
+        if key not in STATS:
+            STATS[key] = {"calls": 0, "throttles": 0, "errors": 0}
+        STATS[key][counter] += 1
+
+def record_throttled(key):
+    """Lower the rate of an operation after a throttled attempt and count it.
+    Called for each throttled attempt of the calls retried by botocore, and by the hooks answering the calls themselves (synthetic account), whose attempts botocore doesn't see.
+
+    Parameters
+    ----------
+    key : tuple of str
+        Service, region and operation
+    """
+    get_bucket(key).throttled()
+    count(key, "throttles")
+
+def register_rate_limiter(client, blocking=True):
+    """Register the rate limiter and the counters on every call made by a client.
+
+    Parameters
+    ----------
+    client : object
+        Boto3 client
+    blocking : bool, optional
+        False if the calls only have to be counted, the caller waiting for the token bucket itself (async engine)
+    """
+    service = client.meta.service_model.service_name
+    region = client.meta.region_name
+
+    # before-parameter-build is used instead of before-call, as a handler of before-call can answer the call by itself (synthetic account, replay) and skip the others
+    def before_call(model, **kwargs):
+        key = (service, region, model.name)
+        if blocking:
+            get_bucket(key).acquire()
+        count(key, "calls")
+
+    def needs_retry(response, operation, **kwargs):
+        # called after every attempt sent to AWS, botocore's own retry handler decides if the call is retried
+        if response is not None and response[1].get("Error", {}).get("Code") in THROTTLING_ERRORS:
+            record_throttled((service, region, operation.name))
+        return None
+
+    def after_call(parsed, model, **kwargs):
+        # called once per call, also for the calls answered by a hook before being sent
+        key = (service, region, model.name)
+        code = parsed.get("Error", {}).get("Code")
+
+        if not code:
+            get_bucket(key).succeeded()
+        elif code not in THROTTLING_ERRORS:
+            count(key, "errors")
+
+    client.meta.events.register("before-parameter-build", before_call)
+    client.meta.events.register("needs-retry", needs_retry)
+    client.meta.events.register("after-call", after_call)
+
+def display_stats():
+    """Display the number of calls, throttles and errors of the run, and the most throttled operations."""
+    with LOCK:
+        stats = dict(STATS)
+
+    if not stats:
+        return
+
+    calls = sum(el["calls"] for el in stats.values())
+    throttles = sum(el["throttles"] for el in stats.values())
+    errors = sum(el["errors"] for el in stats.values())
+    print(f"[+] AWS calls : {calls}, throttled : {throttles}, errors : {errors}")
+
+    throttled = sorted((el for el in stats.items() if el[1]["throttles"]), key=lambda el: el[1]["throttles"], reverse=True)
+    for (service, region, operation), el in throttled[:5]:
+        rate = get_bucket((service, region, operation)).rate
+        print(f"\t\u2022 {service} {operation} ({region}) : {el['throttles']} throttles, " + (f"rate lowered to {rate:.1f} calls/s" if rate else "rate back to unlimited"))
@@ -1,12 +1,20 @@
 """File containing all types of functions and variables, used everywhere in the tool."""
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
-import datetime, os
+import datetime, os, threading
 from sys import exit
 from random import choices
 from string import ascii_lowercase, digits
-from json import dumps
+from json import dumps, loads
+from source.utils.journal import Journal
+from source.utils.cache import ResultCache
+from source.utils.throttle import register_rate_limiter
+from source.utils.instrument import register_instrumentation
+from source.utils.metrics import record_transfer
+from source.utils.replay import ResponseStore
+from source.utils.localathena import LocalAthena
 
 
 def get_random_chars(n):
@@ -74,7 +82,7 @@ def fix_json(response):
     return response
 
 def try_except(func, *args, **kwargs):
-    """Try except function.
+    """Try except function. The throttled attempts were already retried by botocore.
 
     Parameters
     ----------
@@ -96,6 +104,28 @@ def try_except(func, *args, **kwargs):
         ret = {"count": 0, "error": str(e)}
     return ret
 
+def create_client(service, region=None):
+    """Create a client using the retries, the rate limiter and the instrumentation of the tool.
+
+    Parameters
+    ----------
+    service : str
+        Name of the service
+    region : str, optional
+        Region of the client
+
+    Returns
+    -------
+    client : object
+        Boto3 client
+    """
+    client = boto3.client(service, region_name=region, config=CLIENT_CONFIG)
+    register_rate_limiter(client)
+    register_instrumentation(client)
+    for hook in CLIENT_HOOKS:
+        hook(client)
+    return client
+
 def create_command(command, output):
     """Merge the command and its results.
 
@@ -116,6 +146,23 @@ def create_command(command, output):
     command_output["output"] = output
     return command_output
 
+def get_account_id():
+    """Return the id of the account the tool is run in.
+
+    Returns
+    -------
+    account : str
+        Id of the account
+    """
+    global ACCOUNT_ID
+
+    # the services can be collected at the same time (--schedule graph), the first one asks for the id
+    with ACCOUNT_LOCK:
+        if ACCOUNT_ID is None:
+            response = create_client("sts").get_caller_identity()
+            ACCOUNT_ID = response["Account"]
+    return ACCOUNT_ID
+
 def writefile_s3(bucket, key, filename):
     """Write a local file to a s3 bucket.
 
@@ -133,7 +180,7 @@ def writefile_s3(bucket, key, filename):
     response : dict
         Response of the request made
     """
-    response = S3_CLIENT.meta.client.upload_file(filename, bucket, key)
+    response = S3_CLIENT.upload_file(filename, bucket, key)
     return response
 
 def create_s3_if_not_exists(region, bucket_name):
@@ -154,7 +201,7 @@ def create_s3_if_not_exists(region, bucket_name):
     Note that for region=us-east-1, AWS necessitates that you leave LocationConstraint blank
     https://docs.aws.amazon.com/AmazonS3/latest/API/API_CreateBucket.html#API_CreateBucket_RequestBody
     """
-    s3 = boto3.client("s3", region_name=region)
+    s3 = create_client("s3", region)
     response = s3.list_buckets()
 
     for bkt in response["Buckets"]:
@@ -199,6 +246,151 @@ def create_folder(path):
     """
     os.makedirs(path, exist_ok=True)
 
+def load_manifest(destination):
+    """Load the manifest of the objects already transferred to a destination by a previous run.
+
+    Parameters
+    ----------
+    destination : str
+        Name of the transfer, the same from one run to the next : local folder where the objects are downloaded, or account, region, service and source of a copy
+
+    Returns
+    -------
+    manifest : dict
+        Size and ETag of the source object of each transferred key
+    """
+    file = MANIFESTS_FOLDER + destination.strip("./").replace("/", "_") + ".json"
+    if not os.path.isfile(file):
+        return {}
+
+    with open(file, "rt") as f:
+        return loads(f.read())
+
+def save_manifest(destination, manifest):
+    """Save the manifest of the objects transferred to a destination.
+
+    Parameters
+    ----------
+    destination : str
+        Name of the transfer, the same from one run to the next : local folder where the objects are downloaded, or account, region, service and source of a copy
+    manifest : dict
+        Size and ETag of the source object of each transferred key
+    """
+    create_folder(MANIFESTS_FOLDER)
+    file = MANIFESTS_FOLDER + destination.strip("./").replace("/", "_") + ".json"
+    write_file(file, "w", dumps(manifest))
+
+def save_snapshot(region, services):
+    """Save the enumeration results of a region so later runs of the steps 2 and 3 can reuse them.
+
+    Parameters
+    ----------
+    region : str
+        Region where the services were enumerated
+    services : dict
+        Results of the enumeration (count, elements and ids of each service)
+    """
+    folder = f"{SNAPSHOTS_FOLDER}{get_account_id()}/"
+    create_folder(folder)
+
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "time": datetime.datetime.now(datetime.timezone.utc).timestamp(),
+        "region": region,
+        "services": {name: service for name, service in services.items() if service["count"] != -1},
+    }
+    write_file(f"{folder}{region}.json", "w", dumps(snapshot, default=str))
+
+def load_snapshot(region):
+    """Load the enumeration results of a region saved by a previous run, if they are younger than the maximum age.
+
+    Parameters
+    ----------
+    region : str
+        Region where the services were enumerated
+
+    Returns
+    -------
+    services : dict
+        Results of the enumeration. Empty if there is no valid snapshot
+    """
+    if not SNAPSHOT_MAX_AGE:
+        return {}
+
+    file = f"{SNAPSHOTS_FOLDER}{get_account_id()}/{region}.json"
+    if not os.path.isfile(file):
+        return {}
+
+    try:
+        with open(file, "rt") as f:
+            snapshot = loads(f.read())
+    except ValueError:
+        return {}
+
+    age = datetime.datetime.now(datetime.timezone.utc).timestamp() - snapshot.get("time", 0)
+    if snapshot.get("version") != SNAPSHOT_VERSION or age > SNAPSHOT_MAX_AGE * 60:
+        return {}
+
+    return snapshot["services"]
+
+def list_s3_objects(bucket, prefix):
+    """Return the size and ETag of every object of a bucket under the given prefix.
+
+    Parameters
+    ----------
+    bucket : str
+        Bucket to list
+    prefix : str
+        Path in the bucket
+
+    Returns
+    -------
+    objects : dict
+        Size and ETag of each key
+    """
+    objects = {}
+    paginator = S3_CLIENT.get_paginator('list_objects_v2')
+
+    try:
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for s3_object in page.get('Contents', []):
+                objects[s3_object['Key']] = {"Size": s3_object['Size'], "ETag": s3_object['ETag']}
+    except Exception as e:
+        print(f"[!] Error : {str(e)}")
+
+    return objects
+
+def to_transfer(s3_object, destination, recorded):
+    """Verify if an object has to be transferred, depending on the incremental mode and the --since cut-off.
+
+    Parameters
+    ----------
+    s3_object : dict
+        Source object, as listed by list_objects_v2
+    destination : dict
+        Size and ETag of the object already present at the destination. None if there is none
+    recorded : dict
+        Size and ETag of the source object when it was last transferred. None if it never was
+
+    Returns
+    -------
+    transfer : bool
+        True if the object is new or changed
+    """
+    if SINCE and s3_object['LastModified'] < SINCE:
+        return False
+
+    if not INCREMENTAL:
+        return True
+
+    current = {"Size": s3_object['Size'], "ETag": s3_object['ETag']}
+
+    if recorded == current:
+        # a local copy has no ETag, but it has to still be there with the same size
+        return destination is None or destination["Size"] != current["Size"]
+
+    return destination != current
+
 def run_s3_dl(bucket, path, prefix=""):
     """Handle the steps of the content's download of a s3 bucket.
     
@@ -214,17 +406,52 @@ def run_s3_dl(bucket, path, prefix=""):
     paginator = S3_CLIENT.get_paginator('list_objects_v2')
     operation_parameters = {"Bucket": bucket, "Prefix": prefix}
 
+    transfer = f"dl|{bucket}|{prefix}|{path}"
+    if JOURNAL and JOURNAL.last_key(transfer):
+        operation_parameters["StartAfter"] = JOURNAL.last_key(transfer)
+
+    manifest = load_manifest(path) if INCREMENTAL else {}
+
+    # the journal only moves past the objects transferred, a failed object and the ones after it are transferred again by --resume
+    failed = False
+
     for page in paginator.paginate(**operation_parameters):
         if 'Contents' in page:
+            objects, size = 0, 0
+            last_key = None
             for s3_object in page['Contents']:
                 s3_key = s3_object['Key']
                 local_path = os.path.join(path, s3_key)
 
-                local_directory = os.path.dirname(local_path)
-                create_folder(local_directory)
+                local = None
+                if os.path.isfile(local_path):
+                    local = {"Size": os.path.getsize(local_path), "ETag": None}
+
+                if local_path.endswith("/"):
+                    create_folder(local_path)
+                elif to_transfer(s3_object, local, manifest.get(local_path)):
+                    local_directory = os.path.dirname(local_path)
+                    create_folder(local_directory)
+
+                    response = try_except(S3_CLIENT.download_file, bucket, s3_key, local_path)
+                    if isinstance(response, dict) and "error" in response:
+                        print(f"[!] Error : {s3_key} : {response['error']}")
+                        failed = True
+                        continue
 
-                if not local_path.endswith("/"): 
-                    S3_CLIENT.download_file(bucket, s3_key, local_path)
+                    manifest[local_path] = {"Size": s3_object['Size'], "ETag": s3_object['ETag']}
+                    objects += 1
+                    size += s3_object['Size']
+
+                if not failed:
+                    last_key = s3_key
+
+            record_transfer("download", bucket, prefix, objects, size)
+
+            if INCREMENTAL:
+                save_manifest(path, manifest)
+            if JOURNAL and last_key:
+                JOURNAL.mark_batch(transfer, last_key)
 
 def write_s3(bucket, key, content):
     """Write content to s3 bucket.
@@ -246,6 +473,24 @@ def write_s3(bucket, key, content):
     response = S3_CLIENT.put_object(Bucket=bucket, Key=key, Body=content)
     return response
 
+def read_s3(bucket, key):
+    """Read the content of an object of a s3 bucket.
+
+    Parameters
+    ----------
+    bucket : str
+        Name of the bucket
+    key : str
+        Path in the bucket
+
+    Returns
+    -------
+    content : str
+        Content of the object
+    """
+    response = S3_CLIENT.get_object(Bucket=bucket, Key=key)
+    return response["Body"].read().decode()
+
 def copy_s3_bucket(src_bucket, dst_bucket, service, region, prefix=""):
     """Copy the content at a specific path of a s3 bucket to another.
 
@@ -262,17 +507,56 @@ def copy_s3_bucket(src_bucket, dst_bucket, service, region, prefix=""):
     prefix : str, optional
         Path of the data to copy to reduce the amount of data
     """
-    s3res = boto3.resource("s3")
-
     paginator = S3_CLIENT.get_paginator('list_objects_v2')
     operation_parameters = {"Bucket": src_bucket, "Prefix": prefix}
 
+    # each page of objects is a batch, the journal keeps the last key of the last batch copied
+    transfer = f"copy|{src_bucket}|{prefix}|{dst_bucket}|{region}/{service}"
+    if JOURNAL and JOURNAL.last_key(transfer):
+        operation_parameters["StartAfter"] = JOURNAL.last_key(transfer)
+
+    '''
+    The logs bucket gets a new name on each run, so the manifest is kept by account, region, service and source rather than by destination.
+    An object recorded by the manifest was copied to the bucket of a previous run, it is only copied again if it changed.
+    '''
+    manifest = {}
+    existing = {}
+    destination = f"{get_account_id()}/{region}/{service}/{src_bucket}/{prefix}"
+    if INCREMENTAL:
+        manifest = load_manifest(destination)
+        existing = list_s3_objects(dst_bucket, f"{region}/logs/{service}/{src_bucket}/{prefix}")
+
+    # the journal only moves past the objects copied, a failed copy and the ones after it are copied again by --resume
+    failed = False
+
     for page in paginator.paginate(**operation_parameters):
         if 'Contents' in page:
+            objects, size = 0, 0
+            last_key = None
             for key in page['Contents']:
-                copy_source = {"Bucket": src_bucket, "Key": key["Key"]}
                 new_key = f"{region}/logs/{service}/{src_bucket}/{key['Key']}"
-                try_except(s3res.meta.client.copy, copy_source, dst_bucket, new_key)
+
+                if to_transfer(key, existing.get(new_key, manifest.get(new_key)), manifest.get(new_key)):
+                    copy_source = {"Bucket": src_bucket, "Key": key["Key"]}
+                    response = try_except(S3_CLIENT.copy, copy_source, dst_bucket, new_key)
+                    if isinstance(response, dict) and "error" in response:
+                        print(f"[!] Error : {key['Key']} : {response['error']}")
+                        failed = True
+                        continue
+
+                    manifest[new_key] = {"Size": key['Size'], "ETag": key['ETag']}
+                    objects += 1
+                    size += key['Size']
+
+                if not failed:
+                    last_key = key['Key']
+
+            record_transfer("copy", src_bucket, prefix, objects, size)
+
+            if INCREMENTAL:
+                save_manifest(destination, manifest)
+            if JOURNAL and last_key:
+                JOURNAL.mark_batch(transfer, last_key)
 
 def copy_or_write_s3(key, value, dst_bucket, region):
     """Depending on the action content of value (0 or 1), write the data to our s3 bucket, or copy the data to the source bucket to our bucket.
@@ -352,7 +636,7 @@ def athena_query(region, query, bucket):
     response : dict
         Results of the response
     """
-    athena = boto3.client("athena", region_name=region)
+    athena = create_client("athena", region)
 
     result = athena.start_query_execution(
         QueryString=query,
@@ -459,7 +743,7 @@ def create_tmp_bucket(region, bucket_name):
     Note that for region=us-east-1, AWS necessitates that you leave LocationConstraint blank
     https://docs.aws.amazon.com/AmazonS3/latest/API/API_CreateBucket.html#API_CreateBucket_RequestBody
     """
-    s3 = boto3.client("s3", region_name=region)
+    s3 = create_client("s3", region)
 
     bucket_config = dict()
     if region != "us-east-1":
@@ -480,12 +764,19 @@ date = datetime.date.today().strftime("%Y-%m-%d")
 random_chars = get_random_chars(5)
 PREPARATION_BUCKET = "invictus-aws-" + date + "-" + random_chars
 LOGS_BUCKET = "invictus-aws-" + date + "-" + random_chars
+RUN_ID = date + "-" + random_chars
 
 #########
 # FILES #
 #########
 
-ROOT_FOLDER = "./results/"
+# In organization mode, each account is acquired by its own process writing in its own folder
+ROOT_FOLDER = os.environ.get("INVICTUS_AWS_RESULTS", "./results/")
+RUNS_FOLDER = ROOT_FOLDER + "runs/"
+MANIFESTS_FOLDER = ROOT_FOLDER + "manifests/"
+CACHE_FOLDER = ROOT_FOLDER + "cache/"
+SNAPSHOTS_FOLDER = ROOT_FOLDER + "snapshots/"
+REPORTS_FOLDER = ROOT_FOLDER + "reports/"
 
 ##########
 # COLORS #
@@ -502,12 +793,18 @@ UNDERLINE = '\033[4m'
 # CLIENTS #
 ###########
 
-ACCOUNT_CLIENT = boto3.client('account')
-S3_CLIENT = boto3.client("s3")
-CLOUDWATCH_CLIENT = boto3.client("cloudwatch")
-CLOUDTRAIL_CLIENT = boto3.client("cloudtrail")
-ROUTE53_CLIENT = boto3.client("route53")
-IAM_CLIENT = boto3.client("iam")
+# botocore standard retries : throttled attempts are retried with backoff, the rate limiter of the tool slowing the next calls down
+CLIENT_CONFIG = Config(retries={"mode": "standard", "max_attempts": 10})
+
+# Functions called on each new client (benchmark, record and replay of the responses)
+CLIENT_HOOKS = []
+
+ACCOUNT_CLIENT = create_client("account")
+S3_CLIENT = create_client("s3")
+CLOUDWATCH_CLIENT = create_client("cloudwatch")
+CLOUDTRAIL_CLIENT = create_client("cloudtrail")
+ROUTE53_CLIENT = create_client("route53")
+IAM_CLIENT = create_client("iam")
 GUARDDUTY_CLIENT = None
 WAF_CLIENT = None
 LAMBDA_CLIENT = None
@@ -552,23 +849,415 @@ def set_clients(region):
     global SSM_CLIENT
     global ATHENA_CLIENT
 
-    WAF_CLIENT = boto3.client("wafv2", region_name=region)
-    LAMBDA_CLIENT = boto3.client("lambda", region_name=region)
-    EC2_CLIENT = boto3.client("ec2", region_name=region)
-    EB_CLIENT = boto3.client("elasticbeanstalk", region_name=region)
-    ROUTE53_RESOLVER_CLIENT = boto3.client("route53resolver", region_name=region)
-    DYNAMODB_CLIENT = boto3.client("dynamodb", region_name=region)
-    RDS_CLIENT = boto3.client("rds", region_name=region)
-    EKS_CLIENT = boto3.client("eks", region_name=region)
-    ELS_CLIENT = boto3.client("es", region_name=region)
-    SECRETS_CLIENT = boto3.client("secretsmanager", region_name=region)
-    KINESIS_CLIENT = boto3.client("kinesis", region_name=region)
-    GUARDDUTY_CLIENT = boto3.client("guardduty", region_name=region)
-    INSPECTOR_CLIENT = boto3.client("inspector2", region_name=region)
-    DETECTIVE_CLIENT = boto3.client("detective", region_name=region)
-    MACIE_CLIENT = boto3.client("macie2", region_name=region)
-    SSM_CLIENT = boto3.client("ssm", region_name=region)
-    ATHENA_CLIENT = boto3.client("athena", region_name=region)
+    WAF_CLIENT = create_client("wafv2", region)
+    LAMBDA_CLIENT = create_client("lambda", region)
+    EC2_CLIENT = create_client("ec2", region)
+    EB_CLIENT = create_client("elasticbeanstalk", region)
+    ROUTE53_RESOLVER_CLIENT = create_client("route53resolver", region)
+    DYNAMODB_CLIENT = create_client("dynamodb", region)
+    RDS_CLIENT = create_client("rds", region)
+    EKS_CLIENT = create_client("eks", region)
+    ELS_CLIENT = create_client("es", region)
+    SECRETS_CLIENT = create_client("secretsmanager", region)
+    KINESIS_CLIENT = create_client("kinesis", region)
+    GUARDDUTY_CLIENT = create_client("guardduty", region)
+    INSPECTOR_CLIENT = create_client("inspector2", region)
+    DETECTIVE_CLIENT = create_client("detective", region)
+    MACIE_CLIENT = create_client("macie2", region)
+    SSM_CLIENT = create_client("ssm", region)
+    ATHENA_CLIENT = create_client("athena", region)
+
+def add_client_hook(hook):
+    """Call a function on every client, the existing ones and the ones created later.
+
+    Parameters
+    ----------
+    hook : function
+        Function called with the client
+    """
+    CLIENT_HOOKS.append(hook)
+
+    for name, value in list(globals().items()):
+        if name.endswith("_CLIENT") and value is not None:
+            hook(value)
+
+#########
+# CACHE #
+#########
+
+'''
+The results of the global lookups are cached for the account, so each one is done once per run whatever the steps and regions.
+With --cache-ttl, they are also kept on the disk and reused by the next runs while they are younger than the ttl.
+'''
+ACCOUNT_ID = None
+ACCOUNT_LOCK = threading.Lock()
+CACHE = ResultCache()
+
+def set_cache(ttl):
+    """Set where the results of the global lookups are cached.
+
+    Parameters
+    ----------
+    ttl : int
+        Number of seconds a result kept on the disk can be reused. Results are only kept in memory if None
+    """
+    global CACHE
+
+    if ttl:
+        CACHE = ResultCache(CACHE_FOLDER, ttl)
+    else:
+        CACHE = ResultCache()
+
+def cached(key, func, *args, **kwargs):
+    """Return the result of a global lookup of the account, calling it only if it is not cached.
+
+    Parameters
+    ----------
+    key : str
+        Name of the result
+    func : function
+        Lookup called if the result is not cached
+    *args : list, optional
+        Arguments of the lookup
+    **kwargs : list, optional
+        Key pairs arguments of the lookup
+
+    Returns
+    -------
+    value : object
+        Result of the lookup
+    """
+    return CACHE.get(get_account_id(), key, func, *args, **kwargs)
+
+##########
+# CENSUS #
+##########
+
+'''
+Cheap calls used to know if a region holds resources, on top of the resources listed by the tagging api.
+Only the first (small) page of each call is requested : the goal is to know if the region is empty, not to enumerate it.
+'''
+CENSUS_PROBES = [
+    {"service": "ec2", "command": "describe_instances", "array": "Reservations", "parameters": {"MaxResults": 5}},
+    {"service": "ec2", "command": "describe_vpcs", "array": "Vpcs", "parameters": {"Filters": [{"Name": "is-default", "Values": ["false"]}], "MaxResults": 5}},
+    {"service": "ec2", "command": "describe_volumes", "array": "Volumes", "parameters": {"MaxResults": 5}},
+    {"service": "lambda", "command": "list_functions", "array": "Functions", "parameters": {"MaxItems": 1}},
+    {"service": "rds", "command": "describe_db_instances", "array": "DBInstances", "parameters": {"MaxRecords": 20}},
+    {"service": "dynamodb", "command": "list_tables", "array": "TableNames", "parameters": {"Limit": 1}},
+    {"service": "elasticbeanstalk", "command": "describe_environments", "array": "Environments", "parameters": {"MaxRecords": 1}},
+    {"service": "eks", "command": "list_clusters", "array": "clusters", "parameters": {"maxResults": 1}},
+    {"service": "guardduty", "command": "list_detectors", "array": "DetectorIds", "parameters": {"MaxResults": 1}},
+    {"service": "wafv2", "command": "list_web_acls", "array": "WebACLs", "parameters": {"Scope": "REGIONAL", "Limit": 1}},
+]
+
+#####################
+# ENUMERATION CACHE #
+#####################
+
+# Version of the format of the enumeration snapshots, older snapshots are ignored
+SNAPSHOT_VERSION = 1
+
+# Maximum age (in minutes) of a snapshot reused by the steps 2 and 3. 0 never reuses them
+SNAPSHOT_MAX_AGE = 60
+
+def set_snapshot_max_age(max_age):
+    """Set the maximum age of the enumeration snapshots reused by the steps 2 and 3.
+
+    Parameters
+    ----------
+    max_age : int
+        Maximum age in minutes. 0 never reuses them
+    """
+    global SNAPSHOT_MAX_AGE
+    SNAPSHOT_MAX_AGE = max_age
+
+#####################
+# RECORD AND REPLAY #
+#####################
+
+'''
+With --record, every response of AWS is kept in a folder. With --replay, the calls are answered from this folder, without any network access.
+'''
+STORE = None
+
+def set_store(record=None, replay=None):
+    """Record the responses of AWS in a folder, or replay the responses recorded in a folder.
+
+    Parameters
+    ----------
+    record : str, optional
+        Folder where the responses are recorded
+    replay : str, optional
+        Folder of the responses replayed
+    """
+    global STORE
+    global PREPARATION_BUCKET
+    global LOGS_BUCKET
+
+    if record:
+        STORE = ResponseStore(record)
+        STORE.save_run({"preparation": PREPARATION_BUCKET, "logs": LOGS_BUCKET})
+        add_client_hook(STORE.record)
+
+    elif replay:
+        STORE = ResponseStore(replay, True)
+        buckets = STORE.load_run()
+
+        # the recorded calls to the buckets of the tool are only found with the same bucket names
+        PREPARATION_BUCKET = buckets.get("preparation", PREPARATION_BUCKET)
+        LOGS_BUCKET = buckets.get("logs", LOGS_BUCKET)
+        add_client_hook(STORE.replay)
+
+################
+# LOCAL ATHENA #
+################
+
+'''
+With --local-athena, the calls to Athena and S3 of the analysis are answered by a local stand-in, the queries running on sqlite over buckets kept in a folder.
+'''
+LOCAL_ATHENA = None
+
+def set_local_athena(folder, concurrency=20, latency=0):
+    """Answer the calls to Athena and S3 with the local stand-in.
+
+    Parameters
+    ----------
+    folder : str
+        Folder of the stand-in : buckets in folder/s3, databases and tables in folder/athena
+    concurrency : int, optional
+        Number of queries run at the same time
+    latency : float, optional
+        Minimum duration of a query, in seconds
+
+    Returns
+    -------
+    athena : LocalAthena
+        Local stand-in
+    """
+    global LOCAL_ATHENA
+
+    if folder:
+        LOCAL_ATHENA = LocalAthena(folder, concurrency, latency)
+        add_client_hook(LOCAL_ATHENA.register)
+
+    return LOCAL_ATHENA
+
+###########
+# JOURNAL #
+###########
+
+JOURNAL = None
+
+def set_journal(run_id=None):
+    """Open the journal of the run. If a run id is given, the journal of this previous run is loaded so the run can be resumed.
+
+    Parameters
+    ----------
+    run_id : str, optional
+        Id of the interrupted run to resume
+
+    Returns
+    -------
+    run_id : str
+        Id of the run
+    """
+    global JOURNAL
+    global RUN_ID
+    global PREPARATION_BUCKET
+    global LOGS_BUCKET
+
+    if run_id:
+        RUN_ID = run_id
+
+    JOURNAL = Journal(RUNS_FOLDER, RUN_ID, run_id is not None)
+    JOURNAL.start({"preparation": PREPARATION_BUCKET, "logs": LOGS_BUCKET})
+
+    # a resumed run keeps writing in the buckets of the interrupted one
+    PREPARATION_BUCKET = JOURNAL.buckets["preparation"]
+    LOGS_BUCKET = JOURNAL.buckets["logs"]
+
+    return RUN_ID
+
+####################
+# INCREMENTAL MODE #
+####################
+
+INCREMENTAL = False
+SINCE = None
+
+def set_incremental(incremental, since=None):
+    """Set how the logs stored in buckets are transferred.
+
+    Parameters
+    ----------
+    incremental : bool
+        True if only the objects that are new or changed since the last run have to be transferred
+    since : str, optional
+        Objects last modified before this date (YYYY-MM-DD) are not transferred
+    """
+    global INCREMENTAL
+    global SINCE
+
+    INCREMENTAL = incremental
+    if since:
+        SINCE = datetime.datetime.strptime(since, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+
+###############
+# EC2 FILTERS #
+###############
+
+EC2_TAGS = []
+EC2_SINCE = None
+
+'''
+Parameters pushed down to the EC2 describe calls of the configuration step.
+parameters : sent as is (OwnerIds=self so the public snapshots of every AWS account are not listed)
+page_size : size of the pages requested
+filters : True if the operation accepts the tag filters
+time : key of the creation time of the elements, used by the time filter (client side, the API has no time filter)
+stream : True if the results are written to the disk page by page instead of being kept in memory
+'''
+EC2_PARAMETERS = {
+    "describe_volumes": {"array": "Volumes", "page_size": 500, "filters": True, "time": "CreateTime", "stream": True},
+    "describe_subnets": {"page_size": 1000, "filters": True},
+    "describe_security_groups": {"page_size": 1000, "filters": True},
+    "describe_route_tables": {"page_size": 100, "filters": True},
+    "describe_snapshots": {"array": "Snapshots", "parameters": {"OwnerIds": ["self"]}, "page_size": 1000, "filters": True, "time": "StartTime", "stream": True},
+}
+
+def set_ec2_filters(tags, since=None):
+    """Set the filters of the EC2 describe calls.
+
+    Parameters
+    ----------
+    tags : list of str
+        Tags the EC2 resources must have, as KEY=VALUE
+    since : str, optional
+        Only the EC2 resources created after this date (YYYY-MM-DD) are kept
+    """
+    global EC2_TAGS
+    global EC2_SINCE
+
+    EC2_TAGS = []
+    for tag in tags or []:
+        key, value = tag.split("=", 1)
+        EC2_TAGS.append({"Name": f"tag:{key}", "Values": [value]})
+
+    EC2_SINCE = since
+
+def ec2_parameters(command):
+    """Return the parameters of an EC2 describe call, based on its profile and the filters.
+
+    Parameters
+    ----------
+    command : str
+        Command executed
+
+    Returns
+    -------
+    kwargs : dict
+        Parameters of the command
+    """
+    profile = EC2_PARAMETERS.get(command, {})
+
+    kwargs = dict(profile.get("parameters", {}))
+    if "page_size" in profile:
+        kwargs["PaginationConfig"] = {"PageSize": profile["page_size"]}
+    if profile.get("filters") and EC2_TAGS:
+        kwargs["Filters"] = EC2_TAGS
+
+    return kwargs
+
+def ec2_keep(command):
+    """Return the function used to filter the results of an EC2 describe call on their creation time.
+
+    Parameters
+    ----------
+    command : str
+        Command executed
+
+    Returns
+    -------
+    keep : function
+        Return True if the element has to be kept. None if nothing is filtered
+    """
+    time = EC2_PARAMETERS.get(command, {}).get("time")
+
+    if not EC2_SINCE or not time:
+        return None
+
+    # fix_json turned the datetimes into str, which compare well with YYYY-MM-DD
+    return lambda el: str(el.get(time, "")) >= EC2_SINCE
+
+####################
+# FINDINGS FILTERS #
+####################
+
+MIN_SEVERITY = None
+
+'''
+Severities of the findings, from the lowest one.
+GuardDuty uses a score (low is 1 to 3.9, medium is 4 to 6.9, high is 7 to 8.9) while Macie uses a description.
+'''
+SEVERITIES = {
+    "low": {"guardduty": 1, "macie": ["Low", "Medium", "High"]},
+    "medium": {"guardduty": 4, "macie": ["Medium", "High"]},
+    "high": {"guardduty": 7, "macie": ["High"]},
+}
+
+# Number of ids accepted by a single get_findings call
+GUARDDUTY_FINDINGS_BATCH = 50
+MACIE_FINDINGS_BATCH = 50
+
+def set_min_severity(severity):
+    """Set the lowest severity of the GuardDuty and Macie findings collected.
+
+    Parameters
+    ----------
+    severity : str
+        Lowest severity (low, medium, high). Every finding is collected if None
+    """
+    global MIN_SEVERITY
+    MIN_SEVERITY = severity
+
+def guardduty_criteria():
+    """Return the criteria of the GuardDuty list_findings call, based on the severity and the --since date.
+
+    Returns
+    -------
+    kwargs : dict
+        Parameters of the command
+    """
+    criterion = {}
+
+    # Gte is a deprecated 32 bits field, too small for a date in milliseconds : the long GreaterThanOrEqual is used instead
+    if MIN_SEVERITY:
+        criterion["severity"] = {"GreaterThanOrEqual": SEVERITIES[MIN_SEVERITY]["guardduty"]}
+    if SINCE:
+        criterion["updatedAt"] = {"GreaterThanOrEqual": int(SINCE.timestamp() * 1000)}
+
+    if not criterion:
+        return {}
+    return {"FindingCriteria": {"Criterion": criterion}}
+
+def macie_criteria():
+    """Return the criteria of the Macie list_findings call, based on the severity and the --since date.
+
+    Returns
+    -------
+    kwargs : dict
+        Parameters of the command
+    """
+    criterion = {}
+
+    if MIN_SEVERITY:
+        criterion["severity.description"] = {"eq": SEVERITIES[MIN_SEVERITY]["macie"]}
+    if SINCE:
+        criterion["updatedAt"] = {"gte": int(SINCE.timestamp() * 1000)}
+
+    if not criterion:
+        return {}
+    return {"findingCriteria": {"criterion": criterion}}
 
 ########
 # MISC #
@@ -576,6 +1265,38 @@ def set_clients(region):
 
 POSSIBLE_STEPS = ["1", "2", "3", "4"]
 
+# Seconds waited before the first poll of the elasticbeanstalk bundles, and the maximum time waited for them
+EB_POLL_DELAY = 5
+EB_BUNDLE_TIMEOUT = 900
+
+# Size of the shared pool running the per-identifier calls (get_function_configuration, describe_table, etc)
+WORKERS = 16
+
+def set_workers(workers):
+    """Set the size of the shared pool running the per-identifier calls.
+
+    Parameters
+    ----------
+    workers : int
+        Number of threads of the pool
+    """
+    global WORKERS
+    WORKERS = workers
+
+# Engine running the per-identifier calls and the paginations : "thread" (shared pool) or "async" (aiobotocore, see source/utils/engine.py)
+ENGINE = "thread"
+
+def set_engine(engine):
+    """Set the engine running the per-identifier calls and the paginations.
+
+    Parameters
+    ----------
+    engine : str
+        "thread" or "async"
+    """
+    global ENGINE
+    ENGINE = engine
+
 '''
 -1 means we didn't enter in the enumerate function associated 
 0 means we ran the associated function but the service wasn't available